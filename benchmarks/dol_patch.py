@@ -0,0 +1,105 @@
+# Times making a DOL patch straight from a patch plan and an appended section, as build_patch does,
+# against saving the whole patched DOL, and times applying the patch.  A synthetic DOL is used.
+#
+# Usage, from the repository root: PYTHONPATH=. python benchmarks/dol_patch.py [dol_megabytes] [patch_count] [runs]
+
+import os
+import random
+import statistics
+import sys
+import tempfile
+import time
+
+from dolreader.dol import DolFile
+from dolreader.section import TextSection, DataSection
+
+from dol_c_kit.patch import PatchPlan
+from dol_c_kit.dolpatch import dol_patch_records, save_dol_patch, apply_dol_patch
+
+def make_dol(filepath, size):
+    # Seven text and ten data sections of random bytes, one after another in memory and in the file
+    rng = random.Random(0)
+    dol = DolFile()
+    section_size = (size // 17) & ~0x1F
+    address = 0x80003100
+    offset = 0x100
+    for i in range(17):
+        data = rng.getrandbits(8 * section_size).to_bytes(section_size, "big")
+        if i < 7:
+            dol.textSections.append(TextSection(address, data, offset))
+        else:
+            dol.dataSections.append(DataSection(address, data, offset))
+        address += section_size
+        offset += section_size
+    dol.bssAddress = address
+    dol.bssSize = 0x10000
+    dol.entryPoint = 0x80003100
+    with open(filepath, "wb") as f:
+        dol.save(f)
+
+def patch_dol(in_dol_path, patch_count):
+    # Patches the DOL with patch_count hooks and appends a section, as build_dol would
+    with open(in_dol_path, "rb") as f:
+        dol = DolFile(f)
+    rng = random.Random(1)
+    plan = PatchPlan()
+    sections = list(dol.sections)
+    for i in range(patch_count):
+        section = rng.choice(sections)
+        plan.add(section.address + rng.randrange(0, section.size, 4), rng.getrandbits(32).to_bytes(4, "big"), "hook")
+    plan.apply(dol)
+    end = max(section.address + section.size for section in sections)
+    datablob = bytes(range(256)) * (len(sections[0].data.getbuffer()) // 256)
+    new_section = DataSection((end + 0xFFFF) & ~0xFFFF, datablob)
+    dol.append_section(new_section)
+    return dol, plan, new_section, datablob
+
+def write_patch(dol, plan, new_section, datablob, in_dol_path, patch_path):
+    start = time.perf_counter()
+    records = dol_patch_records(dol, (plan,), new_section, datablob)
+    save_dol_patch(patch_path, in_dol_path, dol.size, records)
+    return time.perf_counter() - start
+
+def save_full(dol, out_dol_path):
+    start = time.perf_counter()
+    with open(out_dol_path, "wb") as f:
+        dol.save(f)
+    return time.perf_counter() - start
+
+def apply_patch(patch_path, in_dol_path, out_dol_path):
+    start = time.perf_counter()
+    apply_dol_patch(patch_path, in_dol_path, out_dol_path)
+    return time.perf_counter() - start
+
+def main():
+    size = int(float(sys.argv[1]) * (1 << 20)) if len(sys.argv) > 1 else 8 << 20
+    patch_count = int(sys.argv[2]) if len(sys.argv) > 2 else 50000
+    runs = int(sys.argv[3]) if len(sys.argv) > 3 else 5
+    
+    with tempfile.TemporaryDirectory() as temp_dir:
+        in_dol_path = os.path.join(temp_dir, "in.dol")
+        full_path = os.path.join(temp_dir, "full.dol")
+        patch_path = os.path.join(temp_dir, "out.patch")
+        patched_path = os.path.join(temp_dir, "patched.dol")
+        make_dol(in_dol_path, size)
+        dol, plan, new_section, datablob = patch_dol(in_dol_path, patch_count)
+        
+        results = {
+            "full save": [save_full(dol, full_path) for i in range(runs)],
+            "patch": [write_patch(dol, plan, new_section, datablob, in_dol_path, patch_path) for i in range(runs)],
+            "apply": [apply_patch(patch_path, in_dol_path, patched_path) for i in range(runs)],
+        }
+        with open(full_path, "rb") as full, open(patched_path, "rb") as patched:
+            if full.read() != patched.read():
+                print("The patched DOL doesn't match the saved DOL!")
+                return 1
+        sizes = (os.path.getsize(in_dol_path), os.path.getsize(full_path), os.path.getsize(patch_path))
+    
+    print("{} byte DOL, {} patches, {} byte patched DOL, {} byte patch".format(sizes[0], patch_count, sizes[1], sizes[2]))
+    print("{:10s} {:>10s} {:>10s} {:>10s}".format("", "mean (s)", "median (s)", "min (s)"))
+    for name, samples in results.items():
+        print("{:10s} {:10.3f} {:10.3f} {:10.3f}".format(name, statistics.mean(samples), statistics.median(samples), min(samples)))
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
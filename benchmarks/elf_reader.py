@@ -0,0 +1,81 @@
+# Compares reading the linked project's sections and symbol table with pyelftools against the
+# built-in ELF reader.  Without an ELF file, a synthetic one with many symbols is generated.
+#
+# Usage, from the repository root: PYTHONPATH=. python benchmarks/elf_reader.py [elf_path | symbol_count] [runs]
+
+import os
+import statistics
+import struct
+import sys
+import tempfile
+import time
+
+from dol_c_kit.elf import open_elf, SHF_ALLOC
+
+def make_elf(filepath, symbol_count, base_addr=0x80400000):
+    text = bytes(symbol_count * 4)
+    strtab = bytearray(b'\0')
+    symtab = bytearray(bytes(16))
+    for i in range(symbol_count):
+        name = "_ZN9Namespace5Class8functionEi{}".format(i).encode()
+        # Every fourth symbol is local, as they would be for static functions
+        symtab += struct.pack(">IIIBBH", len(strtab), base_addr + i * 4, 4, (0 if i % 4 == 0 else 1) << 4 | 2, 0, 1)
+        strtab += name + b'\0'
+    shstrtab = b"\0.text\0.symtab\0.strtab\0.shstrtab\0"
+    text_offset = 52
+    symtab_offset = text_offset + len(text)
+    strtab_offset = symtab_offset + len(symtab)
+    shstrtab_offset = strtab_offset + len(strtab)
+    shoff = (shstrtab_offset + len(shstrtab) + 3) & ~3
+    headers = [
+        (0, 0, 0, 0, 0, 0, 0, 0, 0, 0),
+        (shstrtab.index(b".text"), 1, 6, base_addr, text_offset, len(text), 0, 0, 4, 0),
+        (shstrtab.index(b".symtab"), 2, 0, 0, symtab_offset, len(symtab), 3, 1, 4, 16),
+        (shstrtab.index(b".strtab"), 3, 0, 0, strtab_offset, len(strtab), 0, 0, 1, 0),
+        (shstrtab.index(b".shstrtab"), 3, 0, 0, shstrtab_offset, len(shstrtab), 0, 0, 1, 0),
+    ]
+    with open(filepath, "wb") as f:
+        f.write(b"\x7fELF\x01\x02\x01" + bytes(9))
+        f.write(struct.pack(">HHIIIIIHHHHHH", 2, 20, 1, base_addr, 0, shoff, 0, 52, 0, 0, 40, len(headers), 4))
+        f.write(text + symtab + strtab + shstrtab)
+        f.write(bytes(shoff - f.tell()))
+        for header in headers:
+            f.write(struct.pack(">IIIIIIIIII", *header))
+
+def read_elf(filepath, use_pyelftools):
+    start = time.perf_counter()
+    with open_elf(filepath, use_pyelftools) as elf:
+        size = 0
+        for section in elf.sections:
+            if section.flags & SHF_ALLOC:
+                with elf.section_data(section) as data:
+                    size += len(data)
+        symbols = {symbol.name: symbol.entry() for symbol in elf.symbols(skip_local=True)}
+    return time.perf_counter() - start, len(symbols)
+
+def main():
+    arg = sys.argv[1] if len(sys.argv) > 1 else "50000"
+    runs = int(sys.argv[2]) if len(sys.argv) > 2 else 5
+    
+    with tempfile.TemporaryDirectory() as temp_dir:
+        if os.path.isfile(arg):
+            filepath = arg
+        else:
+            filepath = os.path.join(temp_dir, "bench.o")
+            make_elf(filepath, int(arg))
+        
+        results = {}
+        for name, use_pyelftools in (("pyelftools", True), ("built-in", False)):
+            samples = [read_elf(filepath, use_pyelftools) for i in range(runs)]
+            results[name] = [elapsed for elapsed, count in samples]
+            symbol_count = samples[0][1]
+    
+    print("{} global symbols".format(symbol_count))
+    print("{:10s} {:>10s} {:>10s} {:>10s}".format("", "mean (s)", "median (s)", "min (s)"))
+    for name, samples in results.items():
+        print("{:10s} {:10.3f} {:10.3f} {:10.3f}".format(name, statistics.mean(samples), statistics.median(samples), min(samples)))
+    print("Speedup: {:.2f}x".format(statistics.mean(results["pyelftools"]) / statistics.mean(results["built-in"])))
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
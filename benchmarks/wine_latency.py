@@ -0,0 +1,51 @@
+# Compares the per-file latency of compiling with CodeWarrior through Wine from a cold start
+# (wineserver killed before every compile) against a persistent, pre-warmed WineServer.
+#
+# Usage, from the repository root: PYTHONPATH=. python benchmarks/wine_latency.py <codewarrior_path> [runs] [wine_prefix]
+
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+from dol_c_kit.wine import WineServer
+
+def time_compile(args, env):
+    start = time.perf_counter()
+    subprocess.call(args, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    return time.perf_counter() - start
+
+def main():
+    if len(sys.argv) < 2:
+        print("Usage: python {} <codewarrior_path> [runs] [wine_prefix]".format(sys.argv[0]))
+        return 1
+    codewarrior_path = sys.argv[1]
+    runs = int(sys.argv[2]) if len(sys.argv) > 2 else 10
+    prefix = sys.argv[3] if len(sys.argv) > 3 else None
+    
+    with tempfile.TemporaryDirectory() as temp_dir:
+        src = os.path.join(temp_dir, "bench.c")
+        with open(src, "w") as f:
+            f.write("int bench(int a, int b) { return a * b + 1; }\n")
+        args = [codewarrior_path+"mwcceppc", "-proc", "gekko", "-c", src, "-o", os.path.join(temp_dir, "bench.o")]
+        
+        server = WineServer(prefix=prefix)
+        cold = []
+        for i in range(runs):
+            server.stop()
+            cold.append(time_compile([server.wine_path] + args, server.env()))
+        
+        server.start()
+        warm = [time_compile(server.wrap(args), server.env()) for i in range(runs)]
+        server.stop()
+    
+    print("{:6s} {:>10s} {:>10s} {:>10s}".format("", "mean (s)", "median (s)", "min (s)"))
+    for name, samples in (("cold", cold), ("warm", warm)):
+        print("{:6s} {:10.3f} {:10.3f} {:10.3f}".format(name, statistics.mean(samples), statistics.median(samples), min(samples)))
+    print("Speedup: {:.2f}x".format(statistics.mean(cold) / statistics.mean(warm)))
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
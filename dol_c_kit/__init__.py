@@ -36,3 +36,8 @@ from dol_c_kit.devkit_tools import Project
 from dol_c_kit.devkit_tools import Compiler
 from dol_c_kit.devkit_tools import Assembler
 from dol_c_kit.devkit_tools import Linker
+
+from dol_c_kit.symbols import SymbolTable
+from dol_c_kit.patch import PatchPlan
+from dol_c_kit.hooktable import HookTable
+from dol_c_kit.dolimage import DolImage
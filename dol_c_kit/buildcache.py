@@ -0,0 +1,271 @@
+import hashlib
+import json
+import os
+import re
+import shutil
+import threading
+
+IncludeRegex = re.compile(rb'^[ \t]*(?:#[ \t]*include|\.include)[ \t]*(?:"([^"]+)"|<([^>]+)>|(\S+))', re.MULTILINE)
+
+def hash_file(filepath):
+    h = hashlib.blake2b(digest_size=20)
+    with open(filepath, "rb") as f:
+        for chunk in iter(lambda: f.read(1 << 20), b''):
+            h.update(chunk)
+    return h.hexdigest()
+
+# Compiler flags that add a directory searched for #include "..." only, or for both kinds of include.
+# CodeWarrior's -ir adds a directory and every directory under it.
+QuoteDirFlags = ("-iquote",)
+IncludeDirFlags = ("-I", "-i", "-isystem", "-idirafter", "-ir")
+# Flags that include a file ahead of the source
+IncludeFileFlags = ("-include", "-imacros", "-prefix")
+# Flags of the above that GCC also takes joined to their value, longest first
+JoinedIncludeFlags = ("-idirafter", "-isystem", "-imacros", "-include", "-iquote", "-I")
+# Flags that move the toolchain's own include directories, which scan_headers doesn't know
+UnknownIncludeFlags = ("-iprefix", "-iwithprefix", "-isysroot", "-imultilib", "--sysroot")
+
+def include_paths_from_args(args):
+    # Returns (quote_dirs, include_dirs, forced_includes) for a compiler command line, or None if a
+    # flag changes where headers are found in a way scan_headers can't follow, such as -I- or one of
+    # UnknownIncludeFlags.
+    quote_dirs = []
+    include_dirs = []
+    forced_includes = []
+    i = 0
+    while i < len(args):
+        arg = args[i]
+        flag, value = None, None
+        if arg in QuoteDirFlags + IncludeDirFlags + IncludeFileFlags:
+            if i + 1 >= len(args):
+                return None
+            flag, value = arg, args[i + 1]
+            i += 1
+        elif arg in ("-I-", "-i-") or arg.startswith(UnknownIncludeFlags):
+            return None
+        elif arg.startswith(JoinedIncludeFlags):
+            flag = next(flag for flag in JoinedIncludeFlags if arg.startswith(flag))
+            value = arg[len(flag):]
+        i += 1
+        if flag in QuoteDirFlags:
+            quote_dirs.append(value)
+        elif flag == "-ir":
+            for dirpath, dirnames, filenames in os.walk(value):
+                dirnames.sort()
+                include_dirs.append(dirpath)
+        elif flag in IncludeDirFlags:
+            include_dirs.append(value)
+        elif flag in IncludeFileFlags:
+            forced_includes.append(value)
+    return (quote_dirs, include_dirs, forced_includes)
+
+def scan_headers_from_args(src_path, args):
+    # scan_headers for the source of a compiler command line
+    paths = include_paths_from_args(args)
+    if paths is None:
+        return None
+    quote_dirs, include_dirs, forced_includes = paths
+    return scan_headers(src_path, include_dirs, quote_dirs, forced_includes)
+
+class ObjectCache(object):
+    def __init__(self, cache_dir, max_size):
+        self.cache_dir = cache_dir
+        self.max_size = max_size
+        self.hits = 0
+        self.misses = 0
+        self.lock = threading.Lock()
+        # Memos so shared headers and the toolchain binaries are only hashed once per build
+        self.file_hashes = {}
+        self.toolchain_ids = {}
+        self.headers = {}
+    
+    def key(self, src_path, args):
+        # A key covers the source, every header it can reach, the full argument vector, and the
+        # identity of the toolchain binary.  None means the unit can't be cached safely.
+        h = hashlib.blake2b(digest_size=20)
+        h.update(self.__toolchain_id(args[0]).encode())
+        h.update("\0".join(args).encode())
+        headers = scan_headers_from_args(src_path, args)
+        self.headers[src_path] = headers
+        if headers is None:
+            return None
+        for filepath in headers:
+            h.update(filepath.encode())
+            h.update(self.__file_hash(filepath).encode())
+        return h.hexdigest()
+    
+    def fetch(self, key, obj_path):
+        entry = self.__entry_path(key) if key else None
+        if entry and os.path.isfile(entry):
+            try_remove(obj_path)
+            link_or_copy(entry, obj_path)
+            # Touching the entry keeps it at the young end of the LRU order
+            os.utime(entry)
+            with self.lock:
+                self.hits += 1
+            return True
+        with self.lock:
+            self.misses += 1
+        return False
+    
+    def store(self, key, obj_path):
+        entry = self.__entry_path(key)
+        os.makedirs(os.path.dirname(entry), exist_ok=True)
+        temp = entry + ".{}.tmp".format(threading.get_ident())
+        shutil.copyfile(obj_path, temp)
+        os.replace(temp, entry)
+    
+    def evict(self):
+        # Drop least recently used entries until the cache fits in max_size bytes
+        entries = []
+        total = 0
+        for dirpath, dirnames, filenames in os.walk(self.cache_dir):
+            for filename in filenames:
+                filepath = os.path.join(dirpath, filename)
+                try:
+                    stat = os.stat(filepath)
+                except OSError:
+                    continue
+                entries.append((stat.st_mtime_ns, stat.st_size, filepath))
+                total += stat.st_size
+        entries.sort()
+        for mtime, size, filepath in entries:
+            if total <= self.max_size:
+                break
+            if try_remove(filepath):
+                total -= size
+        return total
+    
+    def stats(self):
+        return "Object cache: {} hits, {} misses".format(self.hits, self.misses)
+    
+    def __entry_path(self, key):
+        return os.path.join(self.cache_dir, key[:2], key + ".o")
+    
+    def __file_hash(self, filepath):
+        if filepath not in self.file_hashes:
+            self.file_hashes[filepath] = hash_file(filepath)
+        return self.file_hashes[filepath]
+    
+    def __toolchain_id(self, program):
+        if program not in self.toolchain_ids:
+            resolved = shutil.which(program) or program
+            try:
+                stat = os.stat(resolved)
+                self.toolchain_ids[program] = "{}:{}:{}".format(os.path.realpath(resolved), stat.st_size, stat.st_mtime_ns)
+            except OSError:
+                self.toolchain_ids[program] = resolved
+        return self.toolchain_ids[program]
+
+def scan_headers(src_path, include_dirs, quote_dirs=(), forced_includes=()):
+    # Conservatively follow every #include and .include, ignoring preprocessor conditionals.  Angled
+    # headers that can't be found are assumed to belong to the toolchain.  Returns None if the
+    # headers can't be known without preprocessing, or a quoted or forced include can't be found.
+    found = [src_path]
+    seen = {os.path.normpath(src_path)}
+    for filepath in forced_includes:
+        if not os.path.isfile(filepath):
+            return None
+        if os.path.normpath(filepath) not in seen:
+            seen.add(os.path.normpath(filepath))
+            found.append(filepath)
+    i = 0
+    while i < len(found):
+        filepath = found[i]
+        i += 1
+        with open(filepath, "rb") as f:
+            text = f.read()
+        for match in IncludeRegex.finditer(text):
+            quoted, angled, other = match.groups()
+            if other is not None:
+                # Computed includes (#include MACRO) can't be resolved without preprocessing
+                return None
+            name = (quoted or angled).decode(errors="replace")
+            search_dirs = [os.path.dirname(filepath)] + list(quote_dirs) if quoted else []
+            for include_dir in search_dirs + list(include_dirs):
+                candidate = os.path.normpath(os.path.join(include_dir, name))
+                if os.path.isfile(candidate):
+                    if candidate not in seen:
+                        seen.add(candidate)
+                        found.append(candidate)
+                    break
+            else:
+                if quoted:
+                    return None
+    return found
+
+def parse_depfile(filepath):
+    # Make-style rule as written by -MMD / -gccdep -MD / --MD.  Everything after the first
+    # target's colon is a prerequisite, with backslash-newline continuations and escaped spaces.
+    with open(filepath, "r", errors="replace") as f:
+        text = f.read().replace("\\\r\n", " ").replace("\\\n", " ")
+    deps = []
+    rule = text.split("\n\n")[0]
+    colon = re.search(r':(?:\s|$)', rule)
+    if colon is None:
+        return deps
+    for token in re.split(r'(?<!\\)\s+', rule[colon.end():]):
+        token = token.replace("\\ ", " ").strip()
+        if token and token not in deps:
+            deps.append(token)
+    return deps
+
+def stat_signature(filepath):
+    try:
+        stat = os.stat(filepath)
+    except OSError:
+        return None
+    return [stat.st_size, stat.st_mtime_ns]
+
+class DependencyGraph(object):
+    def __init__(self, filepath):
+        self.filepath = filepath
+        self.objects = {}
+        try:
+            with open(filepath, "r") as f:
+                self.objects = json.load(f)
+        except (OSError, ValueError):
+            pass
+    
+    def is_up_to_date(self, obj_path, args):
+        entry = self.objects.get(obj_path)
+        if entry is None or entry["args"] != args or not os.path.isfile(obj_path):
+            return False
+        for dep, signature in entry["deps"].items():
+            if stat_signature(dep) != signature:
+                return False
+        return True
+    
+    def record(self, obj_path, args, deps):
+        self.objects[obj_path] = {"args": args, "deps": {dep: stat_signature(dep) for dep in deps}}
+    
+    def save(self):
+        temp = self.filepath + ".tmp"
+        with open(temp, "w") as f:
+            json.dump(self.objects, f)
+        os.replace(temp, self.filepath)
+
+def fingerprint(args, filepaths):
+    # Hash of a command line and the contents of every file it reads
+    h = hashlib.blake2b(digest_size=20)
+    h.update("\0".join(args).encode())
+    for filepath in filepaths:
+        h.update(filepath.encode())
+        try:
+            h.update(hash_file(filepath).encode())
+        except OSError:
+            h.update(b"missing")
+    return h.hexdigest()
+
+def link_or_copy(src, dst):
+    try:
+        os.link(src, dst)
+    except OSError:
+        shutil.copyfile(src, dst)
+
+def try_remove(filepath):
+    try:
+        os.remove(filepath)
+        return True
+    except FileNotFoundError:
+        return False
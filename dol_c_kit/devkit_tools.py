@@ -1,12 +1,32 @@
 import subprocess
+import hashlib
 import os
+import io
+import json
 import platform
+import threading
+import time
+import shutil
+import tempfile
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor, wait
+from contextlib import nullcontext
 from enum import Enum
 from dol_c_kit import assemble_branch, write_branch, mask_field, hi, lo, hia
+from dol_c_kit.wine import WineServer
+from dol_c_kit.stages import StageGraph
+from dol_c_kit.trace import BuildTrace
+from dol_c_kit.elf import open_elf, SHF_ALLOC, SHT_NOBITS, SHN_ABS
+from dol_c_kit.symbols import SymbolTable, save_link_cache, load_link_cache
+from dol_c_kit.patch import PatchPlan, PatchRecorder
+from dol_c_kit.dolimage import DolImage
+from dol_c_kit.doloutput import save_dol
+from dol_c_kit.dolpatch import dol_patch_records, save_dol_patch
+from dol_c_kit.dolcache import dol_cache
+from dol_c_kit.hooktable import HookTable, read_hook_manifest, save_hook_manifest, load_hook_manifest
+from dol_c_kit.buildcache import ObjectCache, DependencyGraph, parse_depfile, scan_headers_from_args, fingerprint, hash_file, try_remove, QuoteDirFlags, IncludeDirFlags, IncludeFileFlags, JoinedIncludeFlags
 
 from dolreader.dol import DolFile, write_uint32
-from dolreader.section import Section, TextSection, DataSection
-from elftools.elf.elffile import ELFFile
+from dolreader.section import TextSection, DataSection
 from geckolibs.gct import GeckoCodeTable
 from geckolibs.geckocode import GeckoCode, GeckoCommand, WriteBranch, Write32, WriteString, Write16
 
@@ -30,6 +50,11 @@ class Hook(object):
     def dump_info(self):
         return repr("{:s} {:08X}".format(
                     "{:13s}".format("[Hook]       "), self.addr))[+1:-1]
+    
+    def origin(self):
+        # Names this hook in patch plans and overlap reports
+        sym_name = getattr(self, "sym_name", None)
+        return "{:s} {:08X}{:s}".format(type(self).__name__, self.addr, " " + sym_name if sym_name else "")
 
 class BranchHook(Hook):
     def __init__(self, addr, sym_name, lk_bit):
@@ -253,12 +278,12 @@ def find_rom_end(dol):
             rom_end = section.address + section.size
     return rom_end
 
-def try_remove(filepath):
-    try:
-        os.remove(filepath)
-        return True
-    except FileNotFoundError:
-        return False
+def gecko_text_to_gct(text):
+    # Every line of a Gecko Code List that isn't a header, code name, or comment is one 8-byte code line.
+    lines = [line for line in text.splitlines() if line.strip() and line.lstrip()[0] not in "[$*"]
+    return GeckoCodeTable.Magic + bytes.fromhex("".join(lines)) + b"\xF0\x00\x00\x00\x00\x00\x00\x00"
+
+OutputKinds = ("dol", "gecko", "gct", "map")
 
 SupportedGeckoCodetypes = [
     GeckoCommand.Type.WRITE_8,
@@ -281,11 +306,12 @@ class Linker(Enum):
     DevkitPPC = 0
 
 class Project(object):
-    def __init__(self, base_addr=None, verbose=False, compiler=Compiler.DevkitPPC, assembler=Assembler.DevkitPPC, linker=Linker.DevkitPPC):
+    def __init__(self, base_addr=None, verbose=False, compiler=Compiler.DevkitPPC, assembler=Assembler.DevkitPPC, linker=Linker.DevkitPPC, jobs=None):
         self.base_addr = base_addr
         self.compiler = compiler
         self.assembler = assembler
         self.linker = linker
+        self.jobs = jobs if jobs else (os.cpu_count() or 1)
         self.sda_base = None
         self.sda2_base = None
         
@@ -306,6 +332,21 @@ class Project(object):
         self.asm_files = []
         self.obj_files = []
         self.linker_script_files = []
+        self.use_object_cache = True
+        self.object_cache_size = 512 * 1024 * 1024
+        self.object_cache = None
+        self.incremental = False
+        self.batch_compile = False
+        self.unity_build = False
+        self.unity_build_size = 256 * 1024
+        self.precompiled_header = None
+        self.wine_server = None
+        self.write_bin = False
+        self.use_pyelftools = False
+        self.__pch_args = []
+        # Set by build_targets, whose worker processes link objects that were already compiled
+        self.__shared_objects = None
+        self.__target_count = 0
         
         if self.compiler == Compiler.DevkitPPC:
             self.c_flags = ["-w", "-std=c99", "-O1", "-fno-asynchronous-unwind-tables",]
@@ -329,13 +370,26 @@ class Project(object):
         else:
             self.linker_flags = []   # lmao
         
-        self.symbols = {}
+        self.symbols = SymbolTable()
+        self.link_sections = []
+        self.image = None
         self.verbose = verbose
+        self.trace = None
         
         # Patches member variables
         self.hooks = []
+        self.hook_table = HookTable()
+        # For each hook in hooks, how many rows the hook_table had when it was declared
+        self.__hook_rows = []
+        self.__hook_caches = []
         self.gecko_codetable = GeckoCodeTable(gameName=self.project_name)
+        self.gecko_files = []
         self.gecko_code_metadata = []
+        self.patch_plan = None
+        self.strict_overlaps = False
+        self.flat_image = False
+        self.incremental_output = False
+        self.use_dol_cache = True
         self.osarena_patcher = None
         
         # For one-time messages
@@ -343,12 +397,12 @@ class Project(object):
     
     # Add stuff
     
-    def add_c_file(self, filepath, flags=(), use_global_flags=True):
-        self.c_files.append((filepath, flags, use_global_flags))
-        
-    def add_cpp_file(self, filepath, flags=(), use_global_flags=True):
-        self.cpp_files.append((filepath, flags, use_global_flags))
-        
+    def add_c_file(self, filepath, flags=(), use_global_flags=True, use_unity_build=True):
+        self.c_files.append((filepath, flags, use_global_flags, use_unity_build))
+    
+    def add_cpp_file(self, filepath, flags=(), use_global_flags=True, use_unity_build=True):
+        self.cpp_files.append((filepath, flags, use_global_flags, use_unity_build))
+    
     def add_asm_file(self, filepath, flags=(), use_global_flags=True):
         self.asm_files.append((filepath, flags, use_global_flags))
     
@@ -359,38 +413,51 @@ class Project(object):
         self.linker_script_files.append(filepath)
     
     def add_gecko_txt_file(self, filepath):
-        with open(filepath, "r") as f:
-            gecko_codetable = GeckoCodeTable.from_text(f)
-        for gecko_code in gecko_codetable:
-            self.gecko_codetable.add_child(gecko_code)
+        # Gecko Code Lists are parsed when the project is built, alongside compilation.
+        self.gecko_files.append((filepath, False))
     
     def add_gecko_gct_file(self, filepath):
-        with open(filepath, "rb") as f:
-            code_table = GeckoCodeTable.from_bytes(f)
-        self.gecko_codetable.append(code_table)
+        self.gecko_files.append((filepath, True))
     
     # Hook stuff
     
     def hook_branch(self, addr, sym_name, LK=False):
-        self.hooks.append(BranchHook(addr, sym_name, LK))
+        self.hook_table.add_branch(addr, sym_name, LK)
     
     def hook_branchlink(self, addr, sym_name):
         self.hook_branch(addr, sym_name, LK=True)
     
     def hook_pointer(self, addr, sym_name):
-        self.hooks.append(PointerHook(addr, sym_name))
+        self.hook_table.add_pointer(addr, sym_name)
     
     def hook_string(self, addr, string, encoding = "ascii", max_strlen = None):
         self.hooks.append(StringHook(addr, string, encoding, max_strlen))
+        self.__hook_rows.append(len(self.hook_table))
     
     def hook_file(self, addr, filepath, start = 0, end = None, max_size = None):
         self.hooks.append(FileHook(addr, filepath, start, end, max_size))
+        self.__hook_rows.append(len(self.hook_table))
     
     def hook_immediate16(self, addr, sym_name, modifier):
-        self.hooks.append(Immediate16Hook(addr, sym_name, modifier))
+        self.hook_table.add_immediate16(addr, sym_name, modifier)
     
     def hook_immediate12(self, addr, w, i, sym_name, modifier):
-        self.hooks.append(Immediate12Hook(addr, w, i, sym_name, modifier))
+        self.hook_table.add_immediate12(addr, w, i, sym_name, modifier)
+    
+    def load_hooks(self, filepath):
+        # The parsed manifest is cached in obj_dir in the binary manifest format, keyed by the hash of
+        # the manifest, so an unchanged manifest is never parsed or validated twice.
+        key = hash_file(filepath)
+        cache_path = self.__hook_cache_path(filepath)
+        table = load_hook_manifest(cache_path, key)
+        if table is None:
+            table = read_hook_manifest(filepath)
+            if self.obj_dir:
+                os.makedirs(self.obj_dir, exist_ok=True)
+            save_hook_manifest(cache_path, table, key)
+        if cache_path not in self.__hook_caches:
+            self.__hook_caches.append(cache_path)
+        self.hook_table.extend(table)
     
     # Set stuff
     
@@ -401,149 +468,166 @@ class Project(object):
         self.sda_base = sda_base
         self.sda2_base = sda2_base
     
+    def set_precompiled_header(self, filepath):
+        self.precompiled_header = filepath
+    
+    def set_wine_server(self, wine_path="wine", wineserver_path="wineserver", prefix=None, persist_seconds=300):
+        if platform.system() == "Windows":
+            print("Wine is not needed to run CodeWarrior on Windows.  Ignoring set_wine_server.")
+            return
+        self.wine_server = WineServer(wine_path, wineserver_path, prefix, persist_seconds)
+    
+    def __getstate__(self):
+        # What a build_targets worker process gets.  The Wine server and object cache are only used to
+        # compile, which has already happened by then.
+        state = self.__dict__.copy()
+        state["wine_server"] = None
+        state["object_cache"] = None
+        return state
+    
+    def enable_trace(self):
+        self.trace = BuildTrace()
+    
+    def save_trace(self, trace_path):
+        if self.trace is None:
+            raise RuntimeError("Tracing is not enabled.  Call enable_trace before building.")
+        self.trace.save(trace_path)
+    
+    def print_trace_summary(self):
+        if self.trace is None:
+            raise RuntimeError("Tracing is not enabled.  Call enable_trace before building.")
+        print(self.trace.summary())
+    
     # Do stuff
     
     def build_dol(self, in_dol_path, out_dol_path):
-        with open(in_dol_path, "rb") as f:
-            dol = DolFile(f)
+        dol, classified_codes, datablob = self.__prepare_dol(in_dol_path)
+        self.__emit_dol(dol, classified_codes, datablob, in_dol_path, out_dol_path)
+    
+    def build_patch(self, in_dol_path, out_patch_path):
+        # Builds the same DOL as build_dol, but saves it as a patch to the input DOL, made straight from
+        # the patch plan and the appended section, so applying the patch gives exactly the DOL build_dol
+        # would save.
+        dol, classified_codes, datablob = self.__prepare_dol(in_dol_path)
+        new_section, osarena_plan = self.__patch_dol(dol, classified_codes, datablob, record_osarena=True)
         
-        if self.base_addr == None:
-            self.base_addr = (find_rom_end(dol) + 31) & 0xFFFFFFE0
-            print("Base address auto-set from ROM end: {0:X}\n"
-                  "Do not rely on this feature if your DOL uses .sbss2\n".format(self.base_addr))
+        with self.__span("save_patch"):
+            runs = dol_patch_records(dol, (self.patch_plan, osarena_plan), new_section, datablob)
+            written = save_dol_patch(out_patch_path, in_dol_path, dol.size, runs)
+        if self.verbose:
+            print("{}: {} bytes in {} records".format(out_patch_path, written, len(runs)))
+    
+    def build_gecko(self, gecko_path):
+        datablob = bytearray()
         
-        if self.base_addr % 32:
-            print("WARNING!  DOL sections must be 32-byte aligned for OSResetSystem to work properly!\n")
+        stages = StageGraph()
+        stages.add("gecko", self.__stage("gecko", self.__load_gecko_files))
+        stages.add("build", self.__stage("build", self.__build_project))
+        stages.run()
+        if stages.result("build") == True:
+            datablob = self.image
         
-        datablob = bytearray()
-
-        if self.__build_project() == True:
-            with open(self.obj_dir+self.project_name+".bin", "rb") as f:
-                datablob += f.read()
-                while (len(datablob) % 4) != 0:
-                    datablob += b'\x00'
+        text, self.patch_plan = self.__gecko_text(datablob)
+        self.__write_output("save_gecko", gecko_path, "w", text)
+    
+    def build_outputs(self, outputs, in_dol_path=None):
+        for kind, path in outputs:
+            if kind not in OutputKinds:
+                raise RuntimeError("Unknown output kind \"{}\"!  Use one of: {}".format(kind, ", ".join(OutputKinds)))
+        kinds = {kind for kind, path in outputs}
+        if "dol" in kinds and in_dol_path is None:
+            raise RuntimeError("An input DOL is needed to build a DOL output!")
         
-        for gecko_code in self.gecko_codetable:
-            status = "ENABLED" if gecko_code.is_enabled() else "DISABLED"
-            if gecko_code.is_enabled() == True:
-                for gecko_command in gecko_code:
-                    if gecko_command.codetype not in SupportedGeckoCodetypes:
-                        status = "OMITTED"
-            
-            print("[GeckoCode]   {:12s} ${}".format(status, gecko_code.name))
-            if status == "OMITTED":
-                print("Includes unsupported codetypes:")
-                for gecko_command in gecko_code:
-                    if gecko_command.codetype not in SupportedGeckoCodetypes:
-                        print(gecko_command)
-            
-            vaddress = self.base_addr + len(datablob)
-            geckoblob = bytearray()
-            gecko_command_metadata = []
-            
-            for gecko_command in gecko_code:
-                if gecko_command.codetype == GeckoCommand.Type.ASM_INSERT \
-                or gecko_command.codetype == GeckoCommand.Type.ASM_INSERT_XOR:
-                    if status == "UNUSED" \
-                    or status == "OMITTED":
-                        gecko_command_metadata.append((0, len(gecko_command.value), status, gecko_command))
-                    else:
-                        dol.seek(gecko_command._address | 0x80000000)
-                        write_branch(dol, vaddress + len(geckoblob))
-                        gecko_command_metadata.append((vaddress + len(geckoblob), len(gecko_command.value), status, gecko_command))
-                        geckoblob += gecko_command.value[:-4]
-                        geckoblob += assemble_branch(vaddress + len(geckoblob), gecko_command._address + 4 | 0x80000000)
-            datablob += geckoblob
-            if gecko_command_metadata:
-                self.gecko_code_metadata.append((vaddress, len(geckoblob), status, gecko_code, gecko_command_metadata))
-        self.gecko_codetable.apply(dol)
-        
-        for hook in self.hooks:
-            hook.resolve(self.symbols)
-            hook.apply_dol(dol)
-            if self.verbose:
-                print(hook.dump_info())
+        # The toolchain runs once, the same way build_dol runs it, or build_gecko's way without a DOL.
+        stages = StageGraph()
+        stages.add("gecko", self.__stage("gecko", self.__classify_gecko_codes))
+        stages.add("compile", self.__stage("compile", self.__compile_project))
+        if "dol" in kinds:
+            stages.add("dol", self.__stage("dol", lambda: self.__load_dol(in_dol_path)))
+            stages.add("base_addr", self.__stage("base_addr", self.__resolve_base_addr), "dol")
+            stages.add("link", self.__stage("link", self.__link_and_process), "compile", "base_addr")
+        else:
+            stages.add("link", self.__stage("link", self.__link_and_process), "compile")
+        stages.run()
+        image = self.image if stages.result("link") == True else bytearray()
         
-        if len(datablob) > 0:
-            new_section: Section
-            if len(dol.textSections) <= DolFile.MaxTextSections:
-                new_section = TextSection(self.base_addr, datablob)
-            elif len(dol.dataSections) <= DolFile.MaxDataSections:
-                new_section = DataSection(self.base_addr, datablob)
-            else:
-                raise RuntimeError("DOL is full!  Cannot allocate any new sections.")
-            dol.append_section(new_section)
-            
-            if self.osarena_patcher:
-                self.osarena_patcher(dol, self.base_addr + len(datablob))
+        # Building the DOL and the Gecko Code List both resolve and apply the hooks, so they run one
+        # after the other.  The DOL gets its own copy of the image to pad and append Gecko Codes to.
+        if "dol" in kinds:
+            datablob = image + bytes(-len(image) % 4)
+            dol_paths = [path for kind, path in outputs if kind == "dol"]
+            self.__emit_dol(stages.result("dol"), stages.result("gecko"), datablob, in_dol_path, dol_paths[0])
+            for path in dol_paths[1:]:
+                shutil.copyfile(dol_paths[0], path)
         
-        with open(out_dol_path, "wb") as f:
-            dol.save(f)
-    
-    def build_gecko(self, gecko_path):
-        with open(gecko_path, "w") as f:
-            datablob = bytearray()
-            
-            if self.__build_project() == True:
-                with open(self.obj_dir+self.project_name+".bin", "rb") as bin:
-                    datablob += bin.read()
-            
-            f.write("[Gecko]\n")
-            # Everything gets shoved into a large Gecko Code named after the project
-            f.write("${}\n".format(self.project_name))
-            # Copy existing Gecko Codes
-            for gecko_code in self.gecko_codetable:
-                if gecko_code.is_enabled():
-                    f.write("* {}\n".format(gecko_code.name))
-                    f.write("{}\n".format(gecko_code.as_text()))
-                print("[GeckoCode]   {:12s} ${}".format("ENABLED" if gecko_code.is_enabled() else "DISABLED", gecko_code.name))
-            # Create Program Data megacode
-            if datablob:
-                gecko_command = WriteString(datablob, self.base_addr)
-                f.write("* Program Data\n")
-                f.write(gecko_command.as_text() + "\n")
-            # Create Hooks
-            f.write("* Hooks\n")
-            for hook in self.hooks:
-                hook.resolve(self.symbols)
-                hook.write_geckocommand(f)
-                if self.verbose:
-                    print(hook.dump_info())
+        # The files themselves share nothing, so they are written concurrently.
+        writers = []
+        if kinds & {"gecko", "gct"}:
+            text, plan = self.__gecko_text(image)
+            if "dol" not in kinds:
+                self.patch_plan = plan
+            for kind, path in outputs:
+                if kind == "gecko":
+                    writers.append(lambda path=path: self.__write_output("save_gecko", path, "w", text))
+                elif kind == "gct":
+                    writers.append(lambda path=path: self.__write_output("save_gct", path, "wb", gecko_text_to_gct(text)))
+        for kind, path in outputs:
+            if kind == "map":
+                writers.append(lambda path=path: self.save_map(path))
+        if writers:
+            with ThreadPoolExecutor(max_workers=len(writers)) as executor:
+                for future in [executor.submit(writer) for writer in writers]:
+                    future.result()
+    
+    def build_targets(self, targets):
+        # Every source file is compiled once, here.  Each target is then linked at its own base address
+        # and built into its own DOL by a worker process, which gets a copy of this project.
+        with self.__span("compile", "stage"):
+            is_built = self.__compile_project()
+        self.__shared_objects = is_built
+        self.__target_count = max(self.__target_count, len(targets))
+        for target in targets:
+            if len(target) > 4 and target[4] and self.__hook_cache_path(target[4]) not in self.__hook_caches:
+                self.__hook_caches.append(self.__hook_cache_path(target[4]))
+        reports = []
+        try:
+            with ProcessPoolExecutor(max_workers=min(self.jobs, len(targets)) or 1) as executor:
+                futures = [executor.submit(build_target, self, index, target) for index, target in enumerate(targets)]
+                for target, future in zip(targets, futures):
+                    try:
+                        report = future.result()
+                    except Exception as e:
+                        report = {"out_dol_path": target[3], "base_addr": target[1], "error": e}
+                    if report.get("trace_events") and self.trace is not None:
+                        self.trace.merge(report.pop("trace_events"))
+                    reports.append(report)
+        finally:
+            self.__shared_objects = None
+        
+        print("{:32s} {:9s} {:>9s} {:>8s} {:>9s}".format("Target", "Base addr", "Size", "Patches", "Time (s)"))
+        for report in reports:
+            name = os.path.basename(report["out_dol_path"])[:32]
+            if "error" in report:
+                print("{:32s} FAILED: {}".format(name, report["error"]))
+            else:
+                print("{:32s} {:08X}  {:9d} {:8d} {:9.2f}".format(
+                      name, report["base_addr"], report["size"], report["patches"], report["elapsed"]))
+        failed = [report for report in reports if "error" in report]
+        if failed:
+            raise RuntimeError("{} of {} targets failed to build".format(len(failed), len(targets)))
+        return reports
     
     def save_map(self, map_path):
-        with open(map_path, "w") as map:
-            try:
-                with open(self.obj_dir+self.project_name+".o", 'rb') as f:
-                    elf = ELFFile(f)
-                    symtab = elf.get_section_by_name(".symtab")
-                    new_symbols = []
-                    
-                    for iter in symtab.iter_symbols():
-                        # Filter out worthless symbols, as well as STT_SECTION and STT_FILE type symbols.
-                        if iter.entry['st_info']['bind'] == "STB_LOCAL":
-                            continue
-                        # Symbols defined by the linker script have no section index, and are instead absolute.
-                        # Symbols we already have aren't needed in the new symbol map, so they are filtered out.
-                        if (iter.entry['st_shndx'] == 'SHN_ABS') or (iter.entry['st_shndx'] == 'SHN_UNDEF'):
-                            continue
-                        new_symbols.append(iter)
-                    new_symbols.sort(key = lambda i: i.entry['st_value'])
-                    
-                    curr_section_name = ""
-                    for iter in new_symbols:
-                        parent_section = elf.get_section(iter.entry['st_shndx'])
-                        if curr_section_name != parent_section.name:
-                            curr_section_name = parent_section.name
-                            map.write(
-                                "\n"
-                                "{} section layout\n"
-                                "  Starting        Virtual\n"
-                                "  address  Size   address\n"
-                                "  -----------------------\n".format(curr_section_name))
-                        map.write("  {:08X} {:06X} {:08X}  0 {}\n".format(
-                            iter.entry['st_value'] - self.base_addr, iter.entry['st_size'], iter.entry['st_value'], iter.name))
-            except OSError:
-                pass
+        with self.__span("save_map"), open(map_path, "w", buffering=1 << 20) as map:
+            # The symbols and section headers gathered when the project was built are used, falling back
+            # to the link cache (or project.o itself) if this Project hasn't built anything.
+            sections, symbols = self.link_sections, self.symbols
+            if not sections:
+                try:
+                    sections, symbols = self.__read_link_results()
+                except OSError:
+                    pass
+            map.writelines(self.__map_symbol_lines(sections, symbols))
             # Record Geckoblobs from patched-in C2/F2 codetypes.  I really wanted to name this section .gecko in the
             # symbol map, but only .init and .text section headers tell Dolphin to color the symbols by index.
             if self.gecko_code_metadata:
@@ -582,64 +666,601 @@ class Project(object):
         try_remove(self.obj_dir+self.project_name+".o")
         try_remove(self.obj_dir+self.project_name+".bin")
         try_remove(self.obj_dir+self.project_name+".map")
+        try_remove(self.obj_dir+self.project_name+".link")
+        try_remove(self.obj_dir+self.project_name+".linkcache")
+        for index in range(self.__target_count):
+            for extension in (".o", ".bin", ".map", ".link", ".linkcache"):
+                try_remove("{}{}_{}{}".format(self.obj_dir, self.project_name, index, extension))
+        for cache_path in self.__hook_caches:
+            try_remove(cache_path)
         self.obj_files.clear()
         self.symbols.clear()
+        self.link_sections = []
+        self.image = None
         self.gecko_code_metadata.clear()
     
     # Private stuff
     
-    def __compile(self, infile, flags, use_global_flags):
+    def __compile(self, infile, flags, use_global_flags, src_path=None):
+        src_path = src_path or self.src_dir+infile
         if self.compiler == Compiler.DevkitPPC:
-            args = [self.devkitppc_path+"powerpc-eabi-gcc", "-c", self.src_dir+infile, "-o", self.obj_dir+infile+".o", "-I", self.src_dir]
+            args = [self.devkitppc_path+"powerpc-eabi-gcc", "-c", src_path, "-o", self.obj_dir+infile+".o", "-I", self.src_dir]
         if self.compiler == Compiler.CodeWarrior:
-            args = [self.codewarrior_path+"mwcceppc", "-lang", "c", "-c", self.src_dir+infile, "-o", self.obj_dir+infile+".o", "-i", self.src_dir]
+            args = [self.codewarrior_path+"mwcceppc", "-lang", "c", "-c", src_path, "-o", self.obj_dir+infile+".o", "-i", self.src_dir]
+        if self.incremental:
+            args.extend(self.__depfile_args(infile, self.compiler))
         
         if use_global_flags:
             for flag in self.c_flags:
                 args.append(flag)
         for flag in flags:
             args.append(flag)
-        if self.verbose:
-            print(args)
-        subprocess.call(args)
-        self.obj_files.append((infile+".o", True))
-        return True
+        return args
     
-    def __compileplusplus(self, infile, flags, use_global_flags):
+    def __compileplusplus(self, infile, flags, use_global_flags, src_path=None):
+        src_path = src_path or self.src_dir+infile
         if self.compiler == Compiler.DevkitPPC:
-            args = [self.devkitppc_path+"powerpc-eabi-g++", "-c", self.src_dir+infile, "-o", self.obj_dir+infile+".o", "-I", self.src_dir]
+            args = [self.devkitppc_path+"powerpc-eabi-g++", "-c", src_path, "-o", self.obj_dir+infile+".o", "-I", self.src_dir]
         if self.compiler == Compiler.CodeWarrior:
-            args = [self.codewarrior_path+"mwcceppc", "-lang", "c++", "-c", self.src_dir+infile, "-o", self.obj_dir+infile+".o", "-i", self.src_dir]
+            args = [self.codewarrior_path+"mwcceppc", "-lang", "c++", "-c", src_path, "-o", self.obj_dir+infile+".o", "-i", self.src_dir]
+        if self.incremental:
+            args.extend(self.__depfile_args(infile, self.compiler))
+        args.extend(self.__pch_args)
         
         if use_global_flags:
             for flag in self.cpp_flags:
                 args.append(flag)
         for flag in flags:
             args.append(flag)
-        if self.verbose:
-            print(args)
-        subprocess.call(args)
-        self.obj_files.append((infile+".o", True))
-        return True
+        return args
+    
+    def __precompile_header(self):
+        # The precompiled header is built with the global cpp_flags and stored under a directory
+        # named after a hash of those flags and the header's contents, so it is only rebuilt when
+        # either changes.  Returns the flags that make a C++ compile use it.
+        if self.compiler == Compiler.DevkitPPC:
+            args = [self.devkitppc_path+"powerpc-eabi-g++", "-x", "c++-header", self.src_dir+self.precompiled_header, "-I", self.src_dir]
+        if self.compiler == Compiler.CodeWarrior:
+            args = [self.codewarrior_path+"mwcceppc", "-lang", "c++", "-precompile", None, self.src_dir+self.precompiled_header, "-i", self.src_dir]
+        for flag in self.cpp_flags:
+            args.append(flag)
+        headers = scan_headers_from_args(self.src_dir+self.precompiled_header, args) or [self.src_dir+self.precompiled_header]
+        pch_dir = self.obj_dir+".pch/"+fingerprint([arg for arg in args if arg], headers)+"/"
+        header = pch_dir+os.path.basename(self.precompiled_header)
+        
+        # The paths are absolute, as batched compiles run from a scratch directory.
+        if self.compiler == Compiler.DevkitPPC:
+            # GCC picks up <header>.gch in place of <header>.  The copy of the header is the fallback
+            # for sources whose own flags make the precompiled header unusable, and finds the headers
+            # next to the original through the -I.
+            output = header+".gch"
+            args.extend(("-o", output))
+            pch_args = ["-include", os.path.abspath(header), "-I", os.path.abspath(os.path.dirname(self.src_dir+self.precompiled_header))]
+        if self.compiler == Compiler.CodeWarrior:
+            output = header+".mch"
+            args[args.index(None)] = output
+            pch_args = ["-prefix", os.path.abspath(output)]
+        
+        # The copy keeps the header's mtime, since GCC's #pragma once only treats it as the same file
+        # as the one in src_dir if their sizes and mtimes match.
+        if not os.path.isfile(output):
+            os.makedirs(pch_dir, exist_ok=True)
+            shutil.copy2(self.src_dir+self.precompiled_header, header)
+            self.__run_jobs([(args, None, self.precompiled_header)])
+        else:
+            # The header may have been touched without changing, which reuses the same directory.
+            shutil.copystat(self.src_dir+self.precompiled_header, header)
+            if self.verbose:
+                print("Precompiled header unchanged, reusing {}".format(output))
+        return pch_args
     
     def __assemble(self, infile, flags, use_global_flags):
         if self.assembler == Assembler.DevkitPPC:
             args = [self.devkitppc_path+"powerpc-eabi-as", self.src_dir+infile, "-o", self.obj_dir+infile+".o", "-I", self.src_dir]
         elif self.assembler == Assembler.CodeWarrior:
             args = [self.codewarrior_path+"mwasmeppc", "-c", self.src_dir+infile, "-o", self.obj_dir+infile+".o", "-i", self.src_dir]
+        if self.incremental:
+            args.extend(self.__depfile_args(infile, self.assembler))
         
         if use_global_flags:
             for flag in self.asm_flags:
                 args.append(flag)
         for flag in flags:
             args.append(flag)
-        if self.verbose:
-            print(args)
-        subprocess.call(args)
-        self.obj_files.append((infile+".o", True))
+        return args
+    
+    def __translation_units(self, files, extension):
+        # Yields (filepath, flags, use_global_flags, src_path).  In a unity build, source files with
+        # the same flags are #included into generated sources of about unity_build_size bytes each.
+        groups = {}
+        for filepath, flags, use_global_flags, use_unity_build in files:
+            if self.unity_build and use_unity_build:
+                groups.setdefault((tuple(flags), use_global_flags), []).append(filepath)
+            else:
+                yield (filepath, flags, use_global_flags, self.src_dir+filepath)
+        
+        i = 0
+        for (flags, use_global_flags), filepaths in groups.items():
+            units = [[]]
+            unit_size = 0
+            for filepath in filepaths:
+                try:
+                    size = os.path.getsize(self.src_dir+filepath)
+                except OSError:
+                    size = 0
+                if units[-1] and unit_size + size > self.unity_build_size:
+                    units.append([])
+                    unit_size = 0
+                units[-1].append(filepath)
+                unit_size += size
+            for unit in units:
+                unit_name = "{}_unity_{}{}".format(self.project_name, i, extension)
+                text = "".join("#include \"{}\"\n".format(os.path.abspath(self.src_dir+filepath).replace("\\", "/")) for filepath in unit)
+                # Only rewrite the generated source when it changes, so incremental builds can skip it.
+                try:
+                    with open(self.obj_dir+unit_name, "r") as f:
+                        is_stale = f.read() != text
+                except OSError:
+                    is_stale = True
+                if is_stale:
+                    with open(self.obj_dir+unit_name, "w") as f:
+                        f.write(text)
+                i += 1
+                yield (unit_name, flags, use_global_flags, self.obj_dir+unit_name)
+        self.__remove_stale_units(extension, i)
+    
+    def __remove_stale_units(self, extension, count):
+        # Unity sources numbered count and up are left over from an earlier build with more of them, or
+        # with unity_build on.  They and their objects are removed so they are never linked again.
+        prefix = "{}_unity_".format(self.project_name)
+        for filename in os.listdir(self.obj_dir or "."):
+            number = filename[len(prefix):-len(extension)]
+            if filename.startswith(prefix) and filename.endswith(extension) and number.isdigit() and int(number) >= count:
+                try_remove(self.obj_dir+filename)
+                try_remove(self.obj_dir+filename+".o")
+                try_remove(self.obj_dir+filename+".d")
+                if (filename+".o", True) in self.obj_files:
+                    self.obj_files.remove((filename+".o", True))
+    
+    def __map_symbol_lines(self, sections, symbols):
+        # Section names are looked up once per section index rather than once per symbol.
+        section_names = [section.name for section in sections]
+        curr_section_name = ""
+        # Symbols defined by the linker script have no section index, and are instead absolute.
+        # Symbols we already have aren't needed in the new symbol map, so by_address filters them out.
+        for name, value, size, shndx in symbols.by_address():
+            if curr_section_name != section_names[shndx]:
+                curr_section_name = section_names[shndx]
+                yield ("\n"
+                       "{} section layout\n"
+                       "  Starting        Virtual\n"
+                       "  address  Size   address\n"
+                       "  -----------------------\n".format(curr_section_name))
+            yield "  {:08X} {:06X} {:08X}  0 {}\n".format(value - self.base_addr, size, value, name)
+    
+    def __depfile_args(self, infile, toolchain):
+        # The depfile always lands next to the object as <infile>.d
+        if toolchain == Compiler.DevkitPPC:
+            return ["-MMD", "-MF", self.obj_dir+infile+".d"]
+        if toolchain == Compiler.CodeWarrior:
+            return ["-gccdep", "-MD"]
+        if toolchain == Assembler.DevkitPPC:
+            return ["--MD", self.obj_dir+infile+".d"]
+        # mwasmeppc can't write depfiles, so those sources fall back to a scan for .include directives.
+        return []
+    
+    def __build_objects(self, jobs):
+        self.object_cache = None
+        if self.use_object_cache:
+            self.object_cache = ObjectCache(self.obj_dir+".objcache/", self.object_cache_size)
+        graph = None
+        if self.incremental:
+            graph = DependencyGraph(self.obj_dir+self.project_name+".deps")
+        
+        pending = []
+        for args, infile, src_path in jobs:
+            if graph and graph.is_up_to_date(self.obj_dir+infile+".o", args):
+                continue
+            key = None
+            if self.object_cache:
+                key = self.object_cache.key(src_path, args)
+                if self.object_cache.fetch(key, self.obj_dir+infile+".o"):
+                    if graph:
+                        graph.record(self.obj_dir+infile+".o", args, self.object_cache.headers[src_path])
+                    continue
+            # Cached objects may be hardlinked into obj_dir, so never let the toolchain write into one.
+            try_remove(self.obj_dir+infile+".o")
+            pending.append((args, infile, src_path, key))
+        
+        if pending:
+            if self.batch_compile:
+                self.__run_batched(pending)
+            else:
+                self.__run_jobs([(args, None, infile) for args, infile, src_path, key in pending])
+        
+        if graph:
+            for args, infile, src_path, key in pending:
+                try:
+                    deps = parse_depfile(self.obj_dir+infile+".d")
+                except OSError:
+                    deps = scan_headers_from_args(src_path, args) or [src_path]
+                graph.record(self.obj_dir+infile+".o", args, deps)
+            graph.save()
+            if self.verbose:
+                print("Incremental build: {} of {} objects rebuilt".format(len(pending), len(jobs)))
+        
+        if self.object_cache:
+            for args, infile, src_path, key in pending:
+                if key:
+                    self.object_cache.store(key, self.obj_dir+infile+".o")
+            self.object_cache.evict()
+            if self.verbose:
+                print(self.object_cache.stats())
         return True
     
-    def __link_project(self):
+    def __run_batched(self, pending):
+        # Translation units sharing a compiler and effective flags go through one process each.  The
+        # compiler writes <stem>.o (and <stem>.d) into a scratch directory, so a batch can't hold two
+        # sources with the same stem.  Each flag group is split into up to self.jobs batches, and units
+        # __batch_args can't batch are compiled on their own.
+        compilers = (self.devkitppc_path+"powerpc-eabi-gcc", self.devkitppc_path+"powerpc-eabi-g++", self.codewarrior_path+"mwcceppc")
+        groups = {}
+        jobs = []
+        for args, infile, src_path, key in pending:
+            batch_args = self.__batch_args(args, infile, src_path) if args[0] in compilers else None
+            if batch_args:
+                groups.setdefault(tuple(batch_args), []).append((infile, src_path))
+            else:
+                jobs.append((args, None, infile))
+        
+        batches = []
+        for batch_args, infiles in groups.items():
+            chunks = [[] for i in range(min(len(infiles), max(1, self.jobs)))]
+            for infile, src_path in infiles:
+                stem = os.path.splitext(os.path.basename(src_path))[0]
+                for chunk in sorted(chunks, key=len):
+                    if all(os.path.splitext(os.path.basename(other))[0] != stem for other_infile, other in chunk):
+                        chunk.append((infile, src_path))
+                        break
+                else:
+                    chunks.append([(infile, src_path)])
+            for chunk in chunks:
+                if chunk:
+                    batch_dir = tempfile.mkdtemp(prefix=".batch", dir=self.obj_dir or ".")
+                    batches.append((batch_dir, chunk))
+                    jobs.append((list(batch_args) + [os.path.abspath(src_path) for infile, src_path in chunk], batch_dir, ", ".join(infile for infile, src_path in chunk)))
+        
+        try:
+            self.__run_jobs(jobs)
+            for batch_dir, chunk in batches:
+                for infile, src_path in chunk:
+                    stem = os.path.splitext(os.path.basename(src_path))[0]
+                    os.replace(os.path.join(batch_dir, stem+".o"), self.obj_dir+infile+".o")
+                    if os.path.isfile(os.path.join(batch_dir, stem+".d")):
+                        os.replace(os.path.join(batch_dir, stem+".d"), self.obj_dir+infile+".d")
+        finally:
+            for batch_dir, chunk in batches:
+                shutil.rmtree(batch_dir, ignore_errors=True)
+    
+    def __batch_args(self, args, infile, src_path):
+        # Strip the per-file source, output and depfile arguments.  Batches run from a scratch
+        # directory, so the paths include flags take are made absolute.  Returns None if any other
+        # argument, or the part of one after "=" or "@", names a relative path, as it is unknown
+        # whether the toolchain would take it as one, so the unit has to be compiled on its own.
+        per_file = (src_path, self.obj_dir+infile+".o", self.obj_dir+infile+".d")
+        path_flags = QuoteDirFlags + IncludeDirFlags + IncludeFileFlags
+        batch_args = [args[0]]
+        prev = None
+        for arg in args[1:]:
+            if arg in ("-o", "-MF") or arg in per_file:
+                pass
+            elif prev in path_flags:
+                batch_args.append(os.path.abspath(arg))
+            elif arg in path_flags or arg in ("-I-", "-i-"):
+                batch_args.append(arg)
+            elif arg.startswith(JoinedIncludeFlags):
+                flag = next(flag for flag in JoinedIncludeFlags if arg.startswith(flag))
+                batch_args.append(flag+os.path.abspath(arg[len(flag):]))
+            else:
+                value = arg.split("=", 1)[-1] if arg.startswith("-") else arg[1:] if arg.startswith("@") else arg
+                if value and not os.path.isabs(value) and os.path.exists(value):
+                    return None
+                batch_args.append(arg)
+            prev = arg
+        return batch_args
+    
+    def __run_jobs(self, jobs):
+        # Run (args, cwd, label) toolchain invocations concurrently, at most self.jobs at a time.  The first non-zero
+        # exit code stops any further jobs from being started and terminates the ones in flight.
+        lock = threading.Lock()
+        processes = set()
+        failures = []
+        futures = []
+        
+        def run(args, cwd, label):
+            with lock:
+                if failures:
+                    return
+                if self.verbose:
+                    print(args)
+                if self.__uses_wine(args):
+                    process = subprocess.Popen(self.wine_server.wrap(args), cwd=cwd, env=self.wine_server.env())
+                else:
+                    process = subprocess.Popen(args, cwd=cwd)
+                processes.add(process)
+                start = time.perf_counter()
+            self.__wait_process(process)
+            with lock:
+                # Reaped under the lock, so no other job can signal the process once its pid is free for reuse.
+                returncode, cpu_time = self.__reap_process(process)
+                processes.discard(process)
+                if returncode != 0 and not failures:
+                    failures.append("{} exited with code {}".format(os.path.basename(args[0]), returncode))
+                    for future in futures:
+                        future.cancel()
+                    for other in processes:
+                        if other.returncode is None:
+                            other.terminate()
+            if self.trace:
+                self.trace.add_span(label, "compile", start, time.perf_counter(), cpu_time, tool=os.path.basename(args[0]), returncode=returncode)
+        
+        if any(self.__uses_wine(args) for args, cwd, label in jobs):
+            self.wine_server.start()
+        
+        with ThreadPoolExecutor(max_workers=max(1, self.jobs)) as executor:
+            with lock:
+                futures.extend(executor.submit(run, args, cwd, label) for args, cwd, label in jobs)
+            wait(futures)
+            for future in futures:
+                if not future.cancelled():
+                    future.result()
+        if failures:
+            raise RuntimeError(failures[0])
+        return True
+    
+    def __wait_process(self, process):
+        # Waits for the process to exit, but leaves it to __reap_process to reap it where waitid allows.
+        if hasattr(os, "waitid"):
+            os.waitid(os.P_PID, process.pid, os.WEXITED | os.WNOWAIT)
+        else:
+            process.wait()
+    
+    def __reap_process(self, process):
+        # Returns the exit code and, when tracing on a platform with wait4, the child's CPU time.  A process
+        # that exited just as terminate was called has already been reaped by terminate's poll.
+        if self.trace is None or not hasattr(os, "wait4") or process.returncode is not None:
+            return (process.wait(), 0.0)
+        pid, status, rusage = os.wait4(process.pid, 0)
+        process.returncode = -os.WTERMSIG(status) if os.WIFSIGNALED(status) else os.WEXITSTATUS(status)
+        return (process.returncode, rusage.ru_utime + rusage.ru_stime)
+    
+    def __span(self, name, category="build", **args):
+        if self.trace is None:
+            return nullcontext()
+        return self.trace.span(name, category, **args)
+    
+    def __check_overlaps(self, plan):
+        with self.__span("check_overlaps", count=len(plan)):
+            overlaps = plan.overlaps()
+        if not overlaps:
+            return
+        lines = ["{:08X} ({} bytes): {} overwrites {}".format(address, size, second_origin, first_origin)
+                 for address, size, first_origin, second_origin in overlaps]
+        if self.strict_overlaps:
+            raise RuntimeError("Patches overlap!\n" + "\n".join(lines))
+        for line in lines:
+            print("WARNING!  Patches overlap at " + line)
+    
+    def __emit_dol(self, dol, classified_codes, datablob, in_dol_path, out_dol_path):
+        new_section = self.__patch_dol(dol, classified_codes, datablob)[0]
+        
+        with self.__span("save_dol"):
+            # An osarena patcher writes to the DOL directly, so its DOLs are compared block by block.
+            if self.osarena_patcher:
+                written, is_full = save_dol(dol, out_dol_path, self.incremental_output)
+            else:
+                written, is_full = save_dol(dol, out_dol_path, self.incremental_output,
+                                            self.patch_plan, in_dol_path, new_section)
+        if self.verbose and self.incremental_output:
+            print("{}: {} bytes written{}".format(out_dol_path, written, "" if is_full else " in place"))
+    
+    def __patch_dol(self, dol, classified_codes, datablob, record_osarena=False):
+        # Hooks and Gecko Codes are recorded into a patch plan first, which is then written to the DOL in as few writes as possible.
+        # Returns the appended section (or None), and with record_osarena, the plan of the OSArena patcher's writes.
+        plan = PatchPlan()
+        if self.flat_image:
+            with self.__span("flat_image"):
+                target = DolImage(dol)
+        else:
+            target = dol
+        recorder = PatchRecorder(target, plan)
+        with self.__span("apply_gecko"):
+            for gecko_code, status, unsupported_commands in classified_codes:
+                print("[GeckoCode]   {:12s} ${}".format(status, gecko_code.name))
+                if status == "OMITTED":
+                    print("Includes unsupported codetypes:")
+                    for gecko_command in unsupported_commands:
+                        print(gecko_command)
+                
+                vaddress = self.base_addr + len(datablob)
+                geckoblob = bytearray()
+                gecko_command_metadata = []
+                
+                for gecko_command in gecko_code:
+                    if gecko_command.codetype == GeckoCommand.Type.ASM_INSERT \
+                    or gecko_command.codetype == GeckoCommand.Type.ASM_INSERT_XOR:
+                        if status == "UNUSED" \
+                        or status == "OMITTED":
+                            gecko_command_metadata.append((0, len(gecko_command.value), status, gecko_command))
+                        else:
+                            recorder.origin = "GeckoCode ${}".format(gecko_code.name)
+                            recorder.seek(gecko_command._address | 0x80000000)
+                            write_branch(recorder, vaddress + len(geckoblob))
+                            gecko_command_metadata.append((vaddress + len(geckoblob), len(gecko_command.value), status, gecko_command))
+                            geckoblob += gecko_command.value[:-4]
+                            geckoblob += assemble_branch(vaddress + len(geckoblob), gecko_command._address + 4 | 0x80000000)
+                datablob += geckoblob
+                if gecko_command_metadata:
+                    self.gecko_code_metadata.append((vaddress, len(geckoblob), status, gecko_code, gecko_command_metadata))
+            for gecko_code in self.gecko_codetable:
+                recorder.origin = "GeckoCode ${}".format(gecko_code.name)
+                gecko_code.apply(recorder)
+        
+        with self.__span("apply_hooks", count=len(self.hook_table) + len(self.hooks)):
+            # Symbol hooks are resolved and encoded together, then applied in declaration order along
+            # with the string, file, and custom hooks.
+            self.__check_hook_symbols()
+            self.hook_table.resolve(self.symbols)
+            for start, end, hook in self.__hooks_in_order():
+                self.hook_table.apply(recorder, start, end)
+                if self.verbose:
+                    for row in range(start, end):
+                        print(self.hook_table.dump_info(row))
+                if hook is not None:
+                    hook.resolve(self.symbols)
+                    recorder.origin = hook.origin()
+                    hook.apply_dol(recorder)
+                    if self.verbose:
+                        print(hook.dump_info())
+        
+        self.__check_overlaps(plan)
+        with self.__span("apply_patches", count=len(plan)):
+            writes = plan.apply(target)
+            if self.flat_image:
+                target.commit()
+        self.patch_plan = plan
+        if self.verbose:
+            print("Patch plan: {} patches written to the DOL in {} writes".format(len(plan), writes))
+        
+        new_section = None
+        osarena_plan = PatchPlan()
+        if len(datablob) > 0:
+            if len(dol.textSections) <= DolFile.MaxTextSections:
+                new_section = TextSection(self.base_addr, datablob)
+            elif len(dol.dataSections) <= DolFile.MaxDataSections:
+                new_section = DataSection(self.base_addr, datablob)
+            else:
+                raise RuntimeError("DOL is full!  Cannot allocate any new sections.")
+            dol.append_section(new_section)
+            
+            if self.osarena_patcher:
+                if record_osarena:
+                    recorder = PatchRecorder(dol, osarena_plan)
+                    recorder.origin = "OSArena patcher"
+                    self.osarena_patcher(recorder, self.base_addr + len(datablob))
+                    osarena_plan.apply(dol)
+                else:
+                    self.osarena_patcher(dol, self.base_addr + len(datablob))
+        return (new_section, osarena_plan)
+    
+    def __prepare_dol(self, in_dol_path):
+        # Loading the DOL and Gecko Codes doesn't depend on the toolchain, so those stages run while
+        # the sources compile.  Linking waits for both the objects and the base address.
+        stages = StageGraph()
+        stages.add("dol", self.__stage("dol", lambda: self.__load_dol(in_dol_path)))
+        stages.add("gecko", self.__stage("gecko", self.__classify_gecko_codes))
+        stages.add("compile", self.__stage("compile", self.__compile_project))
+        stages.add("base_addr", self.__stage("base_addr", self.__resolve_base_addr), "dol")
+        stages.add("link", self.__stage("link", self.__link_and_process), "compile", "base_addr")
+        stages.run()
+        
+        datablob = bytearray()
+        if stages.result("link") == True:
+            # Padded and appended to by __patch_dol, so it is a copy; self.image stays the linked image.
+            datablob = self.image + bytes(-len(self.image) % 4)
+        return (stages.result("dol"), stages.result("gecko"), datablob)
+    
+    def __gecko_text(self, datablob):
+        # Returns the Gecko Code List build_gecko writes, and the patch plan of everything in it.
+        f = io.StringIO()
+        # Record what every Gecko Code, the program data, and every hook would write, to find overlaps.
+        plan = PatchPlan()
+        recorder = PatchRecorder(None, plan)
+        for gecko_code in self.gecko_codetable:
+            recorder.origin = "GeckoCode ${}".format(gecko_code.name)
+            gecko_code.apply(recorder)
+            # The codehandler writes a branch over the instruction that C2/F2 codetypes replace.
+            if gecko_code.is_enabled():
+                for gecko_command in gecko_code:
+                    if gecko_command.codetype == GeckoCommand.Type.ASM_INSERT \
+                    or gecko_command.codetype == GeckoCommand.Type.ASM_INSERT_XOR:
+                        plan.add(gecko_command._address | 0x80000000, bytes(4), recorder.origin)
+        if datablob:
+            plan.add(self.base_addr, datablob, "Program Data")
+        self.__check_hook_symbols()
+        self.hook_table.resolve(self.symbols)
+        for start, end, hook in self.__hooks_in_order():
+            self.hook_table.apply(recorder, start, end)
+            if hook is not None:
+                hook.resolve(self.symbols)
+                recorder.origin = hook.origin()
+                hook.apply_dol(recorder)
+        self.__check_overlaps(plan)
+        
+        f.write("[Gecko]\n")
+        # Everything gets shoved into a large Gecko Code named after the project
+        f.write("${}\n".format(self.project_name))
+        # Copy existing Gecko Codes
+        for gecko_code in self.gecko_codetable:
+            if gecko_code.is_enabled():
+                f.write("* {}\n".format(gecko_code.name))
+                f.write("{}\n".format(gecko_code.as_text()))
+            print("[GeckoCode]   {:12s} ${}".format("ENABLED" if gecko_code.is_enabled() else "DISABLED", gecko_code.name))
+        # Create Program Data megacode
+        if datablob:
+            gecko_command = WriteString(datablob, self.base_addr)
+            f.write("* Program Data\n")
+            f.write(gecko_command.as_text() + "\n")
+        # Create Hooks
+        f.write("* Hooks\n")
+        for start, end, hook in self.__hooks_in_order():
+            self.hook_table.write_geckocommands(f, self.symbols, start, end)
+            if self.verbose:
+                for row in range(start, end):
+                    print(self.hook_table.dump_info(row))
+            if hook is not None:
+                hook.write_geckocommand(f)
+                if self.verbose:
+                    print(hook.dump_info())
+        return (f.getvalue(), plan)
+    
+    def __write_output(self, name, path, mode, data):
+        with self.__span(name), open(path, mode) as f:
+            f.write(data)
+    
+    def __hooks_in_order(self):
+        # Yields (start, end, hook): the range of hook_table rows declared before each hook in hooks,
+        # then that hook.  Hooks added to hooks directly count as declared after every row so far.
+        # The last range has no hook.
+        start = 0
+        for i, hook in enumerate(self.hooks):
+            end = max(start, self.__hook_rows[i]) if i < len(self.__hook_rows) else len(self.hook_table)
+            yield (start, end, hook)
+            start = end
+        yield (start, len(self.hook_table), None)
+    
+    def __hook_cache_path(self, filepath):
+        # Named after the manifest's full path, so manifests with the same name in different folders
+        # get their own cache.
+        path_hash = hashlib.blake2b(os.path.abspath(filepath).encode(), digest_size=8).hexdigest()
+        return "{}{}.{}.hookcache".format(self.obj_dir, os.path.basename(filepath), path_hash)
+    
+    def __check_hook_symbols(self):
+        undefined = self.hook_table.undefined_symbols(self.symbols)
+        if undefined:
+            print("WARNING!  Hooks reference {} undefined symbols: {}".format(len(undefined), ", ".join(undefined)))
+    
+    def __stage(self, name, function):
+        # Wraps a StageGraph stage so its wall and CPU time land in the trace
+        def run(*args):
+            with self.__span(name, "stage"):
+                return function(*args)
+        return run
+    
+    def __uses_wine(self, args):
+        return self.wine_server is not None and args[0] in (self.codewarrior_path+"mwcceppc", self.codewarrior_path+"mwasmeppc")
+    
+    def __link_args(self):
         if self.base_addr == None:
             raise RuntimeError("Base address not set!  New code cannot be linked.")
         
@@ -661,54 +1282,185 @@ class Project(object):
             args.extend(("-Map", self.obj_dir+self.project_name+".map"))
         for flag in self.linker_flags:
             args.append(flag)
+        return args
+    
+    def __link_project(self):
+        args = self.__link_args()
         if self.verbose:
             print(args)
-        subprocess.call(args)
+        returncode = subprocess.call(args)
+        if returncode != 0:
+            raise RuntimeError("{} exited with code {}".format(os.path.basename(args[0]), returncode))
         return True
     
+    def __link_fingerprint(self):
+        filepaths = [self.obj_dir+filename for filename, do_cleanup in self.obj_files]
+        filepaths.extend(self.linker_script_files)
+        return fingerprint(self.__link_args(), filepaths)
+    
+    def __load_link_state(self, fingerprint):
+        # Reuse the previous link if none of its inputs have changed.
+        if not os.path.isfile(self.obj_dir+self.project_name+".o"):
+            return False
+        try:
+            with open(self.obj_dir+self.project_name+".link", "r") as f:
+                state = json.load(f)
+        except (OSError, ValueError):
+            return False
+        if state.get("fingerprint") != fingerprint:
+            return False
+        if self.verbose:
+            print("Link inputs unchanged, reusing {}".format(self.obj_dir+self.project_name+".o"))
+        return True
+    
+    def __save_link_state(self, fingerprint):
+        with open(self.obj_dir+self.project_name+".link", "w") as f:
+            json.dump({"fingerprint": fingerprint}, f)
+    
     def __process_project(self):
+        self.link_sections, symbols = self.__read_link_results()
+        self.image = self.__load_image(self.link_sections)
+        # Force _SDA_BASE_ and _SDA2_BASE_ to exist.  The compiler doesn't reliably make them available.
+        symbols.add("_SDA_BASE_", self.sda_base, 0, SHN_ABS)
+        symbols.add("_SDA2_BASE_", self.sda2_base, 0, SHN_ABS)
+        self.symbols = symbols
+        return True
+    
+    def __read_link_results(self):
+        # Returns the section headers and global symbols of project.o.  They are cached by its hash,
+        # so the ELF's symbol table only has to be decoded again when the link output changes.
+        obj_path = self.obj_dir+self.project_name+".o"
+        link_cache_path = self.obj_dir+self.project_name+".linkcache"
+        key = hash_file(obj_path)
+        cached = load_link_cache(link_cache_path, key)
+        if cached:
+            if self.verbose:
+                print("Symbol table loaded from {}".format(link_cache_path))
+            return cached
+        with open_elf(obj_path, self.use_pyelftools) as elf:
+            sections = elf.sections
+            symbols = SymbolTable()
+            # Filter out worthless symbols, as well as STT_SECTION and STT_FILE type symbols.
+            for iter in elf.symbols(skip_local=True):
+                symbols.add(iter.name, iter.value, iter.size, iter.shndx)
+        save_link_cache(link_cache_path, key, sections, symbols)
+        return (sections, symbols)
+    
+    def __load_image(self, sections):
+        # Flatten the sections with the SHF_ALLOC attribute into one buffer, sized up front from the section headers.
+        sections = [iter for iter in sections if iter.flags & SHF_ALLOC and iter.size]
+        for iter in sections:
+            if iter.addr < self.base_addr:
+                raise RuntimeError("Section {} at {:08X} is below base_addr {:08X}".format(iter.name, iter.addr, self.base_addr))
+        image = bytearray(max((iter.addr - self.base_addr + iter.size for iter in sections), default=0))
+        view = memoryview(image)
         with open(self.obj_dir+self.project_name+".o", 'rb') as f:
-            elf = ELFFile(f)
+            for iter in sections:
+                # .bss and friends take up space, but are already zeroed.
+                if iter.type != SHT_NOBITS:
+                    offset = iter.addr - self.base_addr
+                    f.seek(iter.offset)
+                    f.readinto(view[offset:offset+iter.size])
+        view.release()
+        if self.write_bin:
             with open(self.obj_dir+self.project_name+".bin", "wb") as bin:
-                for iter in elf.iter_sections():
-                    # Filter out sections without SHF_ALLOC attribute
-                    if iter.header["sh_flags"] & 0x2:
-                        bin.seek(iter.header["sh_addr"] - self.base_addr)
-                        bin.write(iter.data())
-            
-            symtab = elf.get_section_by_name(".symtab")
-            for iter in symtab.iter_symbols():
-                #print("{}   {}".format(iter.name, iter.entry))
-                # Filter out worthless symbols, as well as STT_SECTION and STT_FILE type symbols.
-                if iter.entry['st_info']['bind'] == "STB_LOCAL":
-                    #print("{}   {}".format(iter.name, iter.entry))
-                    continue
-                self.symbols[iter.name] = iter.entry
-            # Force _SDA_BASE_ and _SDA2_BASE_ to exist.  The compiler doesn't reliably make them available.
-            self.symbols["_SDA_BASE_"] = {'st_name': 0, 'st_value': self.sda_base, 'st_size': 0, 'st_info': {'bind': 'STB_LOCAL', 'type': 'STT_OBJECT'}, 'st_other': {'visibility': 'STV_DEFAULT'}, 'st_shndx': 'SHN_ABS'}
-            self.symbols["_SDA2_BASE_"] = {'st_name': 0, 'st_value': self.sda2_base, 'st_size': 0, 'st_info': {'bind': 'STB_LOCAL', 'type': 'STT_OBJECT'}, 'st_other': {'visibility': 'STV_DEFAULT'}, 'st_shndx': 'SHN_ABS'}
-        return True
+                bin.write(image)
+        return image
+    
+    def __load_dol(self, in_dol_path):
+        if self.use_dol_cache:
+            return dol_cache.load(in_dol_path)
+        with open(in_dol_path, "rb") as f:
+            return DolFile(f)
+    
+    def __resolve_base_addr(self, dol):
+        if self.base_addr == None:
+            self.base_addr = (find_rom_end(dol) + 31) & 0xFFFFFFE0
+            print("Base address auto-set from ROM end: {0:X}\n"
+                  "Do not rely on this feature if your DOL uses .sbss2\n".format(self.base_addr))
+        
+        if self.base_addr % 32:
+            print("WARNING!  DOL sections must be 32-byte aligned for OSResetSystem to work properly!\n")
+        return self.base_addr
+    
+    def __load_gecko_files(self):
+        for filepath, is_binary in self.gecko_files:
+            if is_binary:
+                with open(filepath, "rb") as f:
+                    code_table = GeckoCodeTable.from_bytes(f)
+                self.gecko_codetable.append(code_table)
+            else:
+                with open(filepath, "r") as f:
+                    gecko_codetable = GeckoCodeTable.from_text(f)
+                for gecko_code in gecko_codetable:
+                    self.gecko_codetable.add_child(gecko_code)
+        self.gecko_files.clear()
+        return self.gecko_codetable
+    
+    def __classify_gecko_codes(self):
+        # Returns (gecko_code, status, unsupported_commands) for every Gecko Code in the project.
+        classified = []
+        for gecko_code in self.__load_gecko_files():
+            status = "ENABLED" if gecko_code.is_enabled() else "DISABLED"
+            unsupported_commands = []
+            if gecko_code.is_enabled() == True:
+                for gecko_command in gecko_code:
+                    if gecko_command.codetype not in SupportedGeckoCodetypes:
+                        unsupported_commands.append(gecko_command)
+                        status = "OMITTED"
+            classified.append((gecko_code, status, unsupported_commands))
+        return classified
     
     def __build_project(self):
+        return self.__link_and_process(self.__compile_project())
+    
+    def __compile_project(self):
+        if self.__shared_objects is not None:
+            return self.__shared_objects
         os.makedirs("./" + self.src_dir, exist_ok=True)
         os.makedirs("./" + self.obj_dir, exist_ok=True)
         is_built = False
-        is_linked = False
-        is_processed = False
         
-        for filepath, flags, use_global_flags in self.c_files:
-            is_built |= self.__compile(filepath, flags, use_global_flags)
+        self.__pch_args = []
+        if self.precompiled_header and self.cpp_files:
+            self.__pch_args = self.__precompile_header()
         
-        for filepath, flags, use_global_flags in self.cpp_files:
-            is_built |= self.__compileplusplus(filepath, flags, use_global_flags)
+        jobs = []
+        for filepath, flags, use_global_flags, src_path in self.__translation_units(self.c_files, ".c"):
+            jobs.append((self.__compile(filepath, flags, use_global_flags, src_path), filepath, src_path))
+        
+        for filepath, flags, use_global_flags, src_path in self.__translation_units(self.cpp_files, ".cpp"):
+            jobs.append((self.__compileplusplus(filepath, flags, use_global_flags, src_path), filepath, src_path))
         
         for filepath, flags, use_global_flags in self.asm_files:
-            is_built |= self.__assemble(filepath, flags, use_global_flags)
+            jobs.append((self.__assemble(filepath, flags, use_global_flags), filepath, self.src_dir+filepath))
+        
+        if jobs:
+            is_built |= self.__build_objects(jobs)
+            # Objects are listed in source order regardless of which job finished first.
+            for args, filepath, src_path in jobs:
+                if (filepath+".o", True) not in self.obj_files:
+                    self.obj_files.append((filepath+".o", True))
+        return is_built
+    
+    def __link_and_process(self, is_built, base_addr=None):
+        is_linked = False
+        is_processed = False
         
         if is_built == True:
-            is_linked |= self.__link_project()
+            link_fingerprint = self.__link_fingerprint()
+            is_reused = self.__load_link_state(link_fingerprint)
+            if is_reused:
+                is_linked = True
+            else:
+                with self.__span("link_project"):
+                    is_linked |= self.__link_project()
         if is_linked == True:
-            is_processed |= self.__process_project()
+            with self.__span("process_project"):
+                is_processed |= self.__process_project()
+            # Only a link that succeeded and was read back is worth reusing.
+            if is_processed and not is_reused:
+                self.__save_link_state(link_fingerprint)
         
         return is_processed
     
@@ -775,7 +1527,7 @@ class Project(object):
             print("\"branch\" is a deprecated method.  Please use \"hook_branch\" instead")
             self.message_flags[3] = True
         self.hook_branch(addr, funcname)
-        
+    
     def apply_gecko(self, geckopath):
         if not self.message_flags[4]:
             print("\"apply_gecko\" is a deprecated method.  Please use \"add_gecko_txt_file\" instead.")
@@ -786,3 +1538,23 @@ class Project(object):
         if not self.message_flags[5]:
             print("\"build\" is a deprecated method.  Please use \"build_dol\" instead.  Unfortunately, this method has no suitable redirect, so nothing can been done.")
             self.message_flags[5] = True
+
+def build_target(project, index, target):
+    # Runs in a build_targets worker process.  target is (in_dol_path, base_addr, linker_script_files,
+    # out_dol_path), optionally followed by the path of a hook manifest used for this target only.
+    start = time.perf_counter()
+    in_dol_path, base_addr, linker_script_files, out_dol_path = target[:4]
+    project.base_addr = base_addr
+    project.linker_script_files = project.linker_script_files + list(linker_script_files)
+    # Every target links to its own <project_name>_<index>.o, so the link reuse check works per target.
+    project.project_name = "{}_{}".format(project.project_name, index)
+    if len(target) > 4 and target[4]:
+        project.load_hooks(target[4])
+    project.build_dol(in_dol_path, out_dol_path)
+    return {"out_dol_path": out_dol_path,
+            "base_addr": project.base_addr,
+            # The linked program data, before padding and Gecko Codes are added to the DOL's copy
+            "size": len(project.image) if project.image else 0,
+            "patches": len(project.patch_plan) if project.patch_plan else 0,
+            "elapsed": time.perf_counter() - start,
+            "trace_events": project.trace.events if project.trace else None}
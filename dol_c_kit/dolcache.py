@@ -0,0 +1,86 @@
+import io
+import os
+import threading
+
+from dolreader.dol import DolFile
+from dolreader.section import TextSection, DataSection
+
+from dol_c_kit.buildcache import hash_file
+
+class SharedSection(object):
+    # For sections whose BytesIO was made from a cached bytes object.  CPython's BytesIO shares that
+    # object until the first write, but getbuffer() would copy it, so the size is found by seeking.
+    @property
+    def size(self):
+        position = self.data.tell()
+        size = self.data.seek(0, io.SEEK_END)
+        self.data.seek(position)
+        return size
+
+class SharedTextSection(SharedSection, TextSection):
+    pass
+
+class SharedDataSection(SharedSection, DataSection):
+    pass
+
+class CachedDol(object):
+    # The parsed contents of an input DOL, kept as immutable bytes per section
+    def __init__(self, filepath, stat, digest):
+        self.mtime_ns = stat.st_mtime_ns
+        self.file_size = stat.st_size
+        self.digest = digest
+        with open(filepath, "rb") as f:
+            dol = DolFile(f)
+        self.text_sections = [(section.address, section.offset, section.data.getvalue()) for section in dol.textSections]
+        self.data_sections = [(section.address, section.offset, section.data.getvalue()) for section in dol.dataSections]
+        self.bss_address = dol.bssAddress
+        self.bss_size = dol.bssSize
+        self.entry_point = dol.entryPoint
+    
+    def view(self):
+        # A new DolFile whose sections share the cached bytes.  Only sections that get written to are
+        # copied, so every build can patch its view freely.
+        dol = DolFile()
+        dol.textSections = [SharedTextSection(address, io.BytesIO(data), offset) for address, offset, data in self.text_sections]
+        dol.dataSections = [SharedDataSection(address, io.BytesIO(data), offset) for address, offset, data in self.data_sections]
+        dol.bssAddress = self.bss_address
+        dol.bssSize = self.bss_size
+        dol.entryPoint = self.entry_point
+        dol._currLogicAddr = dol.firstSection.address
+        dol.seek(dol._currLogicAddr)
+        return dol
+
+class DolCache(object):
+    # Parsed input DOLs, keyed by path.  An entry is reused while the file's mtime and size are
+    # unchanged, or if it was touched but its hash is still the same.
+    def __init__(self):
+        self.entries = {}
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+    
+    def load(self, filepath):
+        key = os.path.abspath(filepath)
+        stat = os.stat(filepath)
+        with self.lock:
+            cached = self.entries.get(key)
+            digest = None
+            if cached is not None and (cached.mtime_ns, cached.file_size) != (stat.st_mtime_ns, stat.st_size):
+                digest = hash_file(filepath)
+                if cached.digest == digest:
+                    cached.mtime_ns, cached.file_size = stat.st_mtime_ns, stat.st_size
+                else:
+                    cached = None
+            if cached is None:
+                cached = CachedDol(filepath, stat, digest or hash_file(filepath))
+                self.entries[key] = cached
+                self.misses += 1
+            else:
+                self.hits += 1
+        return cached.view()
+    
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+
+dol_cache = DolCache()
@@ -0,0 +1,88 @@
+import struct
+
+from dolreader.dol import UnmappedAddressError
+
+class DolImage(object):
+    # The sections of a DolFile laid out in one flat bytearray from 0x80000000 to the end of the highest
+    # section, with a parallel bytearray naming the section that owns each byte (0 for unmapped bytes).
+    # Mapped checks are a single lookup and writes are slice assignments.  Nothing reaches the DolFile
+    # until commit, which copies the sections that were written back into it.
+    def __init__(self, dol):
+        self.sections = sorted(dol.sections, key=lambda section: section.address)
+        if len(self.sections) > 255:
+            raise RuntimeError("Too many sections for a DolImage")
+        self.base = min([0x80000000] + [section.address for section in self.sections])
+        end = max([self.base] + [section.address + section.size for section in self.sections])
+        self.image = bytearray(end - self.base)
+        self.owners = bytearray(end - self.base)
+        for i, section in enumerate(self.sections):
+            start = section.address - self.base
+            # getvalue, unlike getbuffer, doesn't copy a section that shares a cached DOL's bytes.
+            self.image[start:start+section.size] = section.data.getvalue()
+            self.owners[start:start+section.size] = bytes((i + 1,)) * section.size
+        self.dirty = set()
+        self.__address = 0
+    
+    def find(self, address):
+        # The same as SectionIndex.find: the index of the section holding an address, or None
+        offset = address - self.base
+        if 0 <= offset < len(self.owners) and self.owners[offset]:
+            return self.owners[offset] - 1
+        return None
+    
+    def is_mapped(self, address):
+        return self.find(address) is not None
+    
+    def seek(self, where, whence=0):
+        if whence == 1:
+            where += self.__address
+        elif whence != 0:
+            raise NotImplementedError("Unsupported whence type '{}'".format(whence))
+        if not self.is_mapped(where):
+            raise UnmappedAddressError("Unmapped address: 0x{:X}".format(where))
+        self.__address = where
+    
+    def tell(self):
+        return self.__address
+    
+    def write(self, data):
+        i = self.find(self.__address)
+        if i is None:
+            raise UnmappedAddressError("Unmapped address: 0x{:X}".format(self.__address))
+        if len(data) > 0 and self.find(self.__address + len(data) - 1) != i:
+            raise UnmappedAddressError("Write goes over current section")
+        offset = self.__address - self.base
+        self.image[offset:offset+len(data)] = data
+        self.dirty.add(i)
+        self.__address += len(data)
+    
+    def write_run(self, address, data):
+        # Writes bytes that may span several adjacent sections, as PatchPlan.apply does.
+        offset = address - self.base
+        if offset < 0 or offset + len(data) > len(self.owners) or self.owners.find(0, offset, offset + len(data)) != -1:
+            raise UnmappedAddressError("Unmapped address in 0x{:X}-0x{:X}".format(address, address + len(data)))
+        self.image[offset:offset+len(data)] = data
+        self.dirty.update(owner - 1 for owner in set(self.owners[offset:offset+len(data)]))
+    
+    def write_uint32(self, address, value):
+        self.seek(address)
+        self.write(struct.pack(">I", value))
+    
+    def write_uint16(self, address, value):
+        self.seek(address)
+        self.write(struct.pack(">H", value))
+    
+    def insert_branch(self, to, _from, lk=False):
+        _from &= 0xFFFFFFFC
+        to &= 0xFFFFFFFC
+        self.seek(_from)
+        self.write(struct.pack(">I", (to - _from) & 0x3FFFFFD | 0x48000000 | (1 if lk else 0)))
+    
+    def commit(self):
+        # Copies every section that was written back into its DolFile section, once.
+        for i in sorted(self.dirty):
+            section = self.sections[i]
+            start = section.address - self.base
+            section.data.seek(0)
+            section.data.write(self.image[start:start+section.size])
+        self.dirty.clear()
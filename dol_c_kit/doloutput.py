@@ -0,0 +1,223 @@
+import hashlib
+import io
+import json
+import mmap
+import os
+import struct
+import sys
+from array import array
+
+from dol_c_kit.buildcache import try_remove
+from dol_c_kit.dolpatch import dol_header, DolHeaderSize
+from dol_c_kit.patch import SectionIndex, diff_runs
+
+DolStateBlockSize = 4096
+# The file offsets, addresses, and sizes of all 18 sections.  The BSS and entry point fields follow.
+DolSectionTableSize = 0xD8
+# The state of an incrementally saved DOL, all big-endian: a header with the output file's size and
+# mtime, the input DOL's size and mtime, the hash of the appended section, the number of patch runs,
+# and the size of the input DOL's path.  Then the DOL header, the run addresses, the run sizes, the
+# bytes of every run, and the input DOL's path.
+DolStateMagic = b"DCKSTAT\x01"
+DolStateHeader = struct.Struct(">8sQQQQ20sII")
+
+def block_hashes(data, block_size=DolStateBlockSize):
+    return [hashlib.blake2b(data[offset:offset+block_size], digest_size=8).hexdigest()
+            for offset in range(0, len(data), block_size)]
+
+def save_dol(dol, out_dol_path, incremental=False, plan=None, in_dol_path=None, new_section=None):
+    # Saves a DolFile.  Returns (bytes written, whether it was a full save).  In incremental mode, if
+    # the patch plan, input DOL, and appended section the DolFile was built from are given, the next
+    # save diffs its plan against this one and only rewrites the ranges that changed, the appended
+    # section if it changed, and the header, in place through an mmap.  Otherwise, such as when an
+    # osarena patcher wrote to the DOL outside of the plan, the saved file is hashed in blocks instead.
+    # The whole file is saved if the state is missing, the file was changed by anything else, the input
+    # DOL changed, or the section table moved.
+    if not incremental:
+        with open(out_dol_path, "wb") as f:
+            dol.save(f)
+        return (os.path.getsize(out_dol_path), True)
+    if plan is None or in_dol_path is None:
+        try_remove(out_dol_path + ".state")
+        return save_dol_blocks(dol, out_dol_path)
+    
+    try_remove(out_dol_path + ".blocks")
+    state_path = out_dol_path + ".state"
+    header = dol_header(dol)
+    appended = new_section.data.getvalue() if new_section is not None else b""
+    digest = hashlib.blake2b(appended, digest_size=20).digest()
+    in_stat = os.stat(in_dol_path)
+    runs = plan.runs()
+    packed = pack_runs(runs)
+    state = load_dol_state(state_path)
+    written = None
+    if state is not None:
+        written = update_dol_from_plan(dol, out_dol_path, state, in_dol_path, in_stat, header, runs, packed,
+                                       new_section, appended, digest)
+    is_full = written is None
+    if is_full:
+        with open(out_dol_path, "wb") as f:
+            dol.save(f)
+        written = dol.size
+    # If nothing was written, the state is still the same.
+    if written:
+        save_dol_state(state_path, os.stat(out_dol_path), in_dol_path, in_stat, header, len(runs), packed, digest)
+    return (written, is_full)
+
+def update_dol_from_plan(dol, out_dol_path, state, in_dol_path, in_stat, header, runs, packed, new_section, appended, digest):
+    # Returns the number of bytes rewritten, or None if the file has to be saved in full.
+    try:
+        stat = os.stat(out_dol_path)
+    except OSError:
+        return None
+    if state["size"] != stat.st_size or state["mtime_ns"] != stat.st_mtime_ns \
+    or stat.st_size != dol.size or state["in_dol_path"] != os.path.abspath(in_dol_path) \
+    or state["in_size"] != in_stat.st_size or state["in_mtime_ns"] != in_stat.st_mtime_ns \
+    or state["header"][:DolSectionTableSize] != header[:DolSectionTableSize]:
+        return None
+    
+    # Patch plans are only ever applied to the input DOL's sections, so every range two plans patch
+    # differently holds either this plan's bytes or the input DOL's original bytes.
+    writes = []
+    if state["header"] != header:
+        writes.append((0, header))
+    if new_section is not None and state["digest"] != digest:
+        writes.append((new_section.offset, appended))
+    differences = []
+    if state["runs"] != packed:
+        differences = diff_runs(runs, unpack_runs(state["runs"], state["run_count"]))
+    index = SectionIndex(dol.sections)
+    for address, size, ours, theirs in differences:
+        done = 0
+        while done < size:
+            i = index.find(address + done)
+            if i is None:
+                return None
+            section = index.sections[i]
+            offset = address + done - section.address
+            length = min(size - done, index.ends[i] - (address + done))
+            if ours is None:
+                section.data.seek(offset)
+                data = section.data.read(length)
+            else:
+                data = ours[done:done+length]
+            writes.append((section.offset + offset, data))
+            done += length
+    if not writes:
+        return 0
+    written = 0
+    with open(out_dol_path, "r+b") as f, mmap.mmap(f.fileno(), 0) as m:
+        for offset, data in writes:
+            m[offset:offset+len(data)] = data
+            written += len(data)
+        m.flush()
+    return written
+
+def pack_runs(runs):
+    # The addresses, sizes, and bytes of (address, bytes) runs, as they are kept in the state
+    addresses = array('I', [address for address, data in runs])
+    sizes = array('I', [len(data) for address, data in runs])
+    if sys.byteorder == "little":
+        addresses.byteswap()
+        sizes.byteswap()
+    return b"".join([addresses.tobytes(), sizes.tobytes()] + [data for address, data in runs])
+
+def unpack_runs(data, run_count):
+    addresses = array('I', data[:run_count*4])
+    sizes = array('I', data[run_count*4:run_count*8])
+    if sys.byteorder == "little":
+        addresses.byteswap()
+        sizes.byteswap()
+    runs = []
+    offset = run_count * 8
+    for address, size in zip(addresses, sizes):
+        runs.append((address, data[offset:offset+size]))
+        offset += size
+    return runs
+
+def save_dol_state(filepath, stat, in_dol_path, in_stat, header, run_count, packed_runs, digest):
+    path = os.path.abspath(in_dol_path).encode()
+    temp = "{}.{}.tmp".format(filepath, os.getpid())
+    with open(temp, "wb") as f:
+        f.write(DolStateHeader.pack(DolStateMagic, stat.st_size, stat.st_mtime_ns, in_stat.st_size, in_stat.st_mtime_ns,
+                                    digest, run_count, len(path)))
+        f.write(header)
+        f.write(packed_runs)
+        f.write(path)
+    os.replace(temp, filepath)
+
+def load_dol_state(filepath):
+    # Returns the state as a dict with the previous plan's packed runs, or None if it is missing or
+    # corrupt.
+    try:
+        with open(filepath, "rb") as f:
+            data = f.read()
+    except OSError:
+        return None
+    if len(data) < DolStateHeader.size + DolHeaderSize:
+        return None
+    magic, size, mtime_ns, in_size, in_mtime_ns, digest, run_count, path_size = DolStateHeader.unpack_from(data)
+    if magic != DolStateMagic:
+        return None
+    offset = DolStateHeader.size
+    header = data[offset:offset+DolHeaderSize]
+    offset += DolHeaderSize
+    sizes = array('I', data[offset+run_count*4:offset+run_count*8])
+    if len(sizes) != run_count:
+        return None
+    if sys.byteorder == "little":
+        sizes.byteswap()
+    end = offset + run_count * 8 + sum(sizes)
+    if end + path_size != len(data):
+        return None
+    return {"size": size, "mtime_ns": mtime_ns, "in_size": in_size, "in_mtime_ns": in_mtime_ns, "digest": digest,
+            "header": header, "run_count": run_count, "runs": data[offset:end], "in_dol_path": data[end:].decode()}
+
+def save_dol_blocks(dol, out_dol_path):
+    # Saves the DolFile into memory and hashes it in blocks.  The hashes are kept in
+    # "<out_dol_path>.blocks", and the next save only rewrites the blocks whose hashes changed.
+    f = io.BytesIO()
+    dol.save(f)
+    data = f.getbuffer()
+    hashes = block_hashes(data)
+    state_path = out_dol_path + ".blocks"
+    written = update_dol(out_dol_path, state_path, data, hashes)
+    is_full = written is None
+    if is_full:
+        with open(out_dol_path, "wb") as out:
+            out.write(data)
+        written = len(data)
+    stat = os.stat(out_dol_path)
+    with open(state_path, "w") as state:
+        json.dump({"block_size": DolStateBlockSize,
+                   "size": stat.st_size,
+                   "mtime_ns": stat.st_mtime_ns,
+                   "section_table": bytes(data[:DolSectionTableSize]).hex(),
+                   "blocks": hashes}, state)
+    return (written, is_full)
+
+def update_dol(out_dol_path, state_path, data, hashes):
+    # Returns the number of bytes rewritten, or None if the file has to be saved in full.
+    try:
+        with open(state_path, "r") as f:
+            state = json.load(f)
+        stat = os.stat(out_dol_path)
+    except (OSError, ValueError):
+        return None
+    if state.get("block_size") != DolStateBlockSize \
+    or state.get("size") != stat.st_size or state.get("mtime_ns") != stat.st_mtime_ns \
+    or stat.st_size != len(data) or len(state.get("blocks", ())) != len(hashes) \
+    or state.get("section_table") != bytes(data[:DolSectionTableSize]).hex():
+        return None
+    changed = [i for i, (new, old) in enumerate(zip(hashes, state["blocks"])) if new != old]
+    if not changed:
+        return 0
+    written = 0
+    with open(out_dol_path, "r+b") as f, mmap.mmap(f.fileno(), 0) as m:
+        for i in changed:
+            offset = i * DolStateBlockSize
+            block = data[offset:offset+DolStateBlockSize]
+            m[offset:offset+len(block)] = block
+            written += len(block)
+        m.flush()
+    return written
@@ -0,0 +1,106 @@
+import hashlib
+import os
+import struct
+
+from dolreader.dol import DolFile
+from dolreader.section import Section
+
+from dol_c_kit.buildcache import hash_file
+from dol_c_kit.patch import PatchPlan
+
+# A DOL patch: a header with the hash of the DOL it was made for and the size of the patched DOL,
+# then (file offset, length, bytes) records in offset order that never overlap.  Bytes no record
+# covers are kept from the input DOL, and bytes past its end are zero.
+DolPatchMagic = b"DCKPTCH\x01"
+DolPatchHeader = struct.Struct(">8s20sII")
+DolPatchRecord = struct.Struct(">II")
+DolPatchChunkSize = 1 << 20
+# The file offsets, addresses, and sizes of all 18 sections, the BSS, and the entry point
+DolHeaderSize = 0x100
+
+def dol_header(dol):
+    # The header DolFile.save writes for a DolFile, without saving the sections
+    header = bytearray(DolHeaderSize)
+    for i, section in enumerate(dol.sections):
+        entry = i + (DolFile.MaxTextSections - len(dol.textSections)) if section.id == Section.SectionType.DATA else i
+        struct.pack_into(">I", header, DolFile.OffsetInfoLoc + (entry << 2), section.offset)
+        struct.pack_into(">I", header, DolFile.AddressInfoLoc + (entry << 2), section.address)
+        struct.pack_into(">I", header, DolFile.SizeInfoLoc + (entry << 2), section.size)
+    struct.pack_into(">II", header, DolFile.BssInfoLoc, dol.bssAddress, dol.bssSize)
+    struct.pack_into(">I", header, DolFile.EntryInfoLoc, dol.entryPoint)
+    return header
+
+def dol_patch_records(dol, plans, new_section=None, datablob=b""):
+    # Returns the records of a patch that turns the input DOL into dol, which was patched by the
+    # PatchPlans in plans and had new_section, holding datablob, appended.  Bytes outside the sections
+    # are zeroed, as DolFile.save zeroes them.
+    records = PatchPlan()
+    records.add(0, dol_header(dol), "Header")
+    end = DolHeaderSize
+    for section in sorted(dol.sections, key=lambda section: section.offset):
+        if section.offset > end:
+            records.add(end, bytes(section.offset - end), "Padding")
+        end = max(end, section.offset + section.size)
+    if new_section is not None:
+        records.add(new_section.offset, datablob, "Appended section")
+    for plan in plans:
+        for section, offset, data in plan.section_writes(dol):
+            records.add(section.offset + offset, data)
+    return records.runs()
+
+def write_dol_patch(f, digest, target_size, records):
+    # records are sorted, non-overlapping (file offset, bytes) pairs, such as PatchPlan.runs returns.
+    # Returns the number of bytes written.
+    written = f.write(DolPatchHeader.pack(DolPatchMagic, digest, target_size, len(records)))
+    for offset, data in records:
+        written += f.write(DolPatchRecord.pack(offset, len(data)))
+        written += f.write(data)
+    return written
+
+def save_dol_patch(patch_path, in_dol_path, target_size, records):
+    with open(patch_path, "wb") as f:
+        return write_dol_patch(f, bytes.fromhex(hash_file(in_dol_path)), target_size, records)
+
+def apply_dol_patch(patch_path, in_dol_path, out_dol_path):
+    # Streams the input DOL to the output once, a chunk at a time, writing each record over the bytes
+    # it replaces.  The input is hashed on the way, and the output is removed if it doesn't match the
+    # DOL the patch was made for.  Returns the size of the patched DOL.
+    with open(patch_path, "rb") as patch, open(in_dol_path, "rb") as src, open(out_dol_path, "wb") as dst:
+        magic, digest, target_size, record_count = DolPatchHeader.unpack(patch.read(DolPatchHeader.size))
+        if magic != DolPatchMagic:
+            raise RuntimeError("\"{}\" is not a DOL patch!".format(patch_path))
+        hasher = hashlib.blake2b(digest_size=len(digest))
+        position = 0
+        
+        def copy(end):
+            # Copies the input up to end, or zeroes once the input runs out
+            nonlocal position
+            while position < end:
+                chunk = src.read(min(DolPatchChunkSize, end - position))
+                hasher.update(chunk)
+                dst.write(chunk)
+                if len(chunk) == 0:
+                    dst.write(bytes(end - position))
+                    break
+                position += len(chunk)
+            position = end
+        
+        for i in range(record_count):
+            offset, size = DolPatchRecord.unpack(patch.read(DolPatchRecord.size))
+            if offset < position or offset + size > target_size:
+                raise RuntimeError("\"{}\" is corrupt!  Record {} is out of order.".format(patch_path, i))
+            copy(offset)
+            # The replaced bytes are read anyway, for the hash
+            hasher.update(src.read(size))
+            data = patch.read(size)
+            if len(data) != size:
+                raise RuntimeError("\"{}\" is corrupt!  Record {} is cut short.".format(patch_path, i))
+            dst.write(data)
+            position += size
+        copy(target_size)
+        for chunk in iter(lambda: src.read(DolPatchChunkSize), b""):
+            hasher.update(chunk)
+    if hasher.digest() != digest:
+        os.remove(out_dol_path)
+        raise RuntimeError("\"{}\" was made for a different DOL than \"{}\"!".format(patch_path, in_dol_path))
+    return target_size
@@ -0,0 +1,170 @@
+import mmap
+import struct
+from collections import namedtuple
+
+from elftools.elf.elffile import ELFFile
+from elftools.elf.enums import ENUM_SH_TYPE_BASE, ENUM_ST_INFO_BIND, ENUM_ST_INFO_TYPE, ENUM_ST_VISIBILITY, ENUM_ST_SHNDX
+
+SHF_ALLOC = 0x2
+SHF_COMPRESSED = 0x800
+SHT_SYMTAB = 2
+SHT_NOBITS = 8
+STB_LOCAL = 0
+SHN_UNDEF = 0
+SHN_ABS = 0xFFF1
+
+BindNames = {value: name for name, value in ENUM_ST_INFO_BIND.items() if isinstance(value, int)}
+TypeNames = {value: name for name, value in ENUM_ST_INFO_TYPE.items() if isinstance(value, int)}
+VisibilityNames = {value: name for name, value in ENUM_ST_VISIBILITY.items() if isinstance(value, int)}
+ShndxNames = {value: name for name, value in ENUM_ST_SHNDX.items() if isinstance(value, int)}
+
+ElfSection = namedtuple("ElfSection", ("index", "name", "type", "flags", "addr", "offset", "size", "link", "info", "entsize"))
+
+class ElfSymbol(namedtuple("ElfSymbol", ("name", "st_name", "value", "size", "info", "other", "shndx"))):
+    __slots__ = ()
+    
+    @property
+    def bind(self):
+        return self.info >> 4
+    
+    @property
+    def type(self):
+        return self.info & 0xF
+    
+    def entry(self):
+        # The same shape as a pyelftools symbol's entry
+        return {'st_name': self.st_name, 'st_value': self.value, 'st_size': self.size,
+                'st_info': {'bind': BindNames.get(self.bind, self.bind), 'type': TypeNames.get(self.type, self.type)},
+                'st_other': {'local': self.other >> 5, 'visibility': VisibilityNames.get(self.other & 0x7, self.other & 0x7)},
+                'st_shndx': ShndxNames.get(self.shndx, self.shndx)}
+
+def keep_symbol(bind, shndx, skip_local, skip_abs, skip_undef):
+    return not ((skip_local and bind == STB_LOCAL)
+             or (skip_abs and shndx == SHN_ABS)
+             or (skip_undef and shndx == SHN_UNDEF))
+
+class ElfFile(object):
+    # A minimal reader for the big-endian ELF32 files the PowerPC linkers produce.  The file is
+    # mmapped, section data is handed out as zero-copy memoryview slices, and the symbol table is
+    # decoded in bulk with struct.iter_unpack.  Raises ValueError for anything else.
+    def __init__(self, filepath):
+        with open(filepath, "rb") as f:
+            self.map = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        self.view = memoryview(self.map)
+        try:
+            self.sections = self.__read_sections()
+        except (ValueError, struct.error):
+            self.close()
+            raise
+    
+    def __enter__(self):
+        return self
+    
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+    
+    def close(self):
+        self.view.release()
+        try:
+            self.map.close()
+        except BufferError:
+            # A caller still holds a section's memoryview; the map is unmapped once that is gone.
+            pass
+    
+    def get_section_by_name(self, name):
+        for section in self.sections:
+            if section.name == name:
+                return section
+        return None
+    
+    def section_data(self, section):
+        if section.type == SHT_NOBITS:
+            return memoryview(bytes(section.size))
+        if section.offset + section.size > len(self.view):
+            raise ValueError("Section {} extends past the end of the file".format(section.name))
+        return self.view[section.offset:section.offset+section.size]
+    
+    def symbols(self, skip_local=True, skip_abs=False, skip_undef=False):
+        symtab = next((section for section in self.sections if section.type == SHT_SYMTAB), None)
+        if symtab is None:
+            return []
+        strtab = bytes(self.section_data(self.sections[symtab.link]))
+        symbols = []
+        for st_name, value, size, info, other, shndx in struct.iter_unpack(">IIIBBH", self.section_data(symtab)):
+            if keep_symbol(info >> 4, shndx, skip_local, skip_abs, skip_undef):
+                name = strtab[st_name:strtab.index(b'\0', st_name)].decode("utf-8", "replace")
+                symbols.append(ElfSymbol(name, st_name, value, size, info, other, shndx))
+        return symbols
+    
+    def __read_sections(self):
+        if len(self.view) < 52 or bytes(self.view[:4]) != b"\x7fELF":
+            raise ValueError("Not an ELF file")
+        if self.view[4] != 1 or self.view[5] != 2:
+            raise ValueError("Not a big-endian ELF32 file")
+        e_shoff, = struct.unpack_from(">I", self.view, 32)
+        e_shentsize, e_shnum, e_shstrndx = struct.unpack_from(">HHH", self.view, 46)
+        if e_shentsize != 40:
+            raise ValueError("Unexpected section header size {}".format(e_shentsize))
+        headers = list(struct.iter_unpack(">IIIIIIIIII", self.view[e_shoff:e_shoff+e_shnum*40]))
+        shstrtab = bytes(self.view[headers[e_shstrndx][4]:headers[e_shstrndx][4]+headers[e_shstrndx][5]]) if headers else b''
+        sections = []
+        for index, (sh_name, sh_type, sh_flags, sh_addr, sh_offset, sh_size, sh_link, sh_info, sh_addralign, sh_entsize) in enumerate(headers):
+            name = shstrtab[sh_name:shstrtab.index(b'\0', sh_name)].decode("utf-8", "replace") if sh_name < len(shstrtab) else ""
+            if sh_flags & SHF_COMPRESSED:
+                raise ValueError("Compressed sections are not supported")
+            sections.append(ElfSection(index, name, sh_type, sh_flags, sh_addr, sh_offset, sh_size, sh_link, sh_info, sh_entsize))
+        return sections
+
+class PyElfFile(object):
+    # The same interface as ElfFile, backed by pyelftools.  Used for ELF files the built-in
+    # reader doesn't handle, such as compressed sections.
+    def __init__(self, filepath):
+        self.file = open(filepath, "rb")
+        self.elf = ELFFile(self.file)
+        self.sections = []
+        for index, iter in enumerate(self.elf.iter_sections()):
+            header = iter.header
+            self.sections.append(ElfSection(index, iter.name, ENUM_SH_TYPE_BASE.get(header["sh_type"], header["sh_type"]),
+                                            header["sh_flags"], header["sh_addr"], header["sh_offset"], iter.data_size,
+                                            header["sh_link"], header["sh_info"], header["sh_entsize"]))
+    
+    def __enter__(self):
+        return self
+    
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+    
+    def close(self):
+        self.file.close()
+    
+    def get_section_by_name(self, name):
+        for section in self.sections:
+            if section.name == name:
+                return section
+        return None
+    
+    def section_data(self, section):
+        return memoryview(self.elf.get_section(section.index).data())
+    
+    def symbols(self, skip_local=True, skip_abs=False, skip_undef=False):
+        symtab = self.elf.get_section_by_name(".symtab")
+        if symtab is None:
+            return []
+        symbols = []
+        for iter in symtab.iter_symbols():
+            entry = iter.entry
+            bind = ENUM_ST_INFO_BIND.get(entry['st_info']['bind'], entry['st_info']['bind'])
+            shndx = ENUM_ST_SHNDX.get(entry['st_shndx'], entry['st_shndx'])
+            if keep_symbol(bind, shndx, skip_local, skip_abs, skip_undef):
+                info = (bind << 4) | ENUM_ST_INFO_TYPE.get(entry['st_info']['type'], entry['st_info']['type'])
+                other = (entry['st_other'].get('local', 0) << 5) | ENUM_ST_VISIBILITY.get(entry['st_other']['visibility'], 0)
+                symbols.append(ElfSymbol(iter.name, entry['st_name'], entry['st_value'], entry['st_size'], info, other, shndx))
+        return symbols
+
+def open_elf(filepath, use_pyelftools=False):
+    if not use_pyelftools:
+        try:
+            return ElfFile(filepath)
+        except ValueError:
+            pass
+    return PyElfFile(filepath)
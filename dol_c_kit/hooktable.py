@@ -0,0 +1,386 @@
+import csv
+import io
+import json
+import os
+import struct
+import sys
+from array import array
+
+from dol_c_kit import mask_field
+from geckolibs.geckocode import WriteBranch, Write32, Write16
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+Modifiers = ("@h", "@l", "@ha", "@sda", "@sda2")
+HookManifestMagic = b"DCKHOOK\x01"
+HookManifestHeader = struct.Struct(">8s20sII")
+
+class HookTable(object):
+    # Branch, pointer, and immediate hooks stored column by column: one array per field, with symbol
+    # names interned to ids.  The whole table is resolved and encoded at once, with NumPy if it is
+    # installed and a plain Python loop otherwise.  The encodings match BranchHook, PointerHook,
+    # Immediate16Hook, and Immediate12Hook exactly, including skipping hooks whose data is zero.
+    Branch = 0
+    Pointer = 1
+    Immediate16 = 2
+    Immediate12 = 3
+    KindNames = ("BranchHook", "PointerHook", "Immediate16Hook", "Immediate12Hook")
+    
+    def __init__(self):
+        self.addrs = array('I')
+        self.symbol_ids = array('I')
+        self.kinds = array('B')
+        self.lk_bits = array('B')
+        self.modifiers = array('B')
+        # The w and i fields of Immediate12 hooks, already shifted into place
+        self.extras = array('H')
+        self.symbol_names = []
+        self.symbol_indices = {}
+        # Encoded data and whether it was written, per hook, from the last resolve
+        self.data = []
+        self.good = array('B')
+    
+    def add_branch(self, addr, sym_name, lk_bit=False):
+        self.__add(self.Branch, addr, sym_name, lk_bit=lk_bit)
+    
+    def add_pointer(self, addr, sym_name):
+        self.__add(self.Pointer, addr, sym_name)
+    
+    def add_immediate16(self, addr, sym_name, modifier):
+        self.__add(self.Immediate16, addr, sym_name, modifier=modifier)
+    
+    def add_immediate12(self, addr, w, i, sym_name, modifier):
+        self.__add(self.Immediate12, addr, sym_name, modifier=modifier,
+                   extra=(mask_field(i, 1, False) << 12) | (mask_field(w, 3, False) << 13))
+    
+    def extend(self, table):
+        # Appends every hook of another HookTable, interning its symbol names into this one.
+        symbol_ids = array('I', (self.__intern(name) for name in table.symbol_names))
+        self.addrs.extend(table.addrs)
+        self.symbol_ids.extend(symbol_ids[symbol_id] for symbol_id in table.symbol_ids)
+        self.kinds.extend(table.kinds)
+        self.lk_bits.extend(table.lk_bits)
+        self.modifiers.extend(table.modifiers)
+        self.extras.extend(table.extras)
+    
+    def validate(self):
+        # Returns (row, message) for every hook with a misaligned address or an empty symbol name.
+        problems = []
+        for row, (addr, kind, symbol_id) in enumerate(zip(self.addrs, self.kinds, self.symbol_ids)):
+            if addr & (3 if kind <= self.Pointer else 1):
+                problems.append((row, "{} address {:08X} is not {}-byte aligned".format(self.KindNames[kind], addr, 4 if kind <= self.Pointer else 2)))
+            if not self.symbol_names[symbol_id]:
+                problems.append((row, "{} at {:08X} has no symbol name".format(self.KindNames[kind], addr)))
+        return problems
+    
+    def undefined_symbols(self, symbols):
+        # Every symbol is checked once, no matter how many hooks reference it.
+        return [name for name in self.symbol_names if name not in symbols]
+    
+    def encode(self, symbols):
+        # Returns the value to write for every hook, or None for hooks that are skipped because their
+        # symbol is missing or their data is zero.  Range errors raise a RuntimeError naming the hook.
+        sda_base = symbols["_SDA_BASE_"]['st_value'] if "_SDA_BASE_" in symbols else None
+        sda2_base = symbols["_SDA2_BASE_"]['st_value'] if "_SDA2_BASE_" in symbols else None
+        values = []
+        defined = []
+        for name in self.symbol_names:
+            value = symbols[name]['st_value'] if name in symbols else None
+            defined.append(value is not None)
+            values.append(value if value is not None else 0)
+        if numpy is not None and len(self) > 0:
+            return self.__encode_numpy(values, defined, sda_base, sda2_base)
+        return [self.__encode_row(row, values[self.symbol_ids[row]] if defined[self.symbol_ids[row]] else None, sda_base, sda2_base)
+                for row in range(len(self))]
+    
+    def resolve(self, symbols):
+        # Encodes every hook at once.  apply and write_geckocommands then write any range of rows, so
+        # the rows can be interleaved with the other hooks in the order they were declared.
+        self.data = self.encode(symbols)
+        self.good = array('B', bytes(len(self)))
+    
+    def apply(self, recorder, start=0, end=None):
+        # Records every resolved hook that has non-zero data at a mapped address, like Hook.apply_dol.
+        for row in range(start, len(self) if end is None else end):
+            value = self.data[row]
+            if value is not None and recorder.is_mapped(self.addrs[row]):
+                recorder.origin = self.origin(row)
+                recorder.seek(self.addrs[row])
+                recorder.write(value.to_bytes(2 if self.kinds[row] >= self.Immediate16 else 4, "big"))
+                self.good[row] = 1
+    
+    def write_geckocommands(self, f, symbols, start=0, end=None):
+        for row in range(start, len(self) if end is None else end):
+            value = self.data[row]
+            if value is None:
+                continue
+            kind = self.kinds[row]
+            if kind == self.Branch:
+                gecko_command = WriteBranch(self.__symbol_value(row, symbols), self.addrs[row], isLink = bool(self.lk_bits[row]))
+            elif kind == self.Pointer:
+                gecko_command = Write32(value, self.addrs[row])
+            else:
+                gecko_command = Write16(value, self.addrs[row])
+            f.write(gecko_command.as_text() + "\n")
+            self.good[row] = 1
+    
+    def origin(self, row):
+        return "{:s} {:08X} {:s}".format(self.KindNames[self.kinds[row]], self.addrs[row], self.symbol_names[self.symbol_ids[row]])
+    
+    def dump_info(self, row):
+        good = len(self.good) > row and self.good[row]
+        kind = self.kinds[row]
+        sym_name = self.symbol_names[self.symbol_ids[row]]
+        if kind == self.Branch:
+            return repr("{:s} {:08X} {:s} {:s}".format(
+                        "[Branchlink] " if self.lk_bits[row] else "[Branch]     ", self.addrs[row], "-->" if good else "-X>", sym_name))[+1:-1]
+        if kind == self.Pointer:
+            return repr("{:s} {:08X} {:s} {:s}".format(
+                        "[Pointer]    ", self.addrs[row], "-->" if good else "-X>", sym_name))[+1:-1]
+        return repr("{:s} {:08X} {:s} {:s} {:s}".format(
+                    "[Immediate16]" if kind == self.Immediate16 else "[Immediate12]", self.addrs[row], "-->" if good else "-X>",
+                    sym_name, Modifiers[self.modifiers[row]]))[+1:-1]
+    
+    def clear(self):
+        self.__init__()
+    
+    def __len__(self):
+        return len(self.addrs)
+    
+    def __add(self, kind, addr, sym_name, lk_bit=False, modifier=None, extra=0):
+        if modifier is not None and modifier not in Modifiers:
+            raise RuntimeError("Unknown modifier: \"{}\"".format(modifier))
+        self.addrs.append(addr)
+        self.symbol_ids.append(self.__intern(sym_name))
+        self.kinds.append(kind)
+        self.lk_bits.append(1 if lk_bit else 0)
+        self.modifiers.append(Modifiers.index(modifier) if modifier is not None else 0)
+        self.extras.append(extra)
+    
+    def __intern(self, sym_name):
+        symbol_id = self.symbol_indices.get(sym_name)
+        if symbol_id is None:
+            symbol_id = len(self.symbol_names)
+            self.symbol_names.append(sys.intern(sym_name))
+            self.symbol_indices[sym_name] = symbol_id
+        return symbol_id
+    
+    def __symbol_value(self, row, symbols):
+        return symbols[self.symbol_names[self.symbol_ids[row]]]['st_value']
+    
+    def __sda_base(self, row, sda_base, sda2_base):
+        if Modifiers[self.modifiers[row]] == "@sda":
+            if sda_base == None:
+                raise RuntimeError("You must set this project's sda_base member before using the @sda modifier!  Check out the set_sda_bases method.")
+            return sda_base
+        if sda2_base == None:
+            raise RuntimeError("You must set this project's sda2_base member before using the @sda2 modifier!  Check out the set_sda_bases method.")
+        return sda2_base
+    
+    def __range_error(self, row, value, bits):
+        return RuntimeError("{}: {} too large for {}-bit signed field".format(self.origin(row), value, bits))
+    
+    def __encode_row(self, row, value, sda_base, sda2_base):
+        kind = self.kinds[row]
+        # Like the hook classes, branches and pointers to a symbol at address zero are skipped.
+        if value is None or (kind <= self.Pointer and not value):
+            return None
+        if kind == self.Branch:
+            delta = value - self.addrs[row]
+            if delta % 4 or not -0x800000 <= delta // 4 <= 0x7FFFFF:
+                raise self.__range_error(row, delta // 4, 24)
+            data = 0x48000000 | (delta & 0x3FFFFFC) | self.lk_bits[row]
+        elif kind == self.Pointer:
+            data = value
+        else:
+            modifier = Modifiers[self.modifiers[row]]
+            if modifier == "@h":
+                data = (value >> 16) & 0xFFFF
+            elif modifier == "@l":
+                data = value & 0xFFFF
+            elif modifier == "@ha":
+                data = ((value + 0x8000) >> 16) & 0xFFFF
+            else:
+                offset = value - self.__sda_base(row, sda_base, sda2_base)
+                if not -0x8000 <= offset <= 0x7FFF:
+                    raise self.__range_error(row, offset, 16)
+                # The hook classes range check the offset a second time after masking it, so negative
+                # offsets are rejected.  Keep that behaviour.
+                data = offset & 0xFFFF
+                limit = 0x7FF if kind == self.Immediate12 else 0x7FFF
+                if data > limit:
+                    raise self.__range_error(row, data, 12 if kind == self.Immediate12 else 16)
+            if kind == self.Immediate12:
+                if modifier in ("@h", "@l", "@ha"):
+                    signed = (data ^ 0x8000) - 0x8000
+                    if not -0x800 <= signed <= 0x7FF:
+                        raise self.__range_error(row, signed, 12)
+                data = (data & 0xFFF) | self.extras[row]
+        return data if data else None
+    
+    def __encode_numpy(self, values, defined, sda_base, sda2_base):
+        ids = numpy.frombuffer(self.symbol_ids, dtype=numpy.uint32)
+        value = numpy.array(values, dtype=numpy.int64)[ids]
+        is_defined = numpy.array(defined, dtype=bool)[ids]
+        addrs = numpy.frombuffer(self.addrs, dtype=numpy.uint32).astype(numpy.int64)
+        kinds = numpy.frombuffer(self.kinds, dtype=numpy.uint8)
+        modifiers = numpy.frombuffer(self.modifiers, dtype=numpy.uint8)
+        data = numpy.zeros(len(self), dtype=numpy.int64)
+        errors = numpy.zeros(len(self), dtype=bool)
+        
+        is_defined &= (kinds > self.Pointer) | (value != 0)
+        branch = is_defined & (kinds == self.Branch)
+        delta = value - addrs
+        errors |= branch & ((delta % 4 != 0) | (delta < -0x2000000) | (delta > 0x1FFFFFC))
+        data = numpy.where(branch, 0x48000000 | (delta & 0x3FFFFFC) | numpy.frombuffer(self.lk_bits, dtype=numpy.uint8), data)
+        data = numpy.where(is_defined & (kinds == self.Pointer), value, data)
+        
+        immediate = is_defined & (kinds >= self.Immediate16)
+        immediate12 = immediate & (kinds == self.Immediate12)
+        halves = numpy.select([modifiers == 0, modifiers == 1, modifiers == 2],
+                              [(value >> 16) & 0xFFFF, value & 0xFFFF, ((value + 0x8000) >> 16) & 0xFFFF], 0)
+        for modifier in (3, 4):
+            rows = immediate & (modifiers == modifier)
+            if rows.any():
+                offset = value - self.__sda_base(int(numpy.argmax(rows)), sda_base, sda2_base)
+                errors |= rows & ((offset < -0x8000) | (offset > 0x7FFF))
+                errors |= rows & ((offset & 0xFFFF) > numpy.where(immediate12, 0x7FF, 0x7FFF))
+                halves = numpy.where(rows, offset & 0xFFFF, halves)
+        signed = (halves ^ 0x8000) - 0x8000
+        errors |= immediate12 & (modifiers < 3) & ((signed < -0x800) | (signed > 0x7FF))
+        data = numpy.where(immediate & ~immediate12, halves, data)
+        data = numpy.where(immediate12, (halves & 0xFFF) | numpy.frombuffer(self.extras, dtype=numpy.uint16), data)
+        
+        if errors.any():
+            # Let the scalar encoder raise the error, so the message is the same either way.
+            row = int(numpy.argmax(errors))
+            self.__encode_row(row, values[self.symbol_ids[row]], sda_base, sda2_base)
+        return [int(word) if word and good else None for word, good in zip(data.tolist(), is_defined.tolist())]
+
+def read_hook_manifest(filepath):
+    # Reads a hook manifest into a new HookTable.  Binary manifests are recognized by their magic,
+    # *.json files hold a list of objects, and anything else is read as CSV with a header row.  Both
+    # text formats use the fields kind (branch, branchlink, pointer, immediate16, or immediate12),
+    # addr (hexadecimal), symbol, and, for immediates, modifier, w, and i.  Every row is checked
+    # before anything is returned, and a RuntimeError lists all of the problems found.
+    with open(filepath, "rb") as f:
+        data = f.read()
+    if data.startswith(HookManifestMagic):
+        table = unpack_hook_manifest(data)
+        if table is None:
+            raise RuntimeError("Hook manifest {} is corrupt".format(filepath))
+        labels = ["hook {}".format(row) for row in range(len(table))]
+        problems = []
+    else:
+        text = data.decode("utf-8-sig")
+        if os.path.splitext(filepath)[1].lower() == ".json":
+            records = json.loads(text)
+            if not isinstance(records, list):
+                raise RuntimeError("Hook manifest {} must contain a list of hooks".format(filepath))
+            records = [("hook {}".format(row), record) for row, record in enumerate(records)]
+        else:
+            reader = csv.DictReader(io.StringIO(text, newline=""))
+            records = [("line {}".format(reader.line_num), record) for record in reader]
+        table, labels, problems = parse_hook_records(records)
+    problems += [(labels[row], message) for row, message in table.validate()]
+    if problems:
+        raise RuntimeError("Invalid hook manifest {}:\n{}".format(filepath, "\n".join("  {}: {}".format(label, message) for label, message in problems)))
+    return table
+
+def parse_hook_records(records):
+    # Returns (table, labels, problems) from (label, dict) records, where labels[row] names the
+    # record a row of the table came from.
+    table = HookTable()
+    labels = []
+    problems = []
+    for label, record in records:
+        try:
+            kind = str(manifest_field(record, "kind")).lower()
+            addr = parse_manifest_int(manifest_field(record, "addr"), 16)
+            sym_name = str(manifest_field(record, "symbol"))
+            if kind == "branch" or kind == "branchlink":
+                table.add_branch(addr, sym_name, kind == "branchlink")
+            elif kind == "pointer":
+                table.add_pointer(addr, sym_name)
+            elif kind == "immediate16":
+                table.add_immediate16(addr, sym_name, str(manifest_field(record, "modifier")))
+            elif kind == "immediate12":
+                table.add_immediate12(addr, parse_manifest_int(manifest_field(record, "w"), 0), parse_manifest_int(manifest_field(record, "i"), 0),
+                                      sym_name, str(manifest_field(record, "modifier")))
+            else:
+                raise ValueError("unknown kind \"{}\"".format(kind))
+        except KeyError as e:
+            problems.append((label, "missing field {}".format(e)))
+            continue
+        except (ValueError, TypeError, OverflowError, RuntimeError) as e:
+            problems.append((label, str(e)))
+            continue
+        labels.append(label)
+    return (table, labels, problems)
+
+def manifest_field(record, name):
+    # CSV rows with too few columns have None for the missing fields
+    value = record[name]
+    if value is None:
+        raise KeyError(name)
+    return value.strip() if isinstance(value, str) else value
+
+def parse_manifest_int(value, base):
+    if isinstance(value, int):
+        return value
+    return int(str(value).strip(), base)
+
+def pack_hook_manifest(table, key=None):
+    # Binary layout, all big-endian: a header with the hash of the manifest the table was parsed from
+    # (zeros if none), the address, symbol id, kind, LK bit, modifier, and w/i columns, then every
+    # symbol name joined by NULs.
+    names = b"\0".join(name.encode() for name in table.symbol_names)
+    columns = [array(column.typecode, column) for column in (table.addrs, table.symbol_ids, table.extras)]
+    if sys.byteorder == "little":
+        for column in columns:
+            column.byteswap()
+    return b"".join((HookManifestHeader.pack(HookManifestMagic, bytes.fromhex(key) if key else bytes(20), len(table), len(names)),
+                     columns[0].tobytes(), columns[1].tobytes(), table.kinds.tobytes(), table.lk_bits.tobytes(),
+                     table.modifiers.tobytes(), columns[2].tobytes(), names))
+
+def unpack_hook_manifest(data, key=None):
+    # Returns a HookTable, or None if the data is corrupt or was made from a different manifest.
+    if len(data) < HookManifestHeader.size:
+        return None
+    magic, digest, row_count, names_size = HookManifestHeader.unpack_from(data)
+    if magic != HookManifestMagic or (key is not None and digest != bytes.fromhex(key)):
+        return None
+    table = HookTable()
+    offset = HookManifestHeader.size
+    for column in (table.addrs, table.symbol_ids, table.kinds, table.lk_bits, table.modifiers, table.extras):
+        size = row_count * column.itemsize
+        column.frombytes(data[offset:offset+size])
+        if sys.byteorder == "little":
+            column.byteswap()
+        offset += size
+    if len(table.extras) != row_count or offset + names_size != len(data):
+        return None
+    table.symbol_names = [sys.intern(name) for name in data[offset:].decode().split("\0")] if names_size or row_count else []
+    table.symbol_indices = {name: symbol_id for symbol_id, name in enumerate(table.symbol_names)}
+    if any(symbol_id >= len(table.symbol_names) for symbol_id in table.symbol_ids) \
+    or any(kind > HookTable.Immediate12 for kind in table.kinds) \
+    or any(modifier >= len(Modifiers) for modifier in table.modifiers):
+        return None
+    return table
+
+def save_hook_manifest(filepath, table, key=None):
+    # Each process writes its own temporary file, so workers saving the same cache don't collide.
+    temp = "{}.{}.tmp".format(filepath, os.getpid())
+    with open(temp, "wb") as f:
+        f.write(pack_hook_manifest(table, key))
+    os.replace(temp, filepath)
+
+def load_hook_manifest(filepath, key=None):
+    try:
+        with open(filepath, "rb") as f:
+            return unpack_hook_manifest(f.read(), key)
+    except OSError:
+        return None
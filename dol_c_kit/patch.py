@@ -0,0 +1,245 @@
+import heapq
+import struct
+from bisect import bisect_right
+
+from dolreader.dol import UnmappedAddressError
+
+from dol_c_kit.dolimage import DolImage
+
+class SectionIndex(object):
+    # Sorted section start addresses, so the section holding an address is found with one bisect
+    # instead of DolFile.resolve_address's linear search.
+    def __init__(self, sections):
+        self.sections = sorted(sections, key=lambda section: section.address)
+        self.starts = [section.address for section in self.sections]
+        self.ends = [section.address + section.size for section in self.sections]
+    
+    def find(self, address):
+        i = bisect_right(self.starts, address) - 1
+        if i >= 0 and address < self.ends[i]:
+            return i
+        return None
+
+class PatchPlan(object):
+    # Every write that hooks and Gecko Codes make to a DOL, as (address, data, origin) records in
+    # the order they were made.  Writing them is deferred until apply, where overlapping and adjacent
+    # records are merged into runs (later records win) and each run is written with a single write.
+    def __init__(self):
+        self.patches = []
+        # The runs from the last call to runs, and how many records they were made from
+        self.__runs = None
+        self.__runs_count = 0
+    
+    def add(self, address, data, origin=None):
+        self.patches.append((address, bytes(data), origin))
+    
+    def runs(self):
+        # Returns sorted, non-overlapping (address, bytearray) runs of the final patched bytes.  They are
+        # kept until records are added, so apply and save_dol share them.  Don't modify them.
+        if self.__runs is not None and self.__runs_count == len(self.patches):
+            return self.__runs
+        order = sorted(range(len(self.patches)), key=lambda i: self.patches[i][0])
+        runs = []
+        group = []
+        run_start = run_end = None
+        for i in order:
+            address, data, origin = self.patches[i]
+            if group and address > run_end:
+                runs.append(self.__merge(run_start, run_end, group))
+                group = []
+            if not group:
+                run_start = run_end = address
+            group.append(i)
+            run_end = max(run_end, address + len(data))
+        if group:
+            runs.append(self.__merge(run_start, run_end, group))
+        self.__runs = runs
+        self.__runs_count = len(self.patches)
+        return runs
+    
+    def apply(self, dol):
+        # Runs that span more than one section are split at the section boundaries, except in a
+        # DolImage, where every run is one slice assignment.
+        if isinstance(dol, DolImage):
+            runs = self.runs()
+            for address, data in runs:
+                dol.write_run(address, data)
+            return len(runs)
+        writes = 0
+        for section, offset, data in self.section_writes(dol):
+            section.data.seek(offset)
+            section.data.write(data)
+            writes += 1
+        return writes
+    
+    def section_writes(self, dol):
+        # Yields (section, offset in the section, bytes) for every run, split at the section boundaries.
+        index = SectionIndex(dol.sections)
+        for address, data in self.runs():
+            offset = 0
+            while offset < len(data):
+                i = index.find(address + offset)
+                if i is None:
+                    raise UnmappedAddressError("Unmapped address: 0x{:X}".format(address + offset))
+                section = index.sections[i]
+                size = min(len(data) - offset, index.ends[i] - (address + offset))
+                yield (section, address + offset - section.address, data[offset:offset+size])
+                offset += size
+    
+    def dump(self, f):
+        # One line per record, in address order: address, size, bytes, and where it came from.
+        for i in sorted(range(len(self.patches)), key=lambda i: self.patches[i][0]):
+            address, data, origin = self.patches[i]
+            f.write("{:08X} {:06X} {} {}\n".format(address, len(data), data.hex().upper(), origin or ""))
+    
+    def diff(self, other):
+        # Returns (address, size, bytes in this plan, bytes in the other plan) for every range the two
+        # plans patch differently.  None stands for bytes a plan leaves unpatched.
+        return diff_runs(self.runs(), other.runs())
+    
+    def overlaps(self):
+        # Returns (address, size, first_origin, second_origin) for every range patched by records of two
+        # different origins, where second_origin's write came later and wins.  A sweep over the records
+        # in address order keeps a heap of the ones still active, ordered by where they end, and checks
+        # each record against all of them, so records nested inside a longer one are compared too.
+        order = sorted(range(len(self.patches)), key=lambda i: self.patches[i][0])
+        overlaps = []
+        # The index in overlaps of the last range reported for each pair of origins
+        last_reported = {}
+        active = []
+        for i in order:
+            address, data, origin = self.patches[i]
+            end = address + len(data)
+            while active and active[0][0] <= address:
+                heapq.heappop(active)
+            if end == address:
+                continue
+            for active_end, j in active:
+                if self.patches[j][2] == origin:
+                    continue
+                first, second = sorted((j, i))
+                pair = (self.patches[first][2], self.patches[second][2])
+                size = min(end, active_end) - address
+                k = last_reported.get(pair)
+                # Neighbouring overlaps between the same two origins are reported as one range
+                if k is not None and overlaps[k][0] + overlaps[k][1] >= address:
+                    last = overlaps[k]
+                    overlaps[k] = (last[0], max(last[0] + last[1], address + size) - last[0]) + pair
+                else:
+                    last_reported[pair] = len(overlaps)
+                    overlaps.append((address, size) + pair)
+            heapq.heappush(active, (end, i))
+        return overlaps
+    
+    def __len__(self):
+        return len(self.patches)
+    
+    def __merge(self, start, end, group):
+        if len(group) == 1:
+            return (start, bytearray(self.patches[group[0]][1]))
+        run = bytearray(end - start)
+        # Records are applied in the order they were made, so the last write to a byte wins.
+        for i in sorted(group):
+            address, data, origin = self.patches[i]
+            run[address-start:address-start+len(data)] = data
+        return (start, run)
+
+class PatchRecorder(object):
+    # Stands in for a DolFile while hooks and Gecko Codes are applied, checking addresses the same
+    # way DolFile does but recording the writes in a PatchPlan instead of making them.  Without a
+    # DolFile, every address is treated as mapped.  A DolImage is its own section index.
+    def __init__(self, dol, plan):
+        if isinstance(dol, DolImage):
+            self.index = dol
+        else:
+            self.index = SectionIndex(dol.sections) if dol else None
+        self.plan = plan
+        self.origin = None
+        self.__address = 0
+    
+    def is_mapped(self, address):
+        return self.index is None or self.index.find(address) is not None
+    
+    def seek(self, where, whence=0):
+        if whence == 1:
+            where += self.__address
+        elif whence != 0:
+            raise NotImplementedError("Unsupported whence type '{}'".format(whence))
+        if not self.is_mapped(where):
+            raise UnmappedAddressError("Unmapped address: 0x{:X}".format(where))
+        self.__address = where
+    
+    def tell(self):
+        return self.__address
+    
+    def write(self, data):
+        if self.index is None:
+            self.plan.add(self.__address, data, self.origin)
+            self.__address += len(data)
+            return
+        i = self.index.find(self.__address)
+        if i is None:
+            raise UnmappedAddressError("Unmapped address: 0x{:X}".format(self.__address))
+        section = self.index.sections[i]
+        if self.__address + len(data) > section.address + section.size:
+            raise UnmappedAddressError("Write goes over current section")
+        self.plan.add(self.__address, data, self.origin)
+        self.__address += len(data)
+    
+    def write_uint32(self, address, value):
+        self.seek(address)
+        self.write(struct.pack(">I", value))
+    
+    def write_uint16(self, address, value):
+        self.seek(address)
+        self.write(struct.pack(">H", value))
+    
+    def insert_branch(self, to, _from, lk=False):
+        _from &= 0xFFFFFFFC
+        to &= 0xFFFFFFFC
+        self.seek(_from)
+        self.write(struct.pack(">I", (to - _from) & 0x3FFFFFD | 0x48000000 | (1 if lk else 0)))
+
+def diff_runs(ours, theirs):
+    # PatchPlan.diff for two lists of sorted, non-overlapping (address, bytes) runs, such as those
+    # PatchPlan.runs returns.  Runs at the same address with the same bytes can't overlap any other run of either
+    # plan, so they are dropped before the rest are compared.
+    same = {address: data for address, data in theirs}
+    same = {address for address, data in ours if same.get(address) == data}
+    runs = ([run for run in ours if run[0] not in same], [run for run in theirs if run[0] not in same])
+    starts = tuple([address for address, data in plan_runs] for plan_runs in runs)
+    points = sorted({point for plan_runs in runs for address, data in plan_runs for point in (address, address + len(data))})
+    differences = []
+    for start, end in zip(points, points[1:]):
+        chunks = []
+        for plan_runs, plan_starts in zip(runs, starts):
+            i = bisect_right(plan_starts, start) - 1
+            if i >= 0 and start < plan_runs[i][0] + len(plan_runs[i][1]):
+                address, data = plan_runs[i]
+                chunks.append(bytes(data[start-address:end-address]))
+            else:
+                chunks.append(None)
+        if chunks[0] == chunks[1]:
+            continue
+        if chunks[0] is None or chunks[1] is None:
+            spans = [(0, end - start)]
+        else:
+            # Narrow a range both plans patch down to the bytes that actually differ
+            spans = []
+            for i, (a, b) in enumerate(zip(*chunks)):
+                if a != b:
+                    if spans and spans[-1][1] == i:
+                        spans[-1] = (spans[-1][0], i + 1)
+                    else:
+                        spans.append((i, i + 1))
+        for span_start, span_end in spans:
+            ours, theirs = (None if chunk is None else chunk[span_start:span_end] for chunk in chunks)
+            address = start + span_start
+            if differences and differences[-1][0] + differences[-1][1] == address \
+            and (differences[-1][2] is None) == (ours is None) and (differences[-1][3] is None) == (theirs is None):
+                last = differences.pop()
+                address = last[0]
+                ours = None if ours is None else last[2] + ours
+                theirs = None if theirs is None else last[3] + theirs
+            differences.append((address, len(ours if ours is not None else theirs), ours, theirs))
+    return differences
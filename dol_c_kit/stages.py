@@ -0,0 +1,68 @@
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+class StageGraph(object):
+    # A tiny dependency graph of build stages.  Every stage is started on a worker thread as soon as
+    # the stages it depends on have finished, and is called with their results as arguments.
+    def __init__(self, max_workers=4):
+        self.max_workers = max_workers
+        self.stages = {}
+        self.order = []
+        self.results = {}
+        self.errors = {}
+    
+    def add(self, name, function, *deps):
+        for dep in deps:
+            if dep not in self.stages:
+                raise RuntimeError("Stage \"{}\" depends on unknown stage \"{}\"".format(name, dep))
+        self.stages[name] = (function, deps)
+        self.order.append(name)
+    
+    def run(self):
+        lock = threading.Lock()
+        finished = threading.Event()
+        remaining = {name: len(deps) for name, (function, deps) in self.stages.items()}
+        dependents = {name: [] for name in self.stages}
+        for name, (function, deps) in self.stages.items():
+            for dep in deps:
+                dependents[dep].append(name)
+        pending = [len(self.stages)]
+        
+        with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+            def run_stage(name):
+                function, deps = self.stages[name]
+                failed = [dep for dep in deps if dep in self.errors]
+                try:
+                    if failed:
+                        # A stage whose inputs failed is skipped, reporting the original error.
+                        raise self.errors[failed[0]]
+                    self.results[name] = function(*(self.results[dep] for dep in deps))
+                except BaseException as e:
+                    self.errors[name] = e
+                with lock:
+                    ready = []
+                    for dependent in dependents[name]:
+                        remaining[dependent] -= 1
+                        if remaining[dependent] == 0:
+                            ready.append(dependent)
+                    pending[0] -= 1
+                    if pending[0] == 0:
+                        finished.set()
+                for dependent in ready:
+                    executor.submit(run_stage, dependent)
+            
+            with lock:
+                for name in self.order:
+                    if remaining[name] == 0:
+                        executor.submit(run_stage, name)
+                if not self.stages:
+                    finished.set()
+            finished.wait()
+        
+        for name in self.order:
+            if name in self.errors:
+                raise self.errors[name]
+        return self.results
+    
+    def result(self, name):
+        return self.results[name]
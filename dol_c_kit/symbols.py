@@ -0,0 +1,171 @@
+import os
+import struct
+import sys
+from array import array
+from bisect import bisect_left, bisect_right
+
+from dol_c_kit.elf import ElfSection, SHN_UNDEF, SHN_ABS, ShndxNames
+
+LinkCacheMagic = b"DCKLINK\x01"
+LinkCacheHeader = struct.Struct(">8s20sIII")
+LinkCacheSection = struct.Struct(">IIIIIIIII")
+
+class SymbolTable(object):
+    # Symbols of the linked project, stored as parallel array columns indexed through an interned
+    # name -> index dict.  Looking a symbol up by name returns a small dict shaped like a pyelftools
+    # symbol entry, so hooks can keep using symbols[sym_name]['st_value'].
+    def __init__(self):
+        self.names = []
+        self.indices = {}
+        self.values = array('I')
+        self.sizes = array('I')
+        self.sections = array('H')
+        # Indices of symbols without a value, such as _SDA_BASE_ when set_sda_bases was never called
+        self.undefined = set()
+        self.__address_order = None
+        self.__address_values = None
+    
+    def add(self, name, value, size=0, section=SHN_ABS):
+        # Adding a name that already exists replaces it, like assigning to a dict.
+        index = self.indices.get(name)
+        if index is None:
+            index = len(self.names)
+            name = sys.intern(name)
+            self.names.append(name)
+            self.indices[name] = index
+            self.values.append(0)
+            self.sizes.append(0)
+            self.sections.append(0)
+        if value is None:
+            self.undefined.add(index)
+            value = 0
+        else:
+            self.undefined.discard(index)
+        self.values[index] = value
+        self.sizes[index] = size
+        self.sections[index] = section
+        self.__address_order = None
+    
+    def value(self, name):
+        index = self.indices[name]
+        return None if index in self.undefined else self.values[index]
+    
+    def lookup(self, address):
+        # Returns the name of the symbol containing an address, or else the closest one before it.
+        # Absolute and undefined symbols are not considered.
+        if self.__address_order is None:
+            self.__build_address_index()
+        i = bisect_right(self.__address_values, address)
+        if i == 0:
+            return None
+        # Of several symbols at the same address, the first one in the symbol table wins.
+        i = bisect_left(self.__address_values, self.__address_values[i - 1])
+        return self.names[self.__address_order[i]]
+    
+    def by_address(self):
+        # Yields (name, value, size, section) for every symbol with a section index, sorted by address.
+        if self.__address_order is None:
+            self.__build_address_index()
+        for index in self.__address_order:
+            yield (self.names[index], self.values[index], self.sizes[index], self.sections[index])
+    
+    def copy(self, defined_only=False):
+        table = SymbolTable()
+        for index, name in enumerate(self.names):
+            if index in self.undefined:
+                if not defined_only:
+                    table.add(name, None, self.sizes[index], self.sections[index])
+            else:
+                table.add(name, self.values[index], self.sizes[index], self.sections[index])
+        return table
+    
+    def clear(self):
+        self.__init__()
+    
+    def get(self, name, default=None):
+        return self[name] if name in self.indices else default
+    
+    def __contains__(self, name):
+        return name in self.indices
+    
+    def __getitem__(self, name):
+        index = self.indices[name]
+        section = self.sections[index]
+        return {'st_value': None if index in self.undefined else self.values[index],
+                'st_size': self.sizes[index],
+                'st_shndx': ShndxNames.get(section, section)}
+    
+    def __iter__(self):
+        return iter(self.names)
+    
+    def __len__(self):
+        return len(self.names)
+    
+    def __build_address_index(self):
+        order = [index for index in range(len(self.names))
+                 if self.sections[index] not in (SHN_UNDEF, SHN_ABS) and index not in self.undefined]
+        # Sorting is stable, so symbols sharing an address stay in symbol table order.
+        order.sort(key=self.values.__getitem__)
+        self.__address_order = array('I', order)
+        self.__address_values = array('I', (self.values[index] for index in order))
+
+def save_link_cache(filepath, key, sections, table):
+    # Binary layout, all big-endian: a header with the hash of the ELF the data came from, the
+    # section headers, the value/size/section columns of the symbol table, then every section
+    # name and symbol name joined by NULs.  Symbols without a value are not stored.
+    if table.undefined:
+        table = table.copy(defined_only=True)
+    names = b"\0".join(name.encode() for name in [section.name for section in sections] + table.names)
+    values, sizes, symbol_sections = table.values, table.sizes, table.sections
+    if sys.byteorder == "little":
+        values, sizes, symbol_sections = array('I', values), array('I', sizes), array('H', symbol_sections)
+        for column in (values, sizes, symbol_sections):
+            column.byteswap()
+    temp = filepath + ".tmp"
+    with open(temp, "wb") as f:
+        f.write(LinkCacheHeader.pack(LinkCacheMagic, bytes.fromhex(key), len(sections), len(table), len(names)))
+        for section in sections:
+            f.write(LinkCacheSection.pack(section.index, section.type, section.flags, section.addr,
+                                          section.offset, section.size, section.link, section.info, section.entsize))
+        f.write(values.tobytes())
+        f.write(sizes.tobytes())
+        f.write(symbol_sections.tobytes())
+        f.write(names)
+    os.replace(temp, filepath)
+
+def load_link_cache(filepath, key):
+    # Returns (sections, table), or None if the cache is missing, truncated, corrupt, or belongs to a
+    # different ELF.
+    try:
+        with open(filepath, "rb") as f:
+            data = f.read()
+    except OSError:
+        return None
+    if len(data) < LinkCacheHeader.size:
+        return None
+    magic, digest, section_count, symbol_count, names_size = LinkCacheHeader.unpack_from(data)
+    if magic != LinkCacheMagic or digest != bytes.fromhex(key):
+        return None
+    table = SymbolTable()
+    offset = LinkCacheHeader.size + section_count * LinkCacheSection.size
+    if offset + symbol_count * sum(column.itemsize for column in (table.values, table.sizes, table.sections)) + names_size != len(data):
+        return None
+    try:
+        headers = [LinkCacheSection.unpack_from(data, LinkCacheHeader.size + i * LinkCacheSection.size) for i in range(section_count)]
+        for column in (table.values, table.sizes, table.sections):
+            size = symbol_count * column.itemsize
+            column.frombytes(data[offset:offset+size])
+            if sys.byteorder == "little":
+                column.byteswap()
+            offset += size
+        names = [sys.intern(name) for name in data[offset:offset+names_size].decode().split("\0")] if section_count + symbol_count else []
+    except (struct.error, UnicodeDecodeError):
+        return None
+    if len(names) != section_count + symbol_count \
+    or not len(table.values) == len(table.sizes) == len(table.sections) == symbol_count:
+        return None
+    sections = [ElfSection(index, name, sh_type, flags, addr, sh_offset, size, link, info, entsize)
+                for (index, sh_type, flags, addr, sh_offset, size, link, info, entsize), name in zip(headers, names)]
+    table.names = names[section_count:]
+    table.indices = {name: index for index, name in enumerate(table.names)}
+    return (sections, table)
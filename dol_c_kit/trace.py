@@ -0,0 +1,76 @@
+import json
+import os
+import threading
+import time
+from contextlib import contextmanager
+
+class BuildTrace(object):
+    # Records wall and CPU time of build stages as Chrome trace events ("X" complete events), which
+    # can be opened in chrome://tracing or https://ui.perfetto.dev.  Each thread gets its own track,
+    # so parallel compile jobs show up as concurrent spans.
+    def __init__(self):
+        self.events = []
+        self.lock = threading.Lock()
+        self.origin = time.perf_counter()
+        self.thread_ids = {}
+    
+    @contextmanager
+    def span(self, name, category="build", **args):
+        start = time.perf_counter()
+        cpu_start = time.thread_time()
+        try:
+            yield args
+        finally:
+            self.add_span(name, category, start, time.perf_counter(), time.thread_time() - cpu_start, **args)
+    
+    def add_span(self, name, category, start, end, cpu_time, **args):
+        # start and end are time.perf_counter() values.  cpu_time is in seconds.
+        args["cpu_ms"] = round(cpu_time * 1000, 3)
+        with self.lock:
+            tid = self.thread_ids.setdefault(threading.get_ident(), len(self.thread_ids) + 1)
+            self.events.append({
+                "name": name,
+                "cat": category,
+                "ph": "X",
+                "ts": round((start - self.origin) * 1000000, 3),
+                "dur": round((end - start) * 1000000, 3),
+                "pid": os.getpid(),
+                "tid": tid,
+                "args": args,
+            })
+    
+    def merge(self, events):
+        # Adds events recorded by a copy of this trace in another process
+        with self.lock:
+            self.events.extend(events)
+    
+    def __getstate__(self):
+        # A copy sent to another process starts out empty but keeps the origin, so its events line up
+        # with this trace's once they are merged back.
+        return {"origin": self.origin}
+    
+    def __setstate__(self, state):
+        self.__init__()
+        self.origin = state["origin"]
+    
+    def save(self, trace_path):
+        with self.lock:
+            events = list(self.events)
+        with open(trace_path, "w") as f:
+            json.dump({"traceEvents": events, "displayTimeUnit": "ms"}, f)
+    
+    def summary(self):
+        # One row per category, and one per span name for everything except the (numerous) compile jobs
+        rows = {}
+        with self.lock:
+            for event in self.events:
+                key = event["cat"] if event["cat"] == "compile" else "{}/{}".format(event["cat"], event["name"])
+                count, wall, cpu, longest, longest_name = rows.get(key, (0, 0.0, 0.0, 0.0, ""))
+                if event["dur"] > longest:
+                    longest, longest_name = event["dur"], event["name"]
+                rows[key] = (count + 1, wall + event["dur"], cpu + event["args"]["cpu_ms"] * 1000, longest, longest_name)
+        lines = ["{:32s} {:>5s} {:>11s} {:>11s}  {}".format("Stage", "Count", "Wall (ms)", "CPU (ms)", "Longest")]
+        for key, (count, wall, cpu, longest, longest_name) in sorted(rows.items(), key=lambda row: -row[1][1]):
+            lines.append("{:32s} {:5d} {:11.1f} {:11.1f}  {} ({:.1f} ms)".format(
+                key[:32], count, wall / 1000, cpu / 1000, longest_name, longest / 1000))
+        return "\n".join(lines)
@@ -0,0 +1,45 @@
+import os
+import subprocess
+import threading
+
+class WineServer(object):
+    # Keeps a persistent wineserver running for a Wine prefix, so every CodeWarrior invocation attaches
+    # to an already initialized session instead of booting Wine from scratch.  Each tool still runs in
+    # its own short-lived Wine process; only the server and the prefix's services are kept warm, by one
+    # trivial client run when the server starts.
+    def __init__(self, wine_path="wine", wineserver_path="wineserver", prefix=None, persist_seconds=300):
+        self.wine_path = wine_path
+        self.wineserver_path = wineserver_path
+        self.prefix = prefix
+        self.persist_seconds = persist_seconds
+        self.is_started = False
+        self.lock = threading.Lock()
+    
+    def env(self):
+        env = dict(os.environ)
+        if self.prefix:
+            env["WINEPREFIX"] = self.prefix
+        # Wine's debug channels and the "fixme" spew cost more than the compile for small files.
+        env.setdefault("WINEDEBUG", "-all")
+        return env
+    
+    def start(self):
+        with self.lock:
+            if self.is_started:
+                return
+            env = self.env()
+            # -p keeps the server alive for persist_seconds after its last client disconnects.
+            subprocess.call([self.wineserver_path, "-p{}".format(self.persist_seconds)], env=env)
+            subprocess.call([self.wine_path, "cmd", "/c", "exit"], env=env,
+                            stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+            self.is_started = True
+    
+    def stop(self):
+        with self.lock:
+            subprocess.call([self.wineserver_path, "-k"], env=self.env(),
+                            stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+            self.is_started = False
+    
+    def wrap(self, args):
+        self.start()
+        return [self.wine_path] + list(args)
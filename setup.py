@@ -12,5 +12,6 @@ setuptools.setup(
     packages=setuptools.find_packages(),
     include_package_data=True,
     install_requires=("dolreader", "pyelftools", "geckolibs"),
+    extras_require={"numpy": ("numpy",)},
     python_requires=">=3.8",
 )
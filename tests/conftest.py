@@ -0,0 +1,56 @@
+import os
+
+import pytest
+
+from dolreader.dol import DolFile
+from dolreader.section import TextSection, DataSection
+
+from dol_c_kit.devkit_tools import Project
+
+from stub_toolchain import make_toolchain
+
+def make_dol():
+    # Two adjacent text sections and a data section after a gap, each filled with a distinct pattern
+    dol = DolFile()
+    dol.textSections.append(TextSection(0x80003000, bytes(range(0x00, 0x100)), 0x100))
+    dol.textSections.append(TextSection(0x80003100, bytes(range(0xFF, -1, -1)), 0x200))
+    dol.dataSections.append(DataSection(0x80004000, bytes(0x80 * [0xAA]), 0x300))
+    dol.bssAddress = 0x80004080
+    dol.bssSize = 0x100
+    dol.entryPoint = 0x80003000
+    return dol
+
+@pytest.fixture
+def dol():
+    return make_dol()
+
+@pytest.fixture
+def dol_path(tmp_path):
+    path = str(tmp_path / "in.dol")
+    with open(path, "wb") as f:
+        make_dol().save(f)
+    return path
+
+@pytest.fixture
+def toolchain(tmp_path):
+    # The directory of a stub devkitPPC (see stub_toolchain.py)
+    if os.name == "nt":
+        pytest.skip("The stub toolchain needs a POSIX shell")
+    return str(tmp_path / "toolchain")
+
+@pytest.fixture
+def project(tmp_path, monkeypatch, toolchain, dol_path):
+    # A Project built with the stub toolchain from tmp_path, where src/ holds its sources
+    monkeypatch.chdir(tmp_path)
+    os.makedirs("src")
+    project = Project(base_addr=0x80005000, jobs=2)
+    project.devkitppc_path = make_toolchain(toolchain)
+    project.src_dir = "src/"
+    project.obj_dir = "obj/"
+    project.use_object_cache = False
+    return project
+
+def write_source(filepath, text):
+    os.makedirs(os.path.dirname(filepath) or ".", exist_ok=True)
+    with open(filepath, "w") as f:
+        f.write(text)
@@ -0,0 +1,204 @@
+import json
+import os
+import re
+import struct
+import sys
+import time
+
+# A stand-in for devkitPPC's gcc, g++, as, and ld, for building Projects without a PowerPC toolchain.
+# Each tool is a shell script that runs this file.  "Objects" are copies of their sources, and the
+# linker lays them out one after another in .text, with a symbol named after each one.  A source
+# containing FAIL doesn't compile, "SLEEP <seconds>" makes its compile take that long, and an
+# object containing NOLINK doesn't link.  Every invocation is logged to <toolchain>/log.
+
+Tools = ("powerpc-eabi-gcc", "powerpc-eabi-g++", "powerpc-eabi-as", "powerpc-eabi-ld")
+
+def make_toolchain(directory):
+    # Returns the path to set devkitppc_path to
+    os.makedirs(directory, exist_ok=True)
+    for tool in Tools:
+        path = os.path.join(directory, tool)
+        with open(path, "w") as f:
+            f.write("#!/bin/sh\nexec \"{}\" \"{}\" \"$0\" \"$@\"\n".format(sys.executable, os.path.abspath(__file__)))
+        os.chmod(path, 0o755)
+    return directory + "/"
+
+def read_log(directory):
+    # Returns the logged events, each a dict with the event ("start" or "end"), tool, args, cwd, and time
+    try:
+        with open(os.path.join(directory, "log"), "r") as f:
+            return [json.loads(line) for line in f]
+    except OSError:
+        return []
+
+def log(tool_path, event, args, **extra):
+    entry = dict(event=event, tool=os.path.basename(tool_path), args=args, cwd=os.getcwd(), time=time.time(), **extra)
+    with open(os.path.join(os.path.dirname(tool_path), "log"), "a") as f:
+        f.write(json.dumps(entry) + "\n")
+
+def find_include(name, current_dir, include_dirs):
+    for directory in [current_dir] + include_dirs:
+        path = os.path.join(directory, name)
+        if os.path.isfile(path):
+            return path
+    return None
+
+def resolve_includes(path, include_dirs, found):
+    # Follows every #include "..." the way the preprocessor would, raising on one it can't find.
+    with open(path, "r") as f:
+        text = f.read()
+    for name in re.findall(r'#include\s+"([^"]+)"', text):
+        include = find_include(name, os.path.dirname(path), include_dirs)
+        if include is None:
+            raise RuntimeError("{}: fatal error: {}: No such file or directory".format(path, name))
+        if include not in found:
+            found.append(include)
+            resolve_includes(include, include_dirs, found)
+    return text
+
+def compile(args):
+    output = depfile = None
+    write_deps = False
+    include_dirs = []
+    forced_includes = []
+    sources = []
+    i = 0
+    while i < len(args):
+        arg = args[i]
+        if arg in ("-o", "-MF", "--MD", "-I", "-iquote", "-isystem", "-include", "-x"):
+            value = args[i+1]
+            if arg == "-o":
+                output = value
+            elif arg in ("-MF", "--MD"):
+                depfile = value
+            elif arg == "-include":
+                forced_includes.append(value)
+            elif arg != "-x":
+                include_dirs.append(value)
+            i += 2
+            continue
+        if arg == "-MMD":
+            write_deps = True
+        elif arg.startswith("-I"):
+            include_dirs.append(arg[2:])
+        elif not arg.startswith("-"):
+            sources.append(arg)
+        i += 1
+    
+    for source in sources:
+        deps = []
+        try:
+            for include in forced_includes:
+                if not os.path.isfile(include):
+                    raise RuntimeError("{}: fatal error: {}: No such file or directory".format(source, include))
+                deps.append(include)
+                resolve_includes(include, include_dirs, deps)
+            text = resolve_includes(source, include_dirs, deps)
+        except RuntimeError as e:
+            print(e, file=sys.stderr)
+            return 1
+        match = re.search(r"SLEEP (\S+)", text)
+        if match:
+            time.sleep(float(match.group(1)))
+        if "FAIL" in text:
+            print("{}: error: FAIL".format(source), file=sys.stderr)
+            return 3
+        obj = output or os.path.splitext(os.path.basename(source))[0] + ".o"
+        with open(obj, "w") as f:
+            f.write(text)
+        if depfile or write_deps:
+            with open(depfile or os.path.splitext(obj)[0] + ".d", "w") as f:
+                f.write("{}: {}\n".format(obj, " \\\n ".join([source] + deps)))
+    return 0
+
+def link(args):
+    output = map_path = None
+    base_addr = 0x80000000
+    objects = []
+    i = 0
+    while i < len(args):
+        arg = args[i]
+        if arg in ("-o", "--defsym", "-T", "-Map"):
+            value = args[i+1]
+            if arg == "-o":
+                output = value
+            elif arg == "--defsym" and value.startswith(".="):
+                base_addr = int(value[2:], 0)
+            elif arg == "-Map":
+                map_path = value
+            i += 2
+            continue
+        if not arg.startswith("-"):
+            objects.append(arg)
+        i += 1
+    
+    text = bytearray()
+    symbols = []
+    for obj in objects:
+        with open(obj, "rb") as f:
+            data = f.read()
+        if b"NOLINK" in data:
+            print("{}: undefined reference to `NOLINK'".format(obj), file=sys.stderr)
+            return 1
+        symbols.append((os.path.basename(obj).split(".")[0], base_addr + len(text), len(data)))
+        text += data + bytes(-len(data) % 4)
+    write_elf(output, base_addr, bytes(text), symbols)
+    if map_path:
+        with open(map_path, "w") as f:
+            f.write("".join("{} {:08X}\n".format(name, value) for name, value, size in symbols))
+    return 0
+
+def write_elf(filepath, base_addr, text, functions):
+    # A big-endian ELF with .text, .data, and .bss, a global function for each of functions, gdata in
+    # .data, gbss in .bss, and a local, an absolute, and an undefined symbol, which are all skipped.
+    data = b"DATA"
+    data_addr = base_addr + len(text)
+    bss_addr = data_addr + len(data)
+    strtab = bytearray(b"\0")
+    symtab = bytearray(16)
+    def add_symbol(name, value, size, bind, sym_type, shndx):
+        symtab.extend(struct.pack(">IIIBBH", len(strtab), value, size, bind << 4 | sym_type, 0, shndx))
+        strtab.extend(name.encode() + b"\0")
+    add_symbol("local", base_addr, 0, 0, 2, 1)
+    for name, value, size in functions:
+        add_symbol(name, value, size, 1, 2, 1)
+    add_symbol("gdata", data_addr, 4, 1, 1, 2)
+    add_symbol("gbss", bss_addr, 4, 1, 1, 3)
+    add_symbol("abs_sym", 0x80001234, 0, 1, 0, 0xFFF1)
+    add_symbol("undef_sym", 0, 0, 1, 0, 0)
+    shstrtab = b"\0.text\0.data\0.bss\0.symtab\0.strtab\0.shstrtab\0"
+    text_offset = 64
+    data_offset = text_offset + len(text)
+    symtab_offset = data_offset + len(data)
+    strtab_offset = symtab_offset + len(symtab)
+    shstrtab_offset = strtab_offset + len(strtab)
+    shoff = (shstrtab_offset + len(shstrtab) + 3) & ~3
+    headers = [
+        (0, 0, 0, 0, 0, 0, 0, 0, 0, 0),
+        (shstrtab.index(b".text"), 1, 6, base_addr, text_offset, len(text), 0, 0, 4, 0),
+        (shstrtab.index(b".data"), 1, 3, data_addr, data_offset, len(data), 0, 0, 4, 0),
+        (shstrtab.index(b".bss"), 8, 3, bss_addr, symtab_offset, 0x10, 0, 0, 4, 0),
+        (shstrtab.index(b".symtab"), 2, 0, 0, symtab_offset, len(symtab), 5, 2, 4, 16),
+        (shstrtab.index(b".strtab"), 3, 0, 0, strtab_offset, len(strtab), 0, 0, 1, 0),
+        (shstrtab.index(b".shstrtab"), 3, 0, 0, shstrtab_offset, len(shstrtab), 0, 0, 1, 0),
+    ]
+    with open(filepath, "wb") as f:
+        f.write(b"\x7fELF\x01\x02\x01" + bytes(9))
+        f.write(struct.pack(">HHIIIIIHHHHHH", 2, 20, 1, base_addr, 0, shoff, 0, 52, 0, 0, 40, len(headers), len(headers) - 1))
+        f.write(bytes(text_offset - f.tell()))
+        f.write(text + data + symtab + strtab + shstrtab)
+        f.write(bytes(shoff - f.tell()))
+        for header in headers:
+            f.write(struct.pack(">IIIIIIIIII", *header))
+
+def main(tool_path, args):
+    log(tool_path, "start", args)
+    if os.path.basename(tool_path) == "powerpc-eabi-ld":
+        returncode = link(args)
+    else:
+        returncode = compile(args)
+    log(tool_path, "end", args, returncode=returncode)
+    return returncode
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1], sys.argv[2:]))
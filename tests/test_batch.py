@@ -0,0 +1,76 @@
+import os
+
+import pytest
+
+from stub_toolchain import read_log
+
+from conftest import write_source
+
+def compiles(toolchain):
+    return [entry for entry in read_log(toolchain) if entry["tool"] == "powerpc-eabi-gcc" and entry["event"] == "end"]
+
+def sources(entry):
+    return sorted(os.path.relpath(arg) for arg in entry["args"] if arg.endswith(".c"))
+
+def test_batches(project, toolchain, dol_path):
+    project.batch_compile = True
+    project.incremental = True
+    # The include paths are relative to the project, not to the batch directory the compiler runs in
+    project.c_flags += ["-iquote", "quote", "-include", "force.h", "-Iinc"]
+    write_source("quote/q.h", "q\n")
+    write_source("force.h", "force\n")
+    write_source("inc/i.h", "i\n")
+    write_source("src/a.c", "#include \"q.h\"\n#include \"i.h\"\na\n")
+    for name in ("b.c", "c.c", "sub/a.c", "d.c"):
+        write_source("src/" + name, name + "\n")
+    os.makedirs("obj/sub")
+    for name in ("a.c", "b.c", "c.c", "sub/a.c"):
+        project.add_c_file(name)
+    project.add_c_file("d.c", ("-DD",))
+    project.build_dol(dol_path, "out.dol")
+
+    # Two batches of the global flags, which can't share the stem "a", and one of d.c's flags
+    entries = compiles(toolchain)
+    assert sorted(sources(entry) for entry in entries) == [
+        ["src/a.c", "src/c.c"], ["src/b.c", "src/sub/a.c"], ["src/d.c"]]
+    for entry in entries:
+        assert os.path.dirname(entry["cwd"]) == os.path.abspath("obj")
+        assert entry["returncode"] == 0
+    assert [name for name in os.listdir("obj") if name.startswith(".batch")] == []
+    for name in ("a.c", "b.c", "c.c", "sub/a.c", "d.c"):
+        with open("obj/" + name + ".o") as obj, open("src/" + name) as src:
+            assert obj.read() == src.read()
+        assert os.path.isfile("obj/" + name + ".d")
+    assert [filename for filename, do_cleanup in project.obj_files] == ["a.c.o", "b.c.o", "c.c.o", "sub/a.c.o", "d.c.o"]
+
+def test_relative_paths_in_flags_are_not_batched(project, toolchain, dol_path):
+    project.batch_compile = True
+    write_source("my.specs", "")
+    for name in ("a.c", "b.c"):
+        write_source("src/" + name, name + "\n")
+        project.add_c_file(name, ("-specs=my.specs",))
+    project.build_dol(dol_path, "out.dol")
+    entries = compiles(toolchain)
+    assert sorted(sources(entry) for entry in entries) == [["src/a.c"], ["src/b.c"]]
+    for entry in entries:
+        assert entry["cwd"] == os.getcwd()
+        assert "-specs=my.specs" in entry["args"]
+
+@pytest.mark.parametrize("batch_compile", [False, True])
+def test_precompiled_header(project, toolchain, dol_path, batch_compile):
+    project.batch_compile = batch_compile
+    project.precompiled_header = "inc/pch.h"
+    # The copy of the header in obj_dir still finds the headers next to the original
+    write_source("src/inc/pch.h", "#include \"types.h\"\n")
+    write_source("src/inc/types.h", "types\n")
+    for name in ("a.cpp", "b.cpp"):
+        write_source("src/" + name, name + "\n")
+        project.add_cpp_file(name)
+    project.build_dol(dol_path, "out.dol")
+    entries = [entry for entry in read_log(toolchain) if entry["tool"] == "powerpc-eabi-g++" and entry["event"] == "end"]
+    assert [entry["returncode"] for entry in entries] == [0] * len(entries)
+    assert "c++-header" in entries[0]["args"]
+    assert len(entries) == 3
+    assert all(os.path.basename(entry["cwd"]).startswith(".batch") == batch_compile for entry in entries[1:])
+    for name in ("a.cpp", "b.cpp"):
+        assert os.path.isfile("obj/" + name + ".o")
@@ -0,0 +1,115 @@
+import os
+
+from dol_c_kit.buildcache import ObjectCache, DependencyGraph, fingerprint, include_paths_from_args, parse_depfile, scan_headers, scan_headers_from_args
+
+def write(path, text):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, "w") as f:
+        f.write(text)
+    return path
+
+def test_include_paths_from_args(tmp_path):
+    args = ["gcc", "-c", "a.c", "-I", "src/", "-Iinclude", "-i", "cw/", "-O2", "-iquote", "quote/", "-iquotejoined",
+            "-isystem", "sys/", "-idirafter", "after/", "-include", "pch.h", "-imacros", "macros.h", "-prefix", "prefix.h",
+            "-inline", "auto"]
+    assert include_paths_from_args(args) == (["quote/", "joined"], ["src/", "include", "cw/", "sys/", "after/"],
+                                             ["pch.h", "macros.h", "prefix.h"])
+    os.makedirs(str(tmp_path / "tree" / "b" / "c"))
+    os.makedirs(str(tmp_path / "tree" / "a"))
+    tree = str(tmp_path / "tree")
+    assert include_paths_from_args(["mwcceppc", "-ir", tree])[1] == [tree, os.path.join(tree, "a"), os.path.join(tree, "b"),
+                                                                    os.path.join(tree, "b", "c")]
+    for flag in (["-I-"], ["-iprefix", "x/"], ["--sysroot=x/"], ["-isysroot", "x/"], ["-I"]):
+        assert include_paths_from_args(["gcc", "-c", "a.c"] + flag) is None
+
+def test_object_cache_key_follows_headers(tmp_path):
+    src = write(str(tmp_path / "src" / "a.c"), "#include \"a.h\"\nint a;\n")
+    header = write(str(tmp_path / "inc" / "a.h"), "#define A 1\n")
+    cache = ObjectCache(str(tmp_path / "cache"), 1 << 20)
+    args = ["missing-gcc", "-c", src, "-I", str(tmp_path / "inc")]
+    key = cache.key(src, args)
+    assert key == ObjectCache(str(tmp_path / "cache"), 1 << 20).key(src, args)
+    assert cache.key(src, args + ["-O2"]) != key
+    write(header, "#define A 2\n")
+    assert ObjectCache(str(tmp_path / "cache"), 1 << 20).key(src, args) != key
+
+def test_object_cache_skips_computed_includes(tmp_path):
+    src = write(str(tmp_path / "a.c"), "#include HEADER\n")
+    cache = ObjectCache(str(tmp_path / "cache"), 1 << 20)
+    assert cache.key(src, ["missing-gcc", "-c", src]) is None
+    assert not cache.fetch(None, str(tmp_path / "a.o"))
+
+def test_object_cache_store_and_fetch(tmp_path):
+    cache = ObjectCache(str(tmp_path / "cache"), 1 << 20)
+    obj = write(str(tmp_path / "a.o"), "object")
+    out = str(tmp_path / "b.o")
+    assert not cache.fetch("ab" * 20, out)
+    cache.store("ab" * 20, obj)
+    assert cache.fetch("ab" * 20, out)
+    with open(out) as f:
+        assert f.read() == "object"
+    assert (cache.hits, cache.misses) == (1, 1)
+
+def test_object_cache_evicts_least_recently_used(tmp_path):
+    cache = ObjectCache(str(tmp_path / "cache"), 150)
+    obj = write(str(tmp_path / "a.o"), "x" * 100)
+    for i, key in enumerate(("aa" * 20, "bb" * 20)):
+        cache.store(key, obj)
+        entry = os.path.join(cache.cache_dir, key[:2], key + ".o")
+        os.utime(entry, ns=(i * 10**9, i * 10**9))
+    assert cache.evict() == 100
+    assert not cache.fetch("aa" * 20, str(tmp_path / "out.o"))
+    assert cache.fetch("bb" * 20, str(tmp_path / "out.o"))
+
+def test_scan_headers(tmp_path):
+    src = write(str(tmp_path / "src" / "a.c"), "#include \"a.h\"\n#include <b.h>\n#include <stdio.h>\n")
+    a = write(str(tmp_path / "src" / "a.h"), "#include <b.h>\n")
+    b = write(str(tmp_path / "inc" / "b.h"), "  # include \"a.h\"\n")
+    assert scan_headers(src, [str(tmp_path / "inc"), str(tmp_path / "src")]) == [src, os.path.normpath(a), os.path.normpath(b)]
+    # A quoted include that can't be found isn't a toolchain header
+    assert scan_headers(src, [str(tmp_path / "inc")]) is None
+
+def test_scan_headers_from_args(tmp_path):
+    src = write(str(tmp_path / "src" / "a.c"), "#include \"q.h\"\n")
+    q = write(str(tmp_path / "quote" / "q.h"), "\n")
+    pch = write(str(tmp_path / "pch" / "pch.h"), "#include <s.h>\n")
+    s = write(str(tmp_path / "sys" / "s.h"), "\n")
+    args = ["gcc", "-c", src, "-iquote", str(tmp_path / "quote"), "-isystem", str(tmp_path / "sys"), "-include", pch]
+    assert scan_headers_from_args(src, args) == [src, pch, os.path.normpath(q), os.path.normpath(s)]
+    # Quote directories aren't searched for angled includes
+    write(src, "#include <q.h>\n")
+    assert scan_headers_from_args(src, args) == [src, pch, os.path.normpath(s)]
+    assert scan_headers_from_args(src, args[:-1] + [str(tmp_path / "missing.h")]) is None
+    assert scan_headers_from_args(src, args + ["-I-"]) is None
+
+def test_parse_depfile(tmp_path):
+    depfile = write(str(tmp_path / "a.d"), "obj/a.c.o: src/a.c \\\n src/a.h src/with\\ space.h \\\n src/a.h\n\nsrc/a.h:\n")
+    assert parse_depfile(depfile) == ["src/a.c", "src/a.h", "src/with space.h"]
+
+def test_dependency_graph(tmp_path):
+    obj = write(str(tmp_path / "a.o"), "object")
+    header = write(str(tmp_path / "a.h"), "#define A 1\n")
+    graph = DependencyGraph(str(tmp_path / "project.deps"))
+    args = ["gcc", "-c", "a.c"]
+    assert not graph.is_up_to_date(obj, args)
+    graph.record(obj, args, [header])
+    graph.save()
+    
+    graph = DependencyGraph(str(tmp_path / "project.deps"))
+    assert graph.is_up_to_date(obj, args)
+    assert not graph.is_up_to_date(obj, args + ["-O2"])
+    write(header, "#define A 22\n")
+    assert not graph.is_up_to_date(obj, args)
+    graph.record(obj, args, [header])
+    os.remove(obj)
+    assert not graph.is_up_to_date(obj, args)
+
+def test_fingerprint(tmp_path):
+    obj = write(str(tmp_path / "a.o"), "object")
+    script = str(tmp_path / "link.ld")
+    args = ["ld", "-o", "project.o"]
+    key = fingerprint(args, [obj, script])
+    assert fingerprint(args, [obj, script]) == key
+    assert fingerprint(args + ["--defsym=_SDA_BASE_=0x80400000"], [obj, script]) != key
+    write(script, "SECTIONS {}\n")
+    assert fingerprint(args, [obj, script]) != key
@@ -0,0 +1,37 @@
+import os
+
+from dol_c_kit.dolcache import DolCache
+
+def test_views_share_the_cached_bytes(dol_path):
+    cache = DolCache()
+    first = cache.load(dol_path)
+    second = cache.load(dol_path)
+    assert (cache.hits, cache.misses) == (1, 1)
+    assert first is not second
+    assert first.textSections[0].data.getvalue() is second.textSections[0].data.getvalue()
+    assert [section.size for section in first.sections] == [0x100, 0x100, 0x80]
+    assert (first.bssAddress, first.bssSize, first.entryPoint) == (0x80004080, 0x100, 0x80003000)
+
+def test_writes_stay_in_their_view(dol_path):
+    cache = DolCache()
+    dol = cache.load(dol_path)
+    dol.seek(0x80003000)
+    dol.write(b"\xFF\xFF\xFF\xFF")
+    assert dol.textSections[0].data.getvalue()[:4] == b"\xFF\xFF\xFF\xFF"
+    assert cache.load(dol_path).textSections[0].data.getvalue()[:4] == b"\x00\x01\x02\x03"
+
+def test_changed_files_are_parsed_again(dol_path):
+    cache = DolCache()
+    cache.load(dol_path)
+    # Touched, but the same bytes
+    os.utime(dol_path, ns=(0, 0))
+    cache.load(dol_path)
+    assert (cache.hits, cache.misses) == (1, 1)
+    with open(dol_path, "r+b") as f:
+        f.seek(0x100)
+        f.write(b"\xFF")
+    assert cache.load(dol_path).textSections[0].data.getvalue()[0] == 0xFF
+    assert (cache.hits, cache.misses) == (1, 2)
+    cache.clear()
+    cache.load(dol_path)
+    assert cache.misses == 3
@@ -0,0 +1,61 @@
+import pytest
+
+from dolreader.dol import UnmappedAddressError
+
+from dol_c_kit.dolimage import DolImage
+from dol_c_kit.patch import PatchPlan, PatchRecorder
+
+from conftest import make_dol
+
+def test_find_matches_section_index(dol):
+    image = DolImage(dol)
+    assert image.find(0x80003000) == 0
+    assert image.find(0x800031FF) == 1
+    assert image.find(0x80003200) is None
+    assert image.find(0x8000407F) == 2
+    assert image.find(0x80004080) is None
+    assert image.find(0x7FFFFFFF) is None
+
+def test_writes_reach_the_dol_on_commit(dol):
+    image = DolImage(dol)
+    image.write_uint32(0x80003010, 0x11223344)
+    image.insert_branch(0x80003100, 0x80004000)
+    assert dol.textSections[0].data.getvalue()[0x10:0x14] == bytes((0x10, 0x11, 0x12, 0x13))
+    assert image.dirty == {0, 2}
+    image.commit()
+    assert dol.textSections[0].data.getvalue()[0x10:0x14] == b"\x11\x22\x33\x44"
+    assert dol.dataSections[0].data.getvalue()[:4] == b"\x4B\xFF\xF1\x00"
+    assert dol.textSections[1].data.getvalue() == bytes(range(0xFF, -1, -1))
+
+def test_write_stays_in_its_section(dol):
+    image = DolImage(dol)
+    image.seek(0x800031FE)
+    with pytest.raises(UnmappedAddressError):
+        image.write(b"\x00\x00\x00\x00")
+    # Adjacent sections are still separate sections for single writes
+    image.seek(0x800030FE)
+    with pytest.raises(UnmappedAddressError):
+        image.write(b"\x00\x00\x00\x00")
+    with pytest.raises(UnmappedAddressError):
+        image.seek(0x80003200)
+
+def test_write_run_spans_adjacent_sections(dol):
+    image = DolImage(dol)
+    image.write_run(0x800030FE, b"\x01\x02\x03\x04")
+    assert image.dirty == {0, 1}
+    with pytest.raises(UnmappedAddressError):
+        image.write_run(0x800031FE, b"\x00\x00\x00\x00")
+
+def test_plan_apply_matches_dol(dol):
+    plan = PatchPlan()
+    recorder = PatchRecorder(DolImage(dol), plan)
+    recorder.write_uint32(0x800030FC, 0xDEADBEEF)
+    recorder.write_uint16(0x80004010, 0xCAFE)
+    plan.add(0x800030FE, b"\x01\x02\x03\x04")
+    expected = make_dol()
+    plan.apply(expected)
+    image = DolImage(dol)
+    plan.apply(image)
+    image.commit()
+    for section, expected_section in zip(dol.sections, expected.sections):
+        assert section.data.getvalue() == expected_section.data.getvalue()
@@ -0,0 +1,81 @@
+import io
+import os
+
+from dolreader.dol import DolFile
+from dolreader.section import TextSection
+
+from dol_c_kit.doloutput import save_dol
+from dol_c_kit.dolpatch import DolHeaderSize
+from dol_c_kit.patch import PatchPlan
+
+Patches = [(0x80003010, b"\x11\x22\x33\x44"), (0x800030FC, b"\x55" * 8), (0x80004000, b"\x66\x66")]
+
+def build(in_dol_path, patches=Patches, datablob=b"\x12" * 0x40):
+    # Patches a DOL and appends a section to it, as build_dol does
+    with open(in_dol_path, "rb") as f:
+        dol = DolFile(f)
+    plan = PatchPlan()
+    for address, data in patches:
+        plan.add(address, data)
+    plan.apply(dol)
+    new_section = TextSection(0x80005000, datablob)
+    dol.append_section(new_section)
+    return (dol, plan, new_section)
+
+def save(in_dol_path, out_dol_path, *args, **kwargs):
+    dol, plan, new_section = build(in_dol_path, *args, **kwargs)
+    result = save_dol(dol, out_dol_path, True, plan, in_dol_path, new_section)
+    f = io.BytesIO()
+    dol.save(f)
+    with open(out_dol_path, "rb") as out:
+        assert out.read() == f.getvalue()
+    return result
+
+def test_unchanged_build_writes_nothing(dol_path, tmp_path):
+    out = str(tmp_path / "out.dol")
+    written, is_full = save(dol_path, out)
+    assert is_full and written == os.path.getsize(out)
+    assert save(dol_path, out) == (0, False)
+
+def test_only_changed_patches_are_written(dol_path, tmp_path):
+    out = str(tmp_path / "out.dol")
+    save(dol_path, out)
+    assert save(dol_path, out, [(0x80003010, b"\x11\x22\x33\x45")] + Patches[1:]) == (1, False)
+    # A patch that is gone is replaced by the input DOL's bytes, across both text sections
+    assert save(dol_path, out, Patches[:1] + Patches[2:]) == (9, False)
+    assert save(dol_path, out, Patches[:1] + Patches[2:] + [(0x80004010, b"\x77")]) == (1, False)
+
+def test_changed_program_data_is_written(dol_path, tmp_path):
+    out = str(tmp_path / "out.dol")
+    save(dol_path, out)
+    assert save(dol_path, out, datablob=b"\x34" * 0x40) == (0x40, False)
+
+def test_changed_header_is_written(dol_path, tmp_path):
+    out = str(tmp_path / "out.dol")
+    save(dol_path, out)
+    dol, plan, new_section = build(dol_path)
+    dol.entryPoint = 0x80003100
+    assert save_dol(dol, out, True, plan, dol_path, new_section) == (DolHeaderSize, False)
+
+def test_full_saves(dol_path, tmp_path):
+    out = str(tmp_path / "out.dol")
+    save(dol_path, out)
+    # The section table changed
+    assert save(dol_path, out, datablob=b"\x12" * 0x80)[1]
+    # The output DOL was changed by something else
+    os.utime(out, ns=(0, 0))
+    assert save(dol_path, out, datablob=b"\x12" * 0x80)[1]
+    # The input DOL changed
+    os.utime(dol_path, ns=(0, 0))
+    assert save(dol_path, out, datablob=b"\x12" * 0x80)[1]
+    assert not save(dol_path, out, datablob=b"\x12" * 0x80)[1]
+
+def test_block_hashes_without_a_plan(dol_path, tmp_path):
+    out = str(tmp_path / "out.dol")
+    save(dol_path, out)
+    dol, plan, new_section = build(dol_path)
+    assert save_dol(dol, out, True) == (os.path.getsize(out), True)
+    assert sorted(os.listdir(str(tmp_path))) == ["in.dol", "out.dol", "out.dol.blocks"]
+    dol, plan, new_section = build(dol_path, [(0x80003010, b"\x11\x22\x33\x45")])
+    # The whole DOL is smaller than one block
+    assert save_dol(dol, out, True) == (os.path.getsize(out), False)
@@ -0,0 +1,109 @@
+import io
+import os
+
+import pytest
+
+from dolreader.dol import DolFile
+from dolreader.section import TextSection
+
+from dol_c_kit.dolpatch import dol_header, dol_patch_records, save_dol_patch, apply_dol_patch, DolHeaderSize
+from dol_c_kit.patch import PatchPlan
+
+from conftest import make_dol
+
+def diff_records(old, new):
+    # (offset, bytes) for every range where new differs from old, or goes past its end
+    records = []
+    for offset in range(len(new)):
+        if offset < len(old) and old[offset] == new[offset]:
+            continue
+        if records and records[-1][0] + len(records[-1][1]) == offset:
+            records[-1][1].append(new[offset])
+        else:
+            records.append((offset, bytearray(new[offset:offset+1])))
+    return records
+
+def saved(dol):
+    f = io.BytesIO()
+    dol.save(f)
+    return f.getvalue()
+
+def patched_dol():
+    dol = make_dol()
+    dol.seek(0x80003010)
+    dol.write(b"\x11\x22\x33\x44")
+    dol.entryPoint = 0x80003100
+    dol.dataSections[0].data.seek(0, 2)
+    dol.dataSections[0].data.write(bytes(0x20))
+    return dol
+
+def test_dol_header(dol):
+    assert dol_header(dol) == saved(dol)[:DolHeaderSize]
+
+def test_round_trip(dol_path, tmp_path):
+    patch_path = str(tmp_path / "out.dol.patch")
+    out_path = str(tmp_path / "out.dol")
+    with open(dol_path, "rb") as f:
+        old = f.read()
+    new = saved(patched_dol())
+    assert len(new) > len(old)
+    save_dol_patch(patch_path, dol_path, len(new), diff_records(old, new))
+    assert apply_dol_patch(patch_path, dol_path, out_path) == len(new)
+    with open(out_path, "rb") as f:
+        assert f.read() == new
+
+def test_shrinking_dol(dol_path, tmp_path):
+    patch_path = str(tmp_path / "out.dol.patch")
+    out_path = str(tmp_path / "out.dol")
+    with open(dol_path, "rb") as f:
+        old = f.read()
+    save_dol_patch(patch_path, dol_path, len(old) - 0x40, [(0x10, b"\x01")])
+    apply_dol_patch(patch_path, dol_path, out_path)
+    with open(out_path, "rb") as f:
+        assert f.read() == old[:0x10] + b"\x01" + old[0x11:-0x40]
+
+def test_wrong_input_dol(dol_path, tmp_path):
+    patch_path = str(tmp_path / "out.dol.patch")
+    out_path = str(tmp_path / "out.dol")
+    save_dol_patch(patch_path, dol_path, os.path.getsize(dol_path), [])
+    with open(dol_path, "r+b") as f:
+        f.seek(0x100)
+        f.write(b"\xFF")
+    with pytest.raises(RuntimeError, match="different DOL"):
+        apply_dol_patch(patch_path, dol_path, out_path)
+    assert not os.path.exists(out_path)
+
+def test_corrupt_patches(dol_path, tmp_path):
+    patch_path = str(tmp_path / "out.dol.patch")
+    out_path = str(tmp_path / "out.dol")
+    size = os.path.getsize(dol_path)
+    with pytest.raises(RuntimeError, match="not a DOL patch"):
+        apply_dol_patch(dol_path, dol_path, out_path)
+    save_dol_patch(patch_path, dol_path, size, [(0x20, b"\x01"), (0x10, b"\x02")])
+    with pytest.raises(RuntimeError, match="out of order"):
+        apply_dol_patch(patch_path, dol_path, out_path)
+    save_dol_patch(patch_path, dol_path, size, [(0x10, b"\x01\x02")])
+    with open(patch_path, "r+b") as f:
+        f.truncate(os.path.getsize(patch_path) - 1)
+    with pytest.raises(RuntimeError, match="cut short"):
+        apply_dol_patch(patch_path, dol_path, out_path)
+
+def test_records_from_plans(dol_path, tmp_path):
+    patch_path = str(tmp_path / "out.dol.patch")
+    out_path = str(tmp_path / "out.dol")
+    with open(dol_path, "rb") as f:
+        dol = DolFile(f)
+    plans = (PatchPlan(), PatchPlan())
+    plans[0].add(0x80003010, b"\x11\x22\x33\x44")
+    plans[0].add(0x800030FE, b"\x55" * 4)
+    plans[1].add(0x80004000, b"\x66")
+    for plan in plans:
+        plan.apply(dol)
+    datablob = b"\x12" * 0x40
+    new_section = TextSection(0x80005000, datablob)
+    dol.append_section(new_section)
+    records = dol_patch_records(dol, plans, new_section, datablob)
+    save_dol_patch(patch_path, dol_path, dol.size, records)
+    apply_dol_patch(patch_path, dol_path, out_path)
+    with open(out_path, "rb") as f:
+        assert f.read() == saved(dol)
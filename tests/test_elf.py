@@ -0,0 +1,79 @@
+import struct
+
+import pytest
+
+from dol_c_kit.elf import ElfFile, PyElfFile, open_elf, SHF_ALLOC, SHN_ABS, SHN_UNDEF
+
+def make_elf(filepath, endian=">"):
+    text = bytes(range(16))
+    strtab = b"\0local\0global_func\0abs_sym\0undef_sym\0"
+    symtab = bytes(16)
+    for name, value, size, bind, shndx in (("local", 0x80400000, 4, 0, 1),
+                                           ("global_func", 0x80400004, 8, 1, 1),
+                                           ("abs_sym", 0x1234, 0, 1, SHN_ABS),
+                                           ("undef_sym", 0, 0, 1, SHN_UNDEF)):
+        symtab += struct.pack(endian + "IIIBBH", strtab.index(name.encode()), value, size, bind << 4 | 2, 0, shndx)
+    shstrtab = b"\0.text\0.bss\0.symtab\0.strtab\0.shstrtab\0"
+    text_offset = 52
+    symtab_offset = text_offset + len(text)
+    strtab_offset = symtab_offset + len(symtab)
+    shstrtab_offset = strtab_offset + len(strtab)
+    shoff = (shstrtab_offset + len(shstrtab) + 3) & ~3
+    headers = [
+        (0, 0, 0, 0, 0, 0, 0, 0, 0, 0),
+        (shstrtab.index(b".text"), 1, 6, 0x80400000, text_offset, len(text), 0, 0, 4, 0),
+        (shstrtab.index(b".bss"), 8, 3, 0x80400010, shoff, 0x20, 0, 0, 4, 0),
+        (shstrtab.index(b".symtab"), 2, 0, 0, symtab_offset, len(symtab), 4, 2, 4, 16),
+        (shstrtab.index(b".strtab"), 3, 0, 0, strtab_offset, len(strtab), 0, 0, 1, 0),
+        (shstrtab.index(b".shstrtab"), 3, 0, 0, shstrtab_offset, len(shstrtab), 0, 0, 1, 0),
+    ]
+    with open(filepath, "wb") as f:
+        f.write(b"\x7fELF\x01" + (b"\x02" if endian == ">" else b"\x01") + b"\x01" + bytes(9))
+        f.write(struct.pack(endian + "HHIIIIIHHHHHH", 2, 20, 1, 0x80400000, 0, shoff, 0, 52, 0, 0, 40, len(headers), len(headers) - 1))
+        f.write(text + symtab + strtab + shstrtab)
+        f.write(bytes(shoff - f.tell()))
+        for header in headers:
+            f.write(struct.pack(endian + "IIIIIIIIII", *header))
+
+@pytest.fixture
+def elf_path(tmp_path):
+    path = str(tmp_path / "project.o")
+    make_elf(path)
+    return path
+
+def test_sections(elf_path):
+    with ElfFile(elf_path) as elf:
+        assert [section.name for section in elf.sections] == ["", ".text", ".bss", ".symtab", ".strtab", ".shstrtab"]
+        text = elf.get_section_by_name(".text")
+        assert text.flags & SHF_ALLOC
+        assert text.addr == 0x80400000
+        assert bytes(elf.section_data(text)) == bytes(range(16))
+        assert bytes(elf.section_data(elf.get_section_by_name(".bss"))) == bytes(0x20)
+        assert elf.get_section_by_name(".data") is None
+
+def test_symbol_filters(elf_path):
+    with ElfFile(elf_path) as elf:
+        assert [symbol.name for symbol in elf.symbols()] == ["global_func", "abs_sym", "undef_sym"]
+        assert [symbol.name for symbol in elf.symbols(skip_local=False, skip_abs=True, skip_undef=True)] == ["local", "global_func"]
+        symbol = elf.symbols()[0]
+        assert (symbol.value, symbol.size, symbol.shndx) == (0x80400004, 8, 1)
+
+def test_matches_pyelftools(elf_path):
+    with ElfFile(elf_path) as elf, PyElfFile(elf_path) as pyelf:
+        assert elf.sections == pyelf.sections
+        for section in elf.sections:
+            assert bytes(elf.section_data(section)) == bytes(pyelf.section_data(section))
+        assert elf.symbols(skip_local=False) == pyelf.symbols(skip_local=False)
+        assert [symbol.entry() for symbol in elf.symbols(skip_local=False)] \
+            == [symbol.entry() for symbol in pyelf.symbols(skip_local=False)]
+
+def test_falls_back_to_pyelftools(tmp_path):
+    path = str(tmp_path / "little.o")
+    make_elf(path, "<")
+    with pytest.raises(ValueError):
+        ElfFile(path)
+    with open_elf(path) as elf:
+        assert isinstance(elf, PyElfFile)
+        assert [symbol.name for symbol in elf.symbols()] == ["global_func", "abs_sym", "undef_sym"]
+    with open_elf(str(tmp_path / "little.o"), use_pyelftools=True) as elf:
+        assert isinstance(elf, PyElfFile)
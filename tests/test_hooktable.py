@@ -0,0 +1,124 @@
+import io
+
+import pytest
+
+from dol_c_kit import hooktable
+from dol_c_kit.devkit_tools import BranchHook, PointerHook, Immediate16Hook, Immediate12Hook
+from dol_c_kit.hooktable import HookTable
+from dol_c_kit.patch import PatchPlan, PatchRecorder
+from dol_c_kit.symbols import SymbolTable
+
+def make_symbols():
+    symbols = SymbolTable()
+    symbols.add("func", 0x80401234, 0x20, 1)
+    symbols.add("gdata", 0x8040FFF0, 4, 2)
+    symbols.add("sdata", 0x80408010, 4, 2)
+    symbols.add("sdata2", 0x80410008, 4, 2)
+    symbols.add("zero", 0)
+    symbols.add("_SDA_BASE_", 0x80408000)
+    symbols.add("_SDA2_BASE_", 0x80410000)
+    return symbols
+
+# Each hook as the old hook class and as the arguments of the matching HookTable method
+Hooks = [
+    (BranchHook(0x80003000, "func", False), "add_branch", (0x80003000, "func", False)),
+    (BranchHook(0x80003004, "func", True), "add_branch", (0x80003004, "func", True)),
+    (PointerHook(0x80003008, "gdata"), "add_pointer", (0x80003008, "gdata")),
+    (PointerHook(0x8000300C, "missing"), "add_pointer", (0x8000300C, "missing")),
+    (PointerHook(0x80003010, "zero"), "add_pointer", (0x80003010, "zero")),
+    (BranchHook(0x80003014, "zero", False), "add_branch", (0x80003014, "zero", False)),
+] + [
+    (Immediate16Hook(0x80003020 + 2 * i, "gdata", modifier), "add_immediate16", (0x80003020 + 2 * i, "gdata", modifier))
+    for i, modifier in enumerate(("@h", "@l", "@ha"))
+] + [
+    (Immediate16Hook(0x80003030, "sdata", "@sda"), "add_immediate16", (0x80003030, "sdata", "@sda")),
+    (Immediate16Hook(0x80003032, "sdata2", "@sda2"), "add_immediate16", (0x80003032, "sdata2", "@sda2")),
+    (Immediate12Hook(0x80003034, 1, 0, "sdata", "@sda"), "add_immediate12", (0x80003034, 1, 0, "sdata", "@sda")),
+    (Immediate12Hook(0x80003036, 7, 1, "gdata", "@l"), "add_immediate12", (0x80003036, 7, 1, "gdata", "@l")),
+]
+
+def make_table():
+    table = HookTable()
+    for hook, method, args in Hooks:
+        getattr(table, method)(*args)
+    return table
+
+def written(plan):
+    return [(address, data) for address, data, origin in plan.patches]
+
+@pytest.mark.parametrize("use_numpy", [True, False])
+def test_encodings_match_hook_classes(monkeypatch, use_numpy):
+    if not use_numpy:
+        monkeypatch.setattr(hooktable, "numpy", None)
+    symbols = make_symbols()
+    expected = PatchPlan()
+    recorder = PatchRecorder(None, expected)
+    for hook, method, args in Hooks:
+        hook.resolve(symbols)
+        hook.apply_dol(recorder)
+    table = make_table()
+    plan = PatchPlan()
+    table.resolve(symbols)
+    table.apply(PatchRecorder(None, plan))
+    assert written(plan) == written(expected)
+    assert list(table.good) == [int(hook.good) for hook, method, args in Hooks]
+
+def test_apply_row_ranges(dol):
+    table = make_table()
+    table.resolve(make_symbols())
+    plan = PatchPlan()
+    recorder = PatchRecorder(dol, plan)
+    table.apply(recorder, 0, 3)
+    table.apply(recorder, 3)
+    whole = PatchPlan()
+    table.apply(PatchRecorder(dol, whole))
+    assert written(plan) == written(whole)
+    assert plan.patches[0][2] == "BranchHook 80003000 func"
+
+def test_unmapped_hooks_are_skipped(dol):
+    table = HookTable()
+    table.add_pointer(0x80003000, "gdata")
+    table.add_pointer(0x80005000, "gdata")
+    table.resolve(make_symbols())
+    plan = PatchPlan()
+    table.apply(PatchRecorder(dol, plan))
+    assert written(plan) == [(0x80003000, b"\x80\x40\xFF\xF0")]
+    assert list(table.good) == [1, 0]
+
+def test_gecko_commands():
+    symbols = make_symbols()
+    expected = io.StringIO()
+    for hook, method, args in Hooks:
+        hook.resolve(symbols)
+        if not isinstance(hook, Immediate12Hook):
+            hook.write_geckocommand(expected)
+    table = HookTable()
+    for hook, method, args in Hooks:
+        if method != "add_immediate12":
+            getattr(table, method)(*args)
+    f = io.StringIO()
+    table.resolve(symbols)
+    table.write_geckocommands(f, symbols)
+    assert f.getvalue() == expected.getvalue()
+
+def test_out_of_range_branch():
+    table = HookTable()
+    table.add_branch(0x80003000, "far")
+    symbols = SymbolTable()
+    symbols.add("far", 0x82003000, 4, 1)
+    with pytest.raises(RuntimeError, match="80003000"):
+        table.resolve(symbols)
+
+def test_extend_and_validate():
+    table = HookTable()
+    table.add_pointer(0x80003000, "gdata")
+    other = HookTable()
+    other.add_branch(0x80003002, "func")
+    other.add_pointer(0x80003008, "gdata")
+    table.extend(other)
+    assert len(table) == 3
+    assert table.symbol_names == ["gdata", "func"]
+    assert [table.origin(row) for row in range(3)] == \
+        ["PointerHook 80003000 gdata", "BranchHook 80003002 func", "PointerHook 80003008 gdata"]
+    assert table.validate() == [(1, "BranchHook address 80003002 is not 4-byte aligned")]
+    assert table.undefined_symbols({"gdata": None}) == ["func"]
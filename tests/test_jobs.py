@@ -0,0 +1,51 @@
+import time
+
+import pytest
+
+from stub_toolchain import read_log
+
+from conftest import write_source
+
+def compiles(toolchain, event="start"):
+    # The sources of every compile in the log with the given event, in the order they happened
+    return [entry["args"][1] for entry in read_log(toolchain) if entry["tool"] == "powerpc-eabi-gcc" and entry["event"] == event]
+
+@pytest.fixture(params=[False, True], ids=["wait", "wait4"])
+def traced_project(request, project):
+    # Tracing reaps compiles with os.wait4 instead of Popen.wait
+    if request.param:
+        project.enable_trace()
+    return project
+
+def test_jobs_run_in_parallel(traced_project, toolchain, dol_path):
+    project = traced_project
+    # The first source finishes last, but objects are still linked in source order
+    for name, text in (("a.c", "SLEEP 0.6\n"), ("b.c", "SLEEP 0.3\n"), ("c.c", "SLEEP 0.3\n"), ("d.c", "\n")):
+        write_source("src/" + name, text)
+        project.add_c_file(name)
+    project.build_dol(dol_path, "out.dol")
+    events = sorted(read_log(toolchain), key=lambda entry: entry["time"])
+    running = 0
+    most_running = 0
+    for entry in events:
+        if entry["tool"] == "powerpc-eabi-gcc":
+            running += 1 if entry["event"] == "start" else -1
+            most_running = max(most_running, running)
+    assert most_running == 2
+    assert [filename for filename, do_cleanup in project.obj_files] == ["a.c.o", "b.c.o", "c.c.o", "d.c.o"]
+    link = [entry for entry in events if entry["tool"] == "powerpc-eabi-ld"][0]
+    assert [arg for arg in link["args"] if arg.endswith(".c.o")] == ["obj/a.c.o", "obj/b.c.o", "obj/c.c.o", "obj/d.c.o"]
+
+def test_first_failure_stops_the_build(traced_project, toolchain, dol_path):
+    project = traced_project
+    for name, text in (("fail.c", "SLEEP 0.5\nFAIL\n"), ("slow.c", "SLEEP 30\n"), ("q1.c", "\n"), ("q2.c", "\n"), ("q3.c", "\n")):
+        write_source("src/" + name, text)
+        project.add_c_file(name)
+    start = time.time()
+    with pytest.raises(RuntimeError, match="powerpc-eabi-gcc exited with code 3"):
+        project.build_dol(dol_path, "out.dol")
+    # The running compile is terminated, and the queued ones never start
+    assert time.time() - start < 10
+    assert sorted(compiles(toolchain)) == ["src/fail.c", "src/slow.c"]
+    assert compiles(toolchain, "end") == ["src/fail.c"]
+    assert not [entry for entry in read_log(toolchain) if entry["tool"] == "powerpc-eabi-ld"]
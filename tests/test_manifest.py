@@ -0,0 +1,92 @@
+import json
+
+import pytest
+
+from dol_c_kit.hooktable import HookTable, read_hook_manifest, save_hook_manifest, load_hook_manifest, pack_hook_manifest, unpack_hook_manifest
+
+Rows = [
+    ("branchlink", "80003300", "func_3", "", "", ""),
+    ("pointer", "0x80003304", "gdata", "", "", ""),
+    ("immediate16", "8000330A", "gdata", "@ha", "", ""),
+    ("immediate12", "8000330E", "gdata", "@l", "1", "0"),
+]
+
+def write_csv(path, lines):
+    with open(path, "w") as f:
+        f.write("kind,addr,symbol,modifier,w,i\n")
+        f.write("".join(line + "\n" for line in lines))
+    return path
+
+def columns(table):
+    return (list(table.addrs), [table.symbol_names[symbol_id] for symbol_id in table.symbol_ids],
+            list(table.kinds), list(table.lk_bits), list(table.modifiers), list(table.extras))
+
+@pytest.fixture
+def expected():
+    table = HookTable()
+    table.add_branch(0x80003300, "func_3", True)
+    table.add_pointer(0x80003304, "gdata")
+    table.add_immediate16(0x8000330A, "gdata", "@ha")
+    table.add_immediate12(0x8000330E, 1, 0, "gdata", "@l")
+    return table
+
+def test_csv(tmp_path, expected):
+    path = write_csv(str(tmp_path / "hooks.csv"), [",".join(row) for row in Rows])
+    assert columns(read_hook_manifest(path)) == columns(expected)
+
+def test_json(tmp_path, expected):
+    path = str(tmp_path / "hooks.json")
+    records = [dict(zip(("kind", "addr", "symbol", "modifier", "w", "i"), row)) for row in Rows]
+    # Integers are taken as they are
+    records[1]["addr"] = 0x80003304
+    records[3]["w"] = 1
+    with open(path, "w") as f:
+        json.dump(records, f)
+    assert columns(read_hook_manifest(path)) == columns(expected)
+
+def test_json_must_be_a_list(tmp_path):
+    path = str(tmp_path / "hooks.json")
+    with open(path, "w") as f:
+        json.dump({"kind": "pointer"}, f)
+    with pytest.raises(RuntimeError, match="list of hooks"):
+        read_hook_manifest(path)
+
+def test_every_problem_is_reported(tmp_path):
+    path = write_csv(str(tmp_path / "bad.csv"), [
+        "branchlink,80003302,func_3",
+        "jump,80003304,gdata",
+        "immediate16,8000330A,gdata,@hx",
+        "immediate12,8000330A,gdata,@l,9,0",
+        "pointer,zz,gdata",
+        "immediate16,8000330C",
+    ])
+    with pytest.raises(RuntimeError) as e:
+        read_hook_manifest(path)
+    message = str(e.value)
+    for line in range(2, 8):
+        assert "line {}:".format(line) in message
+    assert "unknown kind \"jump\"" in message
+    assert "not 4-byte aligned" in message
+
+def test_binary_round_trip(tmp_path, expected):
+    path = str(tmp_path / "hooks.bin")
+    save_hook_manifest(path, expected)
+    assert columns(read_hook_manifest(path)) == columns(expected)
+    assert list(tmp_path.iterdir()) == [tmp_path / "hooks.bin"]
+
+def test_binary_is_keyed_by_hash(tmp_path, expected):
+    path = str(tmp_path / "hooks.hookcache")
+    save_hook_manifest(path, expected, "ab" * 20)
+    assert columns(load_hook_manifest(path, "ab" * 20)) == columns(expected)
+    assert load_hook_manifest(path, "cd" * 20) is None
+    assert load_hook_manifest(str(tmp_path / "missing.hookcache"), "ab" * 20) is None
+
+def test_corrupt_binary(tmp_path, expected):
+    data = pack_hook_manifest(expected)
+    assert unpack_hook_manifest(data[:-1]) is None
+    assert unpack_hook_manifest(data[:10]) is None
+    path = str(tmp_path / "hooks.bin")
+    with open(path, "wb") as f:
+        f.write(data[:-1])
+    with pytest.raises(RuntimeError, match="corrupt"):
+        read_hook_manifest(path)
@@ -0,0 +1,145 @@
+import io
+
+import pytest
+
+from dolreader.dol import UnmappedAddressError
+
+from dol_c_kit.patch import PatchPlan, PatchRecorder, SectionIndex
+
+def test_runs_merge_overlapping_and_adjacent_records():
+    plan = PatchPlan()
+    plan.add(0x80003008, b"\x11\x11\x11\x11")
+    plan.add(0x80003000, b"\x22\x22\x22\x22")
+    plan.add(0x80003004, b"\x33\x33\x33\x33")
+    plan.add(0x80003006, b"\x44\x44")
+    plan.add(0x80003020, b"\x55")
+    assert plan.runs() == [
+        (0x80003000, bytearray(b"\x22\x22\x22\x22\x33\x33\x44\x44\x11\x11\x11\x11")),
+        (0x80003020, bytearray(b"\x55")),
+    ]
+
+def test_later_records_win():
+    plan = PatchPlan()
+    plan.add(0x80003004, b"\xAA\xAA")
+    plan.add(0x80003000, b"\xBB" * 8)
+    assert plan.runs() == [(0x80003000, bytearray(b"\xBB" * 8))]
+
+def test_apply_splits_runs_at_section_boundaries(dol):
+    plan = PatchPlan()
+    plan.add(0x800030FE, b"\x01\x02\x03\x04")
+    assert plan.apply(dol) == 2
+    assert dol.textSections[0].data.getvalue()[-2:] == b"\x01\x02"
+    assert dol.textSections[1].data.getvalue()[:2] == b"\x03\x04"
+
+def test_apply_rejects_unmapped_addresses(dol):
+    plan = PatchPlan()
+    plan.add(0x80003200, b"\x00\x00\x00\x00")
+    with pytest.raises(UnmappedAddressError):
+        plan.apply(dol)
+
+def test_section_writes(dol):
+    plan = PatchPlan()
+    plan.add(0x800030FE, b"\x01\x02\x03\x04")
+    plan.add(0x80004010, b"\x05")
+    writes = [(section.address, offset, bytes(data)) for section, offset, data in plan.section_writes(dol)]
+    assert writes == [(0x80003000, 0xFE, b"\x01\x02"), (0x80003100, 0, b"\x03\x04"), (0x80004000, 0x10, b"\x05")]
+
+def test_section_index(dol):
+    index = SectionIndex(dol.sections)
+    assert index.sections[index.find(0x80003000)].address == 0x80003000
+    assert index.sections[index.find(0x800031FF)].address == 0x80003100
+    assert index.find(0x80003200) is None
+    assert index.find(0x80002FFF) is None
+
+def test_recorder_checks_section_bounds(dol):
+    plan = PatchPlan()
+    recorder = PatchRecorder(dol, plan)
+    recorder.origin = "hook"
+    recorder.write_uint32(0x80003010, 0x60000000)
+    recorder.seek(0x800030FE)
+    with pytest.raises(UnmappedAddressError):
+        recorder.write(b"\x00\x00\x00\x00")
+    with pytest.raises(UnmappedAddressError):
+        recorder.seek(0x80003200)
+    assert plan.patches == [(0x80003010, b"\x60\x00\x00\x00", "hook")]
+
+def test_diff():
+    ours = PatchPlan()
+    ours.add(0x80003000, b"\x01\x02\x03\x04")
+    ours.add(0x80003010, b"\x05")
+    theirs = PatchPlan()
+    theirs.add(0x80003000, b"\x01\x09\x09\x04")
+    theirs.add(0x80003020, b"\x06")
+    assert ours.diff(theirs) == [
+        (0x80003001, 2, b"\x02\x03", b"\x09\x09"),
+        (0x80003010, 1, b"\x05", None),
+        (0x80003020, 1, None, b"\x06"),
+    ]
+    assert ours.diff(ours) == []
+
+def test_diff_skips_identical_runs():
+    ours = PatchPlan()
+    ours.add(0x80003000, b"\x01\x02")
+    ours.add(0x80003004, b"\x03\x04")
+    ours.add(0x80003008, b"\x05")
+    theirs = PatchPlan()
+    theirs.add(0x80003000, b"\x01\x02")
+    theirs.add(0x80003004, b"\x03\x04\x07\x07")
+    theirs.add(0x80003009, b"\x05")
+    assert ours.diff(theirs) == [
+        (0x80003006, 2, None, b"\x07\x07"),
+        (0x80003008, 1, b"\x05", None),
+        (0x80003009, 1, None, b"\x05"),
+    ]
+    # The cached runs are rebuilt once records are added
+    assert ours.runs() is ours.runs()
+    ours.add(0x80003009, b"\x05")
+    ours.add(0x80003006, b"\x07\x07")
+    assert ours.diff(theirs) == [(0x80003008, 1, b"\x05", None)]
+
+def test_dump():
+    plan = PatchPlan()
+    plan.add(0x80003004, b"\xAB", "b")
+    plan.add(0x80003000, b"\x01\x02", "a")
+    f = io.StringIO()
+    plan.dump(f)
+    assert f.getvalue() == "80003000 000002 0102 a\n80003004 000001 AB b\n"
+
+def test_overlaps_between_two_origins():
+    plan = PatchPlan()
+    plan.add(0x80003000, bytes(8), "a")
+    plan.add(0x80003004, bytes(8), "b")
+    plan.add(0x80003020, bytes(4), "a")
+    plan.add(0x80003020, bytes(4), "a")
+    assert plan.overlaps() == [(0x80003004, 4, "a", "b")]
+
+def test_overlaps_inside_a_longer_record():
+    # Two pointer hooks on the same word, both inside a file hook
+    plan = PatchPlan()
+    plan.add(0x80003000, bytes(0x100), "FileHook")
+    plan.add(0x80003010, bytes(4), "a")
+    plan.add(0x80003010, bytes(4), "b")
+    assert sorted(plan.overlaps()) == [
+        (0x80003010, 4, "FileHook", "a"),
+        (0x80003010, 4, "FileHook", "b"),
+        (0x80003010, 4, "a", "b"),
+    ]
+
+def test_overlaps_chained():
+    # A=[0,8), B=[4,12), C=[6,8): C overlaps both A and B
+    plan = PatchPlan()
+    plan.add(0x80003000, bytes(8), "A")
+    plan.add(0x80003004, bytes(8), "B")
+    plan.add(0x80003006, bytes(2), "C")
+    assert sorted(plan.overlaps()) == [
+        (0x80003004, 4, "A", "B"),
+        (0x80003006, 2, "A", "C"),
+        (0x80003006, 2, "B", "C"),
+    ]
+
+def test_neighbouring_overlaps_are_merged():
+    plan = PatchPlan()
+    plan.add(0x80003000, bytes(4), "a")
+    plan.add(0x80003004, bytes(4), "a")
+    plan.add(0x80003000, bytes(8), "b")
+    assert plan.overlaps() == [(0x80003000, 8, "a", "b")]
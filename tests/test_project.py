@@ -0,0 +1,122 @@
+import os
+
+import pytest
+
+from dolreader.dol import DolFile
+
+from dol_c_kit.devkit_tools import Project, gecko_text_to_gct
+
+from conftest import write_source
+
+def read_dol(path, address, size):
+    with open(path, "rb") as f:
+        dol = DolFile(f)
+    dol.seek(address)
+    return dol.read(size)
+
+def test_hooks_apply_in_declaration_order(project, dol_path):
+    write_source("src/main.c", "main\n")
+    write_source("file.bin", "FILE")
+    project.add_c_file("main.c")
+    # Each pair writes over the same four bytes, so the one declared last wins
+    project.hook_branch(0x80003010, "main")
+    project.hook_string(0x80003010, "abc")
+    project.hook_string(0x80003020, "def")
+    project.hook_branchlink(0x80003020, "main")
+    project.hook_file(0x80003030, "file.bin")
+    project.hook_pointer(0x80003030, "main")
+    project.hook_pointer(0x80003040, "main")
+    project.hook_file(0x80003040, "file.bin")
+    project.build_dol(dol_path, "out.dol")
+    assert read_dol("out.dol", 0x80003010, 4) == b"abc\0"
+    assert read_dol("out.dol", 0x80003020, 4) == b"\x48\x00\x1F\xE1"
+    assert read_dol("out.dol", 0x80003030, 4) == b"\x80\x00\x50\x00"
+    assert read_dol("out.dol", 0x80003040, 4) == b"FILE"
+
+def test_failed_link_is_not_reused(project, dol_path):
+    write_source("src/main.c", "NOLINK\n")
+    project.add_c_file("main.c")
+    with pytest.raises(RuntimeError, match="powerpc-eabi-ld exited with code 1"):
+        project.build_dol(dol_path, "out.dol")
+    assert not os.path.exists("obj/project.link")
+    write_source("src/main.c", "main\n")
+    project.build_dol(dol_path, "out.dol")
+    assert os.path.exists("obj/project.link")
+    assert "main" in project.symbols
+
+MapHeader = ("\n"
+             "{} section layout\n"
+             "  Starting        Virtual\n"
+             "  address  Size   address\n"
+             "  -----------------------\n")
+
+def unbuilt_map():
+    project = Project(base_addr=0x80005000)
+    project.obj_dir = "obj/"
+    project.save_map("unbuilt.map")
+    with open("unbuilt.map", "rb") as f:
+        return f.read()
+
+def test_map_format(project, dol_path):
+    write_source("src/main.c", "main\n")
+    write_source("src/util.c", "util!!\n")
+    project.add_c_file("main.c")
+    project.add_c_file("util.c")
+    project.build_dol(dol_path, "out.dol")
+    expected = (MapHeader.format(".text") +
+                "  00000000 000005 80005000  0 main\n"
+                "  00000008 000007 80005008  0 util\n" +
+                MapHeader.format(".data") +
+                "  00000010 000004 80005010  0 gdata\n" +
+                MapHeader.format(".bss") +
+                "  00000014 000004 80005014  0 gbss\n" +
+                MapHeader.format(".dummy") +
+                "  00000000 000000 81200000  0 Workaround for Dolphin's bad symbol map loader\n")
+    project.save_map("out.map")
+    with open("out.map", "rb") as f:
+        assert f.read() == expected.encode()
+    # A Project that hasn't built anything reads the link results from the link cache, or from
+    # project.o without one
+    assert unbuilt_map() == expected.encode()
+    os.remove("obj/project.linkcache")
+    assert unbuilt_map() == expected.encode()
+
+def configured(devkitppc_path):
+    # A new Project for each build, as the ones that are compared must not share any state
+    project = Project(base_addr=0x80005000, jobs=2)
+    project.devkitppc_path = devkitppc_path
+    project.src_dir = "src/"
+    project.obj_dir = "obj/"
+    project.add_c_file("main.c")
+    project.add_gecko_txt_file("codes.txt")
+    project.hook_branchlink(0x80003010, "main")
+    project.hook_pointer(0x80003014, "gdata")
+    project.hook_string(0x80003020, "abc")
+    return project
+
+def test_outputs_match_single_builds(project, dol_path):
+    write_source("src/main.c", "main\n")
+    write_source("codes.txt", "[Gecko]\n"
+                              "$Write\n"
+                              "04003100 12345678\n"
+                              "$Insert\n"
+                              "C2003104 00000001\n"
+                              "38600001 00000000\n"
+                              "[Gecko_Enabled]\n"
+                              "$Write\n"
+                              "$Insert\n")
+    configured(project.devkitppc_path).build_outputs(
+        [("dol", "all.dol"), ("gecko", "all.txt"), ("gct", "all.gct"), ("map", "all.map"), ("dol", "copy.dol")], dol_path)
+    single = configured(project.devkitppc_path)
+    single.build_dol(dol_path, "single.dol")
+    single.save_map("single.map")
+    configured(project.devkitppc_path).build_gecko("single.txt")
+    for all_path, single_path in (("all.dol", "single.dol"), ("copy.dol", "single.dol"), ("all.map", "single.map"), ("all.txt", "single.txt")):
+        with open(all_path, "rb") as f, open(single_path, "rb") as expected:
+            assert f.read() == expected.read()
+    with open("all.gct", "rb") as f, open("single.txt", "r") as expected:
+        assert f.read() == gecko_text_to_gct(expected.read())
+    # The Gecko Codes made it into every output
+    with open("all.map") as f:
+        assert "Insert$0" in f.read()
+    assert read_dol("all.dol", 0x80003100, 4) == b"\x12\x34\x56\x78"
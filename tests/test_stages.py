@@ -0,0 +1,41 @@
+import threading
+
+import pytest
+
+from dol_c_kit.stages import StageGraph
+
+def test_stages_get_their_dependencies_results():
+    stages = StageGraph()
+    stages.add("a", lambda: 2)
+    stages.add("b", lambda: 3)
+    stages.add("sum", lambda a, b: a + b, "a", "b")
+    stages.add("double", lambda total: total * 2, "sum")
+    stages.run()
+    assert stages.result("double") == 10
+
+def test_independent_stages_run_concurrently():
+    # Each stage waits for the other, so this only finishes if both run at once.
+    barrier = threading.Barrier(2, timeout=5)
+    stages = StageGraph()
+    stages.add("a", barrier.wait)
+    stages.add("b", barrier.wait)
+    stages.run()
+
+def test_failed_stage_skips_its_dependents():
+    calls = []
+    
+    def fail():
+        raise RuntimeError("compile failed")
+    
+    stages = StageGraph()
+    stages.add("compile", fail)
+    stages.add("dol", lambda: calls.append("dol"))
+    stages.add("link", lambda objects: calls.append("link"), "compile")
+    with pytest.raises(RuntimeError, match="compile failed"):
+        stages.run()
+    assert calls == ["dol"]
+
+def test_unknown_dependency():
+    stages = StageGraph()
+    with pytest.raises(RuntimeError):
+        stages.add("link", lambda objects: None, "compile")
@@ -0,0 +1,87 @@
+from dol_c_kit.elf import ElfSection, SHN_UNDEF
+from dol_c_kit.symbols import SymbolTable, save_link_cache, load_link_cache
+
+def make_table():
+    table = SymbolTable()
+    table.add("main", 0x80400000, 0x20, 1)
+    table.add("alias_of_main", 0x80400000, 0x20, 1)
+    table.add("helper", 0x80400040, 0x10, 1)
+    table.add("gdata", 0x80401000, 4, 2)
+    table.add("abs_sym", 0x1234)
+    table.add("extern_sym", 0, 0, SHN_UNDEF)
+    table.add("_SDA_BASE_", None)
+    return table
+
+def test_lookup_by_name():
+    table = make_table()
+    assert len(table) == 7
+    assert "main" in table and "missing" not in table
+    assert table["gdata"] == {"st_value": 0x80401000, "st_size": 4, "st_shndx": 2}
+    assert table["abs_sym"]["st_shndx"] == "SHN_ABS"
+    assert table["_SDA_BASE_"]["st_value"] is None
+    assert table.value("helper") == 0x80400040
+    assert table.value("_SDA_BASE_") is None
+    assert table.get("missing", "default") == "default"
+
+def test_add_replaces():
+    table = make_table()
+    table.add("_SDA_BASE_", 0x80408000)
+    table.add("helper", 0x80400080, 8, 1)
+    assert len(table) == 7
+    assert table.value("_SDA_BASE_") == 0x80408000
+    assert table["helper"] == {"st_value": 0x80400080, "st_size": 8, "st_shndx": 1}
+
+def test_lookup_by_address():
+    table = make_table()
+    # The first of several symbols at the same address wins
+    assert table.lookup(0x80400000) == "main"
+    assert table.lookup(0x80400050) == "helper"
+    assert table.lookup(0x80400FFF) == "helper"
+    assert table.lookup(0x80000000) is None
+    # Absolute and undefined symbols are never found by address
+    assert table.lookup(0x1234) is None
+
+def test_by_address_is_invalidated_by_add():
+    table = make_table()
+    assert [name for name, value, size, section in table.by_address()] == ["main", "alias_of_main", "helper", "gdata"]
+    table.add("early", 0x80300000, 4, 1)
+    assert next(table.by_address())[0] == "early"
+
+def test_copy():
+    table = make_table()
+    assert list(table.copy()) == list(table)
+    defined = table.copy(defined_only=True)
+    assert "_SDA_BASE_" not in defined
+    assert defined["abs_sym"] == table["abs_sym"]
+    assert defined.value("main") == table.value("main")
+
+def test_link_cache_round_trip(tmp_path):
+    path = str(tmp_path / "project.linkcache")
+    sections = [ElfSection(0, "", 0, 0, 0, 0, 0, 0, 0, 0), ElfSection(1, ".text", 1, 6, 0x80400000, 0x34, 0x40, 0, 0, 0)]
+    table = make_table()
+    save_link_cache(path, "ab" * 20, sections, table)
+    loaded_sections, loaded = load_link_cache(path, "ab" * 20)
+    assert loaded_sections == sections
+    # Symbols without a value are not stored
+    assert list(loaded) == [name for name in table if name != "_SDA_BASE_"]
+    for name in loaded:
+        assert loaded[name] == table[name]
+    assert loaded.lookup(0x80400050) == "helper"
+
+def test_link_cache_is_keyed_by_hash(tmp_path):
+    path = str(tmp_path / "project.linkcache")
+    save_link_cache(path, "ab" * 20, [], SymbolTable())
+    assert load_link_cache(path, "ab" * 20)[1].names == []
+    assert load_link_cache(path, "cd" * 20) is None
+    assert load_link_cache(str(tmp_path / "missing.linkcache"), "ab" * 20) is None
+
+def test_corrupt_link_cache(tmp_path):
+    path = str(tmp_path / "project.linkcache")
+    sections = [ElfSection(0, "", 0, 0, 0, 0, 0, 0, 0, 0), ElfSection(1, ".text", 1, 6, 0x80400000, 0x34, 0x40, 0, 0, 0)]
+    save_link_cache(path, "ab" * 20, sections, make_table())
+    with open(path, "rb") as f:
+        data = f.read()
+    for corrupt in (data[:-1], data[:60], data + b"\0", data[:-3] + b"\xFF\xFE\xFD"):
+        with open(path, "wb") as f:
+            f.write(corrupt)
+        assert load_link_cache(path, "ab" * 20) is None
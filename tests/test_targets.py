@@ -0,0 +1,58 @@
+import os
+import pickle
+
+from dolreader.dol import DolFile
+
+from dol_c_kit.buildcache import ObjectCache
+
+from stub_toolchain import read_log
+
+from conftest import write_source
+
+def read_dol(path, address, size):
+    with open(path, "rb") as f:
+        dol = DolFile(f)
+    dol.seek(address)
+    return dol.read(size)
+
+def test_project_pickles_without_wine_or_object_cache(project):
+    project.set_wine_server()
+    project.object_cache = ObjectCache("obj/.objcache/", 1 << 20)
+    project.add_c_file("main.c")
+    project.hook_branch(0x80003010, "main")
+    project.hook_string(0x80003020, "abc")
+    copy = pickle.loads(pickle.dumps(project))
+    assert copy.wine_server is None and copy.object_cache is None
+    assert project.wine_server is not None and project.object_cache is not None
+    assert copy.c_files == project.c_files
+    assert copy.devkitppc_path == project.devkitppc_path
+    assert len(copy.hook_table) == 1 and [hook.string for hook in copy.hooks] == ["abc"]
+
+def test_targets_get_their_own_objects_and_outputs(project, toolchain, dol_path):
+    write_source("src/main.c", "main\n")
+    write_source("hooks.csv", "kind,addr,symbol,modifier,w,i\npointer,80003030,main,,,\n")
+    project.add_c_file("main.c")
+    project.hook_branch(0x80003010, "main")
+    reports = project.build_targets([
+        (dol_path, 0x80005000, [], "out0.dol"),
+        (dol_path, 0x80006000, [], "out1.dol", "hooks.csv"),
+    ])
+    # Compiled once, and linked once per target
+    log = read_log(toolchain)
+    assert [entry["args"][1] for entry in log if entry["tool"] == "powerpc-eabi-gcc" and entry["event"] == "end"] == ["src/main.c"]
+    links = [entry["args"] for entry in log if entry["tool"] == "powerpc-eabi-ld" and entry["event"] == "end"]
+    assert sorted(args[args.index("-o") + 1] for args in links) == ["obj/project_0.o", "obj/project_1.o"]
+    for name in ("project_0.o", "project_1.o", "project_0.link", "project_1.link"):
+        assert os.path.isfile("obj/" + name)
+
+    assert [(report["out_dol_path"], report["base_addr"], report["size"]) for report in reports] == \
+        [("out0.dol", 0x80005000, 28), ("out1.dol", 0x80006000, 28)]
+    assert read_dol("out0.dol", 0x80005000, 5) == b"main\n"
+    assert read_dol("out1.dol", 0x80006000, 5) == b"main\n"
+    assert read_dol("out0.dol", 0x80003010, 4) == b"\x48\x00\x1F\xF0"
+    assert read_dol("out1.dol", 0x80003010, 4) == b"\x48\x00\x2F\xF0"
+    # Only the second target loads the hook manifest
+    assert read_dol("out0.dol", 0x80003030, 4) == bytes(range(0x30, 0x34))
+    assert read_dol("out1.dol", 0x80003030, 4) == b"\x80\x00\x60\x00"
+    # The project itself is left as it was
+    assert project.project_name == "project" and project.base_addr == 0x80005000 and len(project.hook_table) == 1
@@ -0,0 +1,53 @@
+import os
+
+from stub_toolchain import read_log
+
+from conftest import write_source
+
+def compiled(toolchain):
+    return sorted(entry["args"][1] for entry in read_log(toolchain) if entry["tool"] == "powerpc-eabi-gcc" and entry["event"] == "end")
+
+def included(unit_path):
+    with open(unit_path) as f:
+        return [os.path.relpath(line.split("\"")[1]) for line in f]
+
+def test_units_group_by_flags(project, toolchain, dol_path):
+    project.unity_build = True
+    for name in ("a.c", "b.c", "c.c", "d.c", "e.c"):
+        write_source("src/" + name, name + "\n")
+    project.add_c_file("a.c")
+    project.add_c_file("b.c", ("-DB",))
+    project.add_c_file("c.c")
+    project.add_c_file("d.c", ("-DB",), False)
+    project.add_c_file("e.c", use_unity_build=False)
+    project.build_dol(dol_path, "out.dol")
+    # d.c has b.c's flags, but not the global ones
+    assert compiled(toolchain) == ["obj/project_unity_0.c", "obj/project_unity_1.c", "obj/project_unity_2.c", "src/e.c"]
+    assert included("obj/project_unity_0.c") == ["src/a.c", "src/c.c"]
+    assert included("obj/project_unity_1.c") == ["src/b.c"]
+    assert included("obj/project_unity_2.c") == ["src/d.c"]
+    assert [filename for filename, do_cleanup in project.obj_files] == \
+        ["e.c.o", "project_unity_0.c.o", "project_unity_1.c.o", "project_unity_2.c.o"]
+
+def test_units_split_by_size(project, toolchain, dol_path):
+    project.unity_build = True
+    project.unity_build_size = 8
+    for name in ("a.c", "b.c", "c.c"):
+        write_source("src/" + name, name + "\n")
+        project.add_c_file(name)
+    project.build_dol(dol_path, "out.dol")
+    assert [included("obj/project_unity_{}.c".format(i)) for i in range(2)] == [["src/a.c", "src/b.c"], ["src/c.c"]]
+
+def test_stale_units_are_removed(project, toolchain, dol_path):
+    project.unity_build = True
+    for name in ("a.c", "b.c"):
+        write_source("src/" + name, name + "\n")
+    project.add_c_file("a.c")
+    project.add_c_file("b.c", ("-DB",))
+    project.build_dol(dol_path, "out.dol")
+    assert os.path.isfile("obj/project_unity_1.c.o")
+    project.unity_build = False
+    project.build_dol(dol_path, "out.dol")
+    assert sorted(os.listdir("obj")) == ["a.c.o", "b.c.o", "project.link", "project.linkcache", "project.map", "project.o"]
+    assert [filename for filename, do_cleanup in project.obj_files] == ["a.c.o", "b.c.o"]
+    assert "project_unity_0" not in project.symbols